@@ -0,0 +1,287 @@
+"""Benchmark high-level operations against fake `php`.
+
+Run with `python3 -m benchmarks` from the repository root. See `--help` for
+options, and fake_php.py for the emulated `occ` commands.
+
+For every operation, the following is reported (per iteration):
+
+- commands: amount of `occ` commands (and updater calls) run.
+- processes: amount of PHP processes started.
+- wall time: total time spent in the operation.
+- overhead: time spent outside commands, i.e. in the library itself. For the
+  worker, this includes starting the worker process. It is negative for
+  operations that run commands in parallel.
+"""
+
+import argparse
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+if TYPE_CHECKING:  # pragma: no cover
+    from cyberfusion.NextCloudSupport.instance import Instance
+
+FAKE_PHP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_php.py")
+
+
+@dataclass
+class Result:
+    """Result of benchmarking operation."""
+
+    operation: str
+    variant: str
+    commands: float
+    processes: float
+    wall_time: float
+    overhead: float
+
+
+def _installed_apps_versions(instance: "Instance") -> Any:
+    """Get versions of installed apps."""
+    return [app.version for app in instance.installed_apps]
+
+
+def _get_app(instance: "Instance") -> Any:
+    """Get app, and its version and status."""
+    app = instance.get_app("app1")
+
+    return app.version, app.is_enabled, app.available_version
+
+
+def _users(instance: "Instance") -> Any:
+    """Get users."""
+    return instance.users
+
+
+def _update(instance: "Instance") -> Any:
+    """Update NextCloud."""
+    return instance.update()
+
+
+def _report(instance: "Instance") -> Any:
+    """Get version, apps and users, one property at a time."""
+    return (
+        instance.version,
+        instance.available_version,
+        [
+            (app.version, app.is_enabled, app.available_version)
+            for app in instance.installed_apps
+        ],
+        len(instance.users),
+    )
+
+
+def _inventory(instance: "Instance") -> Any:
+    """Get inventory."""
+    return instance.inventory()
+
+
+def _reconcile(instance: "Instance") -> Any:
+    """Reconcile instance that is in desired state."""
+    from cyberfusion.NextCloudSupport.reconcile import (
+        DesiredApp,
+        DesiredState,
+        reconcile,
+    )
+
+    return reconcile(
+        instance,
+        DesiredState(
+            apps=[DesiredApp(name=f"app{i}") for i in range(1, 5)]
+            + [DesiredApp(name="app5", enabled=False)],
+            system_config={"loglevel": 2, ("trusted_domains", 0): "localhost"},
+        ),
+    )
+
+
+BUNDLE = [f"app{i}" for i in range(1, 9)]
+
+
+def _enable_bundle_per_app(instance: "Instance") -> Any:
+    """Enable bundle of apps, one at a time."""
+    for name in BUNDLE:
+        instance.get_app(name).enable()
+
+
+def _enable_bundle(instance: "Instance") -> Any:
+    """Enable bundle of apps at once."""
+    instance.enable_apps(BUNDLE)
+
+
+def _update_apps(instance: "Instance") -> Any:
+    """Update all apps."""
+    return instance.update_apps()
+
+
+OPERATIONS: Dict[str, Callable[["Instance"], Any]] = {
+    "installed_apps+versions": _installed_apps_versions,
+    "get_app": _get_app,
+    "users": _users,
+    "update": _update,
+    "report": _report,
+    "inventory": _inventory,
+    "enable bundle per app": _enable_bundle_per_app,
+    "enable_apps(bundle)": _enable_bundle,
+    "update_apps": _update_apps,
+    "reconcile (converged)": _reconcile,
+}
+
+VARIANTS: Dict[str, Dict[str, Any]] = {
+    "subprocess": {},
+    "worker": {"use_worker": True},
+}
+
+
+def _install_fake_php(bin_directory: str) -> None:
+    """Put fake `php` on PATH.
+
+    This must happen before commands are run, as `php` is looked up once.
+    """
+    path = os.path.join(bin_directory, "php")
+
+    with open(path, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_PHP_PATH}" "$@"\n')
+
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    os.environ["PATH"] = bin_directory + os.pathsep + os.environ["PATH"]
+
+
+def _count_lines(path: str) -> int:
+    """Get amount of lines in file."""
+    try:
+        with open(path, "r") as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+def benchmark(
+    instance_path: str,
+    log_path: str,
+    operation: str,
+    variant: str,
+    iterations: int,
+) -> Result:
+    """Benchmark operation, using a new Instance for every iteration."""
+    from cyberfusion.NextCloudSupport.instance import Instance
+    from cyberfusion.NextCloudSupport.metrics import CommandMetrics
+
+    metrics: List[CommandMetrics] = []
+
+    processes_before = _count_lines(log_path)
+    wall_time = 0.0
+
+    for _ in range(iterations):
+        instance = Instance(
+            instance_path, metrics_hooks=[metrics.append], **VARIANTS[variant]
+        )
+
+        started_at = time.perf_counter()
+
+        OPERATIONS[operation](instance)
+
+        wall_time += time.perf_counter() - started_at
+
+        if instance.worker:
+            instance.worker.stop()
+
+    return Result(
+        operation=operation,
+        variant=variant,
+        commands=len(metrics) / iterations,
+        processes=(_count_lines(log_path) - processes_before) / iterations,
+        wall_time=wall_time / iterations,
+        overhead=(wall_time - sum(m.wall_time for m in metrics)) / iterations,
+    )
+
+
+def main() -> None:
+    """Run benchmarks."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks", description=__doc__.splitlines()[0]
+    )
+
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument(
+        "--startup-latency",
+        type=float,
+        default=0.0,
+        help="Seconds fake PHP sleeps when starting, like booting NextCloud",
+    )
+    parser.add_argument(
+        "--command-latency",
+        type=float,
+        default=0.0,
+        help="Seconds fake PHP sleeps per command",
+    )
+    parser.add_argument("--apps", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument(
+        "--operation", choices=list(OPERATIONS), action="append", dest="operations"
+    )
+    parser.add_argument(
+        "--variant", choices=list(VARIANTS), action="append", dest="variants"
+    )
+    parser.add_argument("--json", action="store_true", help="Output JSON lines")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bin_directory = os.path.join(directory, "bin")
+        instance_path = os.path.join(directory, "instance")
+        log_path = os.path.join(directory, "php.log")
+
+        os.mkdir(bin_directory)
+        os.mkdir(instance_path)
+
+        _install_fake_php(bin_directory)
+
+        os.environ.update(
+            {
+                "FAKE_PHP_STARTUP_LATENCY": str(args.startup_latency),
+                "FAKE_PHP_COMMAND_LATENCY": str(args.command_latency),
+                "FAKE_PHP_APPS": str(args.apps),
+                "FAKE_PHP_USERS": str(args.users),
+                "FAKE_PHP_LOG": log_path,
+            }
+        )
+
+        # Look up PHP up front, so that it is not part of the first benchmark
+
+        from cyberfusion.NextCloudSupport._occ import get_php_bin
+
+        get_php_bin()
+
+        if not args.json:
+            print(
+                f"{'operation':<24} {'variant':<12} {'commands':>9} {'processes':>10}"
+                f" {'wall time (ms)':>15} {'overhead (ms)':>14}"
+            )
+
+        for operation in args.operations or OPERATIONS:
+            for variant in args.variants or VARIANTS:
+                result = benchmark(
+                    instance_path, log_path, operation, variant, args.iterations
+                )
+
+                if args.json:
+                    print(json.dumps(asdict(result)))
+
+                    continue
+
+                print(
+                    f"{result.operation:<24} {result.variant:<12}"
+                    f" {result.commands:>9.1f} {result.processes:>10.1f}"
+                    f" {result.wall_time * 1000:>15.1f}"
+                    f" {result.overhead * 1000:>14.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
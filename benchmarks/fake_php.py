@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Fake `php` executable, which emulates `occ`, the worker and the updater.
+
+Behaviour is configured using environment variables:
+
+- FAKE_PHP_STARTUP_LATENCY: seconds to sleep when starting, like booting NextCloud.
+- FAKE_PHP_COMMAND_LATENCY: seconds to sleep per command.
+- FAKE_PHP_APPS: amount of installed apps. Every 10th app has an update.
+- FAKE_PHP_USERS: amount of users.
+- FAKE_PHP_LOG: file to which a line is appended for every started process.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import List, Tuple
+
+VERSION = "29.0.0.19"
+
+STARTUP_LATENCY = float(os.environ.get("FAKE_PHP_STARTUP_LATENCY", "0"))
+COMMAND_LATENCY = float(os.environ.get("FAKE_PHP_COMMAND_LATENCY", "0"))
+APPS = int(os.environ.get("FAKE_PHP_APPS", "50"))
+USERS = int(os.environ.get("FAKE_PHP_USERS", "10"))
+
+
+def _get_option(argv: List[str], name: str, default: int) -> int:
+    """Get value of integer option."""
+    if name not in argv:
+        return default
+
+    return int(argv[argv.index(name) + 1])
+
+
+def _get_apps() -> dict:
+    """Get `app:list` output."""
+    result: dict = {"enabled": {}, "disabled": {}}
+
+    for i in range(APPS):
+        # Like NextCloud, suffix some versions by another version number
+
+        version = f"1.{i}.0" + (" (1.0.0)" if i % 7 == 0 else "")
+
+        result["disabled" if i % 5 == 0 else "enabled"][f"app{i}"] = version
+
+    return result
+
+
+def _get_app_config() -> dict:
+    """Get app config, as in `config:list` output."""
+    result = {}
+
+    for key, is_enabled in [("enabled", True), ("disabled", False)]:
+        for name, version in _get_apps()[key].items():
+            result[name] = {
+                "enabled": "yes" if is_enabled else "no",
+                "installed_version": version.split(" ")[0],
+            }
+
+    return result
+
+
+def _get_system_config() -> dict:
+    """Get system config."""
+    return {
+        "version": VERSION,
+        "dbhost": "localhost",
+        "loglevel": 2,
+        "trusted_domains": ["localhost"],
+        "maintenance": False,
+    }
+
+
+def occ(argv: List[str]) -> Tuple[int, str, str]:
+    """Run `occ` command, and get return code, stdout and stderr."""
+    time.sleep(COMMAND_LATENCY)
+
+    argv = [argument for argument in argv if argument != "--no-interaction"]
+
+    subcommand = argv[0] if argv else ""
+
+    if subcommand == "app:list":
+        return 0, json.dumps(_get_apps()), ""
+
+    if subcommand == "app:update" and "--showonly" in argv:
+        return (
+            0,
+            "".join(
+                f"app{i} new version available: 2.0.0\n" for i in range(0, APPS, 10)
+            ),
+            "",
+        )
+
+    if subcommand in (
+        "app:disable",
+        "app:enable",
+        "app:install",
+        "app:remove",
+        "app:update",
+        "config:import",
+        "config:system:set",
+        "mail:account:create",
+        "mail:account:export",
+    ):
+        return 0, "", ""
+
+    if subcommand == "config:system:get":
+        value = _get_system_config().get(argv[1])
+
+        if value is None:
+            return 1, "", ""
+
+        return 0, str(value), ""
+
+    if subcommand == "config:list":
+        result: dict = {"system": _get_system_config()}
+
+        if "system" not in argv:
+            result["apps"] = _get_app_config()
+
+        return 0, json.dumps(result), ""
+
+    if subcommand == "user:list":
+        limit = _get_option(argv, "--limit", 500)
+        offset = _get_option(argv, "--offset", 0)
+
+        users = {
+            f"user{i}": f"User {i}" for i in range(offset, min(offset + limit, USERS))
+        }
+
+        return 0, json.dumps(users or []), ""
+
+    if subcommand == "user:report":
+        return 0, f"| total users | {USERS} |\n", ""
+
+    if subcommand == "update:check":
+        return 0, "Everything up to date", ""
+
+    return 1, "", f'Command "{subcommand}" is not defined.'
+
+
+def main() -> None:
+    """Run fake `php`."""
+    if os.environ.get("FAKE_PHP_LOG"):
+        with open(os.environ["FAKE_PHP_LOG"], "a") as f:
+            f.write(json.dumps(sys.argv[1:]) + "\n")
+
+    time.sleep(STARTUP_LATENCY)
+
+    args = sys.argv[1:]
+
+    while args and args[0] == "-d":
+        args = args[2:]
+
+    # Worker: read JSON commands from stdin
+
+    if args and args[0] == "-r":
+        for line in sys.stdin:
+            return_code, stdout, stderr = occ(json.loads(line)["command"])
+
+            sys.stdout.write(
+                json.dumps(
+                    {"return_code": return_code, "stdout": stdout, "stderr": stderr}
+                )
+                + "\n"
+            )
+            sys.stdout.flush()
+
+        return
+
+    if args and args[0] == "occ":
+        return_code, stdout, stderr = occ(args[1:])
+
+        sys.stdout.write(stdout)
+        sys.stderr.write(stderr)
+
+        sys.exit(return_code)
+
+    # Anything else, such as the updater, succeeds without output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark import time of the library.
+
+Run with `python3 -m benchmarks.imports` from the repository root.
+
+Modules are imported in fresh interpreters without PHP on PATH, which must
+succeed. Exits with a non-zero status when modules that should be imported
+lazily are imported, or when importing takes longer than --max-ms.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import List, Tuple
+
+MODULES = [
+    "cyberfusion.NextCloudSupport.instance",
+    "cyberfusion.NextCloudSupport.app",
+    "cyberfusion.NextCloudSupport.fleet",
+]
+
+# Modules that are slow to import, and are imported when used
+
+LAZY_MODULES = ["requests", "cyberfusion.Common", "asyncio", "sqlalchemy"]
+
+CODE = """
+import json, sys, time
+
+started_at = time.perf_counter()
+
+for module in sys.argv[1:]:
+    __import__(module)
+
+print(json.dumps([time.perf_counter() - started_at, sorted(sys.modules)]))
+"""
+
+
+def _import(modules: List[str], path: str) -> Tuple[float, List[str]]:
+    """Import modules in fresh interpreter, and get time and imported modules."""
+    output = subprocess.run(
+        [sys.executable, "-c", CODE] + modules,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "PATH": path},
+    ).stdout
+
+    import_time, imported_modules = json.loads(output)
+
+    return import_time, imported_modules
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.imports", description=__doc__.splitlines()[0]
+    )
+
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--max-ms", type=float, help="Fail when median import time exceeds this"
+    )
+
+    args = parser.parse_args()
+
+    failed = False
+
+    # Empty directory, so that PHP is not found
+
+    with tempfile.TemporaryDirectory() as path:
+        for module in MODULES:
+            import_times = []
+
+            for _ in range(args.iterations):
+                import_time, imported_modules = _import([module], path)
+
+                import_times.append(import_time)
+
+            median = statistics.median(import_times) * 1000
+
+            eagerly_imported = [m for m in LAZY_MODULES if m in imported_modules]
+
+            print(
+                f"{module:<42} {median:>8.1f} ms"
+                + (
+                    f" (imports {', '.join(eagerly_imported)})"
+                    if eagerly_imported
+                    else ""
+                )
+            )
+
+            if eagerly_imported or (args.max_ms is not None and median > args.max_ms):
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
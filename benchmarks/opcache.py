@@ -0,0 +1,103 @@
+"""Benchmark `occ` startup time with and without the fast CLI profile.
+
+Run with `python3 -m benchmarks.opcache /path/to/nextcloud` from the
+repository root. Unlike the other benchmarks, this needs an installed NextCloud
+instance and real PHP, as it measures PHP compiling NextCloud.
+
+A cheap command (`status`) is run repeatedly, so its wall time is mostly
+startup time. With the fast CLI profile, the first command fills the OPcache
+file cache, so it is reported separately.
+"""
+
+import argparse
+import shutil
+import statistics
+import subprocess
+import tempfile
+from typing import List, Optional
+
+from cyberfusion.NextCloudSupport._occ import get_php_bin
+from cyberfusion.NextCloudSupport.instance import Instance
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics
+
+COMMAND = ["status"]
+
+
+def _is_opcache_loaded(php_bin: str) -> bool:
+    """Get if OPcache extension is loaded."""
+    return (
+        subprocess.run(
+            [php_bin, "-r", "echo extension_loaded('Zend OPcache') ? 1 : 0;"],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        == "1"
+    )
+
+
+def _benchmark(instance: Instance, iterations: int) -> List[float]:
+    """Run command, and get wall times."""
+    metrics: List[CommandMetrics] = []
+
+    instance.metrics_hooks.append(metrics.append)
+
+    for _ in range(iterations):
+        instance.run_command(COMMAND)
+
+    return [m.wall_time for m in metrics]
+
+
+def _print(name: str, wall_times: List[float]) -> None:
+    """Print wall times."""
+    print(
+        f"{name:<28} {statistics.median(wall_times) * 1000:>12.1f}"
+        f" {min(wall_times) * 1000:>10.1f} {max(wall_times) * 1000:>10.1f}"
+    )
+
+
+def main() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.opcache", description=__doc__.splitlines()[0]
+    )
+
+    parser.add_argument("path", help="Path to installed NextCloud instance")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--php-bin", help="Defaults to PHP on PATH")
+
+    args = parser.parse_args()
+
+    php_bin: Optional[str] = args.php_bin
+
+    if not _is_opcache_loaded(php_bin or get_php_bin()):
+        parser.exit(1, "OPcache extension is not loaded\n")
+
+    opcache_directory = tempfile.mkdtemp()
+
+    try:
+        print(f"{'profile':<28} {'median (ms)':>12} {'min (ms)':>10} {'max (ms)':>10}")
+
+        _print(
+            "default",
+            _benchmark(Instance(args.path, php_bin=php_bin), args.iterations),
+        )
+
+        wall_times = _benchmark(
+            Instance(
+                args.path,
+                php_bin=php_bin,
+                fast_cli=True,
+                opcache_directory=opcache_directory,
+            ),
+            args.iterations + 1,
+        )
+
+        _print("fast CLI (empty file cache)", wall_times[:1])
+        _print("fast CLI", wall_times[1:])
+    finally:
+        shutil.rmtree(opcache_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Functions to extract archives."""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional, Tuple
+
+from cyberfusion.NextCloudSupport._download import CHUNK_SIZE, ProgressCallback
+
+if TYPE_CHECKING:  # pragma: no cover
+    from cyberfusion.NextCloudSupport.cache import ArchiveCache
+
+
+def _get_member_path(destination_path: str, name: str) -> str:
+    """Get path to extract member to, refusing paths outside destination."""
+    destination_path = os.path.abspath(destination_path)
+
+    path = os.path.normpath(os.path.join(destination_path, name))
+
+    if not path.startswith(destination_path + os.path.sep):
+        raise ValueError(f"Archive member '{name}' is outside destination")
+
+    return path
+
+
+def extract_zip(
+    zip_path: str,
+    destination_path: str,
+    *,
+    strip_prefix: str = "",
+    threads: int = 4,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> None:
+    """Extract ZIP to its final path, without temporary copies.
+
+    strip_prefix is removed from member names; members outside it are skipped.
+    Files are extracted by multiple threads, each with their own handle on the
+    ZIP (decompression releases the GIL). progress_callback is called with
+    'extract', the extracted amount of bytes, and the total amount of bytes.
+    """
+    files: List[Tuple[zipfile.ZipInfo, str]] = []
+    directories = set()
+
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for member in z.infolist():
+            if not member.filename.startswith(strip_prefix):
+                continue
+
+            name = member.filename[len(strip_prefix) :]
+
+            if not name.strip("/"):
+                continue
+
+            path = _get_member_path(destination_path, name)
+
+            if member.is_dir():
+                directories.add(path)
+            else:
+                directories.add(os.path.dirname(path))
+
+                files.append((member, path))
+
+    # Create directories up front, so that threads don't race for them
+
+    for directory in sorted(directories):
+        os.makedirs(directory, exist_ok=True)
+
+    total = sum(member.file_size for member, _ in files)
+    done = 0
+    lock = threading.Lock()
+
+    def _extract(chunk: List[Tuple[zipfile.ZipInfo, str]]) -> None:
+        nonlocal done
+
+        with zipfile.ZipFile(zip_path, "r") as z:
+            for member, path in chunk:
+                with z.open(member) as source, open(path, "wb") as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+                if not progress_callback:
+                    continue
+
+                with lock:
+                    done += member.file_size
+
+                    progress_callback("extract", done, total)
+
+    threads = max(1, min(threads, len(files)))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Consume results to raise exceptions
+
+        list(executor.map(_extract, [files[i::threads] for i in range(threads)]))
+
+
+def _get_app_members(
+    f: tarfile.TarFile, staging_path: str, names: List[str]
+) -> Iterator[tarfile.TarInfo]:
+    """Get members of app archive, while validating them.
+
+    The app name is the top directory of the first member, and is appended to
+    names. All other members must be in the same directory. Member names are
+    normalised, as archives may contain names starting with './', and the root
+    directory (i.e. './') is skipped.
+    """
+    for member in f:
+        member.name = os.path.normpath(member.name)
+
+        if member.name == os.curdir:
+            continue
+
+        if member.islnk():
+            member.linkname = os.path.normpath(member.linkname)
+
+        _get_member_path(staging_path, member.name)
+
+        name = member.name.split(os.path.sep)[0]
+
+        if not names:
+            names.append(name)
+        elif name != names[0]:
+            raise ValueError("Archive must contain a single directory")
+
+        if member.issym() or member.islnk():
+            _get_member_path(
+                os.path.join(staging_path, name),
+                os.path.join(os.path.dirname(member.name), member.linkname)
+                if member.issym()
+                else member.linkname,
+            )
+
+        yield member
+
+
+def extract_app(f: BinaryIO, instance_path: str) -> str:
+    """Extract app archive to apps directory, and get app name.
+
+    The archive is read in a single pass, so it can be streamed. It is
+    extracted into a staging directory in the instance directory, and then
+    renamed into place. Therefore, an app directory is never half-extracted.
+
+    Like NextCloud's installer, an existing app directory is replaced, so files
+    that are not in the archive are removed. As a directory can't be renamed
+    over a non-empty one, the existing directory is moved aside first, so the
+    app directory is briefly missing. It is moved back when the rename fails.
+    """
+    staging_path = tempfile.mkdtemp(dir=instance_path, prefix=".app-")
+
+    try:
+        names: List[str] = []
+
+        with tarfile.open(fileobj=f, mode="r|*") as tar:
+            tar.extractall(
+                staging_path, members=_get_app_members(tar, staging_path, names)
+            )
+
+        if not names or not os.path.isdir(os.path.join(staging_path, names[0])):
+            raise ValueError("Archive must contain a single directory")
+
+        name = names[0]
+
+        app_path = os.path.join(instance_path, "apps", name)
+
+        old_app_path = os.path.join(staging_path, ".old")
+
+        if os.path.lexists(app_path):
+            os.rename(app_path, old_app_path)
+
+        try:
+            os.rename(os.path.join(staging_path, name), app_path)
+        except OSError:
+            if os.path.lexists(old_app_path):
+                os.rename(old_app_path, app_path)
+
+            raise
+    finally:
+        shutil.rmtree(staging_path)
+
+    return name
+
+
+def extract_app_from_url(
+    url: str, instance_path: str, archive_cache: Optional["ArchiveCache"] = None
+) -> str:
+    """Download and extract app archive while streaming, and get app name.
+
+    If archive_cache is set, the archive is extracted from the cache instead,
+    downloading it if needed.
+
+    See extract_app.
+    """
+    if archive_cache:
+        with archive_cache.get(url) as path, open(path, "rb") as f:
+            return extract_app(f, instance_path)
+
+    import requests
+
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+
+        # Let urllib3 handle Content-Encoding; tarfile handles the compression
+        # of the archive itself
+
+        r.raw.decode_content = True
+
+        return extract_app(r.raw, instance_path)
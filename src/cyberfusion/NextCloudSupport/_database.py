@@ -0,0 +1,283 @@
+"""Functions to read instance state from the database, without running PHP.
+
+The database credentials are read from the config (see _filesystem). Like
+_filesystem, these functions return None when the result is ambiguous, or the
+database can't be read from. Callers should then fall back to `occ`.
+
+SQLAlchemy is imported when used, so it is an optional dependency. Engines are
+shared by instances that connect to the same database server with the same
+credentials. As every instance usually has its own database user, connections
+are not pooled: pooling them per instance would keep idle connections open for
+every instance in a fleet, which could exhaust the database server's maximum
+amount of connections. Instead, a connection is opened per query.
+"""
+
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from cyberfusion.NextCloudSupport import _filesystem
+from cyberfusion.NextCloudSupport.app import AppRecord
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sqlalchemy import URL, Engine, TableClause
+
+# Drivers by `dbtype` in the config. Other types (i.e. OCI) are not supported.
+
+DRIVERS = {
+    "sqlite3": "sqlite",
+    "mysql": "mysql+pymysql",
+    "pgsql": "postgresql",
+}
+
+# Apps that add user backends. When enabled, the users table does not contain
+# all users.
+
+USER_BACKEND_APPS = ["user_ldap", "user_saml", "user_oidc", "user_external"]
+
+# Engines by hash of URL, so that passwords are not kept as keys
+
+_engines: Dict[str, "Engine"] = {}
+_engines_lock = threading.Lock()
+
+
+def _get_host_and_port(
+    config: Dict[str, Any],
+) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """Get host, port and socket from `dbhost` and `dbport`.
+
+    Like NextCloud, `dbhost` may contain a port or socket after a colon.
+    """
+    host = config.get("dbhost") or None
+    port = config.get("dbport") or None
+    socket = None
+
+    if host and host.startswith("/"):
+        host, socket = None, host
+    elif host and ":" in host and not host.startswith("["):
+        host, suffix = host.rsplit(":", 1)
+
+        if suffix.isdigit():
+            port = suffix
+        else:
+            socket = suffix
+
+    return host, int(port) if port else None, socket
+
+
+def _get_location(path: str) -> Optional[Tuple["URL", Optional[str], str]]:
+    """Get URL of database server, schema and table prefix."""
+    from sqlalchemy import URL
+
+    config = _filesystem.read_config(path)
+
+    if config is None or config.get("dbtype", "sqlite3") not in DRIVERS:
+        return None
+
+    type_ = config.get("dbtype", "sqlite3")
+    name = config.get("dbname", "owncloud")
+    prefix = config.get("dbtableprefix", "oc_")
+
+    if type_ == "sqlite3":
+        data_directory = config.get("datadirectory", os.path.join(path, "data"))
+
+        # Open read-only, so that a missing database is not created
+
+        return (
+            URL.create(
+                DRIVERS[type_],
+                database="file:" + os.path.join(data_directory, name + ".db"),
+                query={"mode": "ro", "uri": "true"},
+            ),
+            None,
+            prefix,
+        )
+
+    host, port, socket = _get_host_and_port(config)
+
+    query = {}
+
+    if socket:
+        query["unix_socket" if type_ == "mysql" else "host"] = socket
+
+    return (
+        URL.create(
+            DRIVERS[type_],
+            username=config.get("dbuser"),
+            password=config.get("dbpassword"),
+            host=host,
+            port=port,
+            database=None if type_ == "mysql" else name,
+            query=query,
+        ),
+        name if type_ == "mysql" else None,
+        prefix,
+    )
+
+
+def _get_engine(url: "URL") -> "Engine":
+    """Get engine for database server and credentials, shared by instances."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    key = hashlib.sha256(url.render_as_string(hide_password=False).encode()).hexdigest()
+
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(url, poolclass=NullPool)
+
+        return _engines[key]
+
+
+def dispose_engines() -> None:
+    """Close connections of all engines, and remove them."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+        _engines.clear()
+
+
+def _query(
+    path: str, table_name: str, columns: List[str], build: Any
+) -> Optional[List[Any]]:
+    """Get rows of query built by build(table) on table, or None if it fails."""
+    from sqlalchemy import column, table
+    from sqlalchemy.exc import SQLAlchemyError
+
+    location = _get_location(path)
+
+    if location is None:
+        return None
+
+    url, schema, prefix = location
+
+    table_: "TableClause" = table(
+        prefix + table_name, *[column(c) for c in columns], schema=schema
+    )
+
+    try:
+        with _get_engine(url).connect() as connection:
+            return list(connection.execute(build(table_)))
+    except SQLAlchemyError:
+        return None
+
+
+# Prefix of app config values that NextCloud encrypted, as they are sensitive
+
+ENCRYPTED_VALUE_PREFIX = "$AppConfigEncryption$"
+
+
+def get_app_config(
+    path: str, keys: List[str], *, app: Optional[str] = None
+) -> Optional[Dict[str, Dict[str, str]]]:
+    """Get app config values with keys (of app if set), by app and key.
+
+    Encrypted values are returned as stored.
+    """
+    rows = _query(
+        path,
+        "appconfig",
+        ["appid", "configkey", "configvalue"],
+        lambda t: t.select().where(
+            t.c.configkey.in_(keys), *([t.c.appid == app] if app else [])
+        ),
+    )
+
+    if rows is None:
+        return None
+
+    result: Dict[str, Dict[str, str]] = {}
+
+    for app_, key, value in rows:
+        result.setdefault(app_, {})[key] = value
+
+    return result
+
+
+def get_app_index(path: str) -> Optional[Dict[str, AppRecord]]:
+    """Get installed apps by name, like `app:list` does.
+
+    Like `app:list`, only apps in the apps directories are included. The
+    versions of enabled apps are the installed versions from the database, and
+    those of disabled apps are from their `appinfo/info.xml`.
+    """
+    app_versions = _filesystem.get_app_versions(path)
+
+    if app_versions is None:
+        return None
+
+    app_config = get_app_config(path, ["enabled", "installed_version"])
+
+    if app_config is None:
+        return None
+
+    result = {}
+
+    for name, version in app_versions.items():
+        values = app_config.get(name, {})
+
+        # Apps enabled for groups have a list of groups instead of 'yes'
+
+        is_enabled = values.get("enabled", "no") != "no"
+
+        if is_enabled and "installed_version" in values:
+            version = values["installed_version"]
+
+        result[name] = AppRecord(name=name, version=version, is_enabled=is_enabled)
+
+    return result
+
+
+def _has_user_backend_apps(path: str) -> Optional[bool]:
+    """Get if apps that add user backends are enabled."""
+    app_config = get_app_config(path, ["enabled"])
+
+    if app_config is None:
+        return None
+
+    return any(
+        app_config.get(name, {}).get("enabled", "no") != "no"
+        for name in USER_BACKEND_APPS
+    )
+
+
+def get_users(path: str, limit: int, offset: int) -> Optional[Dict[str, str]]:
+    """Get names of users by ID, like `user:list` does."""
+    if _has_user_backend_apps(path) is not False:
+        return None
+
+    rows = _query(
+        path,
+        "users",
+        ["uid", "displayname", "uid_lower"],
+        lambda t: t.select().order_by(t.c.uid_lower).limit(limit).offset(offset),
+    )
+
+    if rows is None:
+        return None
+
+    # Users without display name are named by their ID
+
+    return {uid: display_name or uid for uid, display_name, _ in rows}
+
+
+def get_user_count(path: str) -> Optional[int]:
+    """Get amount of users."""
+    from sqlalchemy import func, select
+
+    if _has_user_backend_apps(path) is not False:
+        return None
+
+    rows = _query(
+        path,
+        "users",
+        ["uid"],
+        lambda t: select(func.count()).select_from(t),
+    )
+
+    if rows is None:
+        return None
+
+    return rows[0][0]
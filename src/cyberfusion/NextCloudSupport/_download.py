@@ -0,0 +1,101 @@
+"""Functions to download files.
+
+requests is imported when used, as importing it is slow.
+"""
+
+import hashlib
+import os
+from typing import BinaryIO, Callable, Optional
+
+from cyberfusion.NextCloudSupport.exceptions import ChecksumMismatchError
+
+CHUNK_SIZE = 1024 * 1024
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def get_sha256(path: str) -> str:
+    """Get SHA-256 checksum of file."""
+    hash_ = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hash_.update(chunk)
+
+    return hash_.hexdigest()
+
+
+def get_published_sha256(url: str) -> str:
+    """Get SHA-256 checksum published next to file, as NextCloud does."""
+    import requests
+
+    response = requests.get(url + ".sha256")
+
+    response.raise_for_status()
+
+    return response.text.split()[0]
+
+
+def verify_sha256(path: str, actual: str, expected: Optional[str]) -> None:
+    """Raise exception if checksum does not match expected checksum, if any."""
+    if expected is None or actual.lower() == expected.lower():
+        return
+
+    raise ChecksumMismatchError(path=path, expected=expected, actual=actual)
+
+
+def download_to_file(
+    url: str,
+    f: BinaryIO,
+    *,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> str:
+    """Download URL to file object, and get SHA-256 checksum.
+
+    The checksum is calculated while streaming, so the file is not read again.
+    progress_callback is called with 'download', the downloaded amount of bytes,
+    and the total amount of bytes (0 if unknown).
+    """
+    import requests
+
+    hash_ = hashlib.sha256()
+    done = 0
+
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+
+        total = int(r.headers.get("Content-Length", 0))
+
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+            hash_.update(chunk)
+
+            done += len(chunk)
+
+            if progress_callback:
+                progress_callback("download", done, total)
+
+    return hash_.hexdigest()
+
+
+def download(
+    url: str,
+    path: str,
+    *,
+    sha256: Optional[str] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> None:
+    """Download URL to path, and verify SHA-256 checksum if set.
+
+    The file is only accessible by the current user. On checksum mismatch, it
+    is removed.
+    """
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        actual = download_to_file(url, f, progress_callback=progress_callback)
+
+    try:
+        verify_sha256(path, actual, sha256)
+    except ChecksumMismatchError:
+        os.unlink(path)
+
+        raise
@@ -0,0 +1,338 @@
+"""Functions to read instance state from the filesystem, without running PHP.
+
+These functions return None when the result is ambiguous, e.g. when the config
+contains PHP expressions rather than literals. Callers should then fall back
+to `occ`.
+"""
+
+import glob
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_TOKEN_REGEX = re.compile(
+    r"""
+    (?P<skip>\s+|//[^\n]*|\#[^\n]*|/\*.*?\*/|<\?php)
+    |(?P<string>'(?:[^'\\]|\\.)*')
+    |(?P<double_quoted_string>"(?:[^"\\$]|\\.)*")
+    |(?P<number>-?\d+(?:\.\d+)?)
+    |(?P<operator>=>|[()\[\],;=])
+    |(?P<variable>\$[A-Za-z_]\w*)
+    |(?P<word>[A-Za-z_]\w*)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+_DOUBLE_QUOTED_ESCAPES = {
+    "n": "\n",
+    "t": "\t",
+    "r": "\r",
+    "\\": "\\",
+    '"': '"',
+    "$": "$",
+}
+
+
+class _ParseError(Exception):
+    """Config contains anything other than literals."""
+
+    pass
+
+
+def _tokenize(text: str) -> Iterator[Tuple[str, str]]:
+    """Get tokens in PHP code that consists of literals only."""
+    position = 0
+
+    while position < len(text):
+        match = _TOKEN_REGEX.match(text, position)
+
+        if not match:
+            raise _ParseError
+
+        position = match.end()
+
+        assert match.lastgroup is not None
+
+        if match.lastgroup == "skip":
+            continue
+
+        yield match.lastgroup, match.group()
+
+
+class _Parser:
+    """Parser for `$CONFIG = array(...);` with literal values."""
+
+    def __init__(self, text: str) -> None:
+        """Set attributes."""
+        self.tokens = list(_tokenize(text))
+        self.position = 0
+
+    def _peek(self) -> Tuple[str, str]:
+        """Get current token."""
+        if self.position >= len(self.tokens):
+            raise _ParseError
+
+        return self.tokens[self.position]
+
+    def _next(self, value: Optional[str] = None) -> Tuple[str, str]:
+        """Consume current token, which must have value if set."""
+        token = self._peek()
+
+        if value is not None and token[1].lower() != value:
+            raise _ParseError
+
+        self.position += 1
+
+        return token
+
+    def parse(self) -> Dict[str, Any]:
+        """Parse config."""
+        self._next("$config")
+        self._next("=")
+
+        config = self._parse_value()
+
+        self._next(";")
+
+        if self.position != len(self.tokens) or not isinstance(config, dict):
+            raise _ParseError
+
+        return config
+
+    def _parse_value(self) -> Any:
+        """Parse literal."""
+        type_, value = self._next()
+
+        if type_ == "string":
+            return re.sub(r"\\([\\'])", r"\1", value[1:-1])
+
+        if type_ == "double_quoted_string":
+            return re.sub(
+                r"\\(.)",
+                lambda m: _DOUBLE_QUOTED_ESCAPES.get(m.group(1), m.group()),
+                value[1:-1],
+            )
+
+        if type_ == "number":
+            return float(value) if "." in value else int(value)
+
+        if type_ == "word" and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+
+        if type_ == "word" and value.lower() == "null":
+            return None
+
+        if type_ == "word" and value.lower() == "array":
+            self._next("(")
+
+            return self._parse_array(")")
+
+        if value == "[":
+            return self._parse_array("]")
+
+        raise _ParseError
+
+    def _parse_array(self, end: str) -> Any:
+        """Parse array items, up to and including end.
+
+        Arrays with sequential integer keys are returned as lists, and other
+        arrays as dicts.
+        """
+        items: Dict[Any, Any] = {}
+        next_index = 0
+
+        while self._peek()[1] != end:
+            key_or_value = self._parse_value()
+
+            if self._peek()[1] == "=>":
+                self._next()
+
+                key = key_or_value
+                value = self._parse_value()
+            else:
+                key = next_index
+                value = key_or_value
+
+            # Like PHP, cast numeric string keys to integers
+
+            if isinstance(key, str) and re.fullmatch(r"0|-?[1-9]\d*", key):
+                key = int(key)
+
+            if isinstance(key, int):
+                next_index = max(next_index, key + 1)
+            elif not isinstance(key, str):
+                raise _ParseError
+
+            items[key] = value
+
+            if self._peek()[1] != end:
+                self._next(",")
+
+        self._next(end)
+
+        if list(items) == list(range(len(items))):
+            return list(items.values())
+
+        return {str(k): v for k, v in items.items()}
+
+
+def read_config(path: str) -> Optional[Dict[str, Any]]:
+    """Get system config from `config/config.php` and `config/*.config.php`.
+
+    Like NextCloud does, additional config files override config.php.
+    """
+    config: Dict[str, Any] = {}
+
+    config_path = os.path.join(path, "config")
+
+    for file_ in [os.path.join(config_path, "config.php")] + sorted(
+        glob.glob(os.path.join(config_path, "*.config.php"))
+    ):
+        try:
+            with open(file_, "r") as f:
+                config |= _Parser(f.read()).parse()
+        except (FileNotFoundError, _ParseError):
+            return None
+
+    return config
+
+
+def get_code_version(path: str) -> Optional[str]:
+    """Get version of code from `version.php`."""
+    try:
+        with open(os.path.join(path, "version.php"), "r") as f:
+            contents = f.read()
+    except FileNotFoundError:
+        return None
+
+    match = re.search(
+        r"\$OC_Version\s*=\s*(?:array\s*\(|\[)\s*([\d\s,]+?)\s*,?\s*[)\]]", contents
+    )
+
+    if not match:
+        return None
+
+    return ".".join(part.strip() for part in match.group(1).split(","))
+
+
+def get_release(path: str) -> Optional[str]:
+    """Get release of code (e.g. '29.0.1') from `version.php`."""
+    try:
+        with open(os.path.join(path, "version.php"), "r") as f:
+            contents = f.read()
+    except FileNotFoundError:
+        return None
+
+    match = re.search(r"\$OC_VersionString\s*=\s*'([^']+)'", contents)
+
+    if not match:
+        return None
+
+    return match.group(1)
+
+
+def get_version(path: str) -> Optional[str]:
+    """Get version, like `config:system:get version` does.
+
+    The version in the config is the installed version, while `version.php`
+    contains the version of the code. They differ when an upgrade is pending,
+    in which case this is ambiguous.
+    """
+    config = read_config(path)
+
+    if config is None:
+        return None
+
+    version = config.get("version")
+
+    if not isinstance(version, str) or version != get_code_version(path):
+        return None
+
+    return version
+
+
+def get_apps_paths(path: str) -> Optional[List[str]]:
+    """Get directories that contain apps."""
+    config = read_config(path)
+
+    if config is None:
+        return None
+
+    if "apps_paths" not in config:
+        return [os.path.join(path, "apps")]
+
+    result = []
+
+    for apps_path in config["apps_paths"]:
+        if not isinstance(apps_path, dict) or not isinstance(
+            apps_path.get("path"), str
+        ):
+            return None
+
+        result.append(apps_path["path"])
+
+    return result
+
+
+def get_app_versions(path: str) -> Optional[Dict[str, str]]:
+    """Get versions of apps, by name, from their `appinfo/info.xml`.
+
+    Like `app:list`, directories without `appinfo/info.xml` are skipped.
+    """
+    apps_paths = get_apps_paths(path)
+
+    if apps_paths is None:
+        return None
+
+    result: Dict[str, str] = {}
+
+    for apps_path in apps_paths:
+        for info_path in glob.glob(os.path.join(apps_path, "*", "appinfo", "info.xml")):
+            name = os.path.basename(os.path.dirname(os.path.dirname(info_path)))
+
+            # NextCloud picks the highest version when an app exists in multiple
+            # apps paths
+
+            if name in result:
+                return None
+
+            try:
+                version = ET.parse(info_path).findtext("version")
+            except ET.ParseError:
+                return None
+
+            if not version:
+                return None
+
+            result[name] = version.strip()
+
+    return result
+
+
+def get_fingerprint(path: str) -> List[Optional[float]]:
+    """Get mtimes of files and directories that change with instance state.
+
+    These are the config, `version.php` and apps directories.
+    """
+    paths = [
+        os.path.join(path, "config"),
+        os.path.join(path, "config", "config.php"),
+        os.path.join(path, "version.php"),
+    ]
+
+    paths.extend(sorted(glob.glob(os.path.join(path, "config", "*.config.php"))))
+
+    for apps_directory in sorted(glob.glob(os.path.join(path, "*apps*"))):
+        paths.append(apps_directory)
+        paths.extend(sorted(glob.glob(os.path.join(apps_directory, "*", ""))))
+
+    fingerprint: List[Optional[float]] = []
+
+    for path_ in paths:
+        try:
+            fingerprint.append(os.stat(path_).st_mtime)
+        except FileNotFoundError:
+            fingerprint.append(None)
+
+    return fingerprint
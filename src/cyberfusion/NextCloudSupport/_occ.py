@@ -1,37 +1,452 @@
 """Functions to run `occ` commands."""
 
+import functools
+import hashlib
+import os
+import select
+import signal
 import subprocess
-from typing import List
+import tempfile
+import threading
+import time
+from typing import IO, Any, Dict, Iterable, List, Optional, Tuple
 
-from cyberfusion.Common import find_executable
-from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
+from cyberfusion.NextCloudSupport.exceptions import (
+    CommandCancelledError,
+    CommandFailedError,
+    CommandTimeoutError,
+)
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics, MetricsHook, emit
 
-PHP_BIN = find_executable("php")
 
+@functools.cache
+def get_php_bin() -> str:
+    """Get path to PHP binary on PATH.
 
-def run_command(command: List[str], cwd: str) -> str:
-    """Run command and get output."""
-    command = [
-        PHP_BIN,
-        "-d",
-        "memory_limit=512M",
-        "occ",
-        "--no-interaction",
-    ] + command
+    It is looked up when first needed, rather than on import, so that the
+    library can be imported on hosts without PHP.
+    """
+    from cyberfusion.Common import find_executable
 
+    return find_executable("php")
+
+
+def __getattr__(name: str) -> Any:
+    """Get PHP_BIN lazily, for backward compatibility."""
+    if name == "PHP_BIN":
+        return get_php_bin()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# PHP ini settings for `occ` commands. Settings passed to functions below are
+# merged with these.
+
+DEFAULT_PHP_INI_SETTINGS: Dict[str, str] = {"memory_limit": "512M"}
+
+# Base directory for OPcache file caches (see get_fast_cli_php_ini_settings)
+
+DEFAULT_OPCACHE_DIRECTORY = os.path.join("~", ".cache", "nextcloud-opcache")
+
+
+def get_php_ini_arguments(
+    php_ini_settings: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """Get PHP arguments for ini settings, merged with the defaults.
+
+    As PHP doesn't create the OPcache file cache directory, it is created here
+    if needed (see get_fast_cli_php_ini_settings), i.e. when a command is run.
+    """
+    if php_ini_settings and "opcache.file_cache" in php_ini_settings:
+        os.makedirs(php_ini_settings["opcache.file_cache"], mode=0o700, exist_ok=True)
+
+    arguments = []
+
+    for name, value in {**DEFAULT_PHP_INI_SETTINGS, **(php_ini_settings or {})}.items():
+        arguments.extend(["-d", f"{name}={value}"])
+
+    return arguments
+
+
+def get_fast_cli_php_ini_settings(
+    path: str, opcache_directory: Optional[str] = None
+) -> Dict[str, str]:
+    """Get PHP ini settings that enable OPcache for `occ` commands on instance.
+
+    By default, OPcache is disabled for the CLI, so NextCloud is compiled for
+    every command. These settings make OPcache store compiled scripts in a file
+    cache, so that they are reused by later commands.
+
+    The file cache is stored in a directory per instance, in opcache_directory
+    (defaults to DEFAULT_OPCACHE_DIRECTORY). It is only accessible by the
+    current user, as PHP runs cached scripts without checking them. The
+    directory is created when the first command is run.
+
+    PHP accepts unknown ini settings, so when the OPcache extension is not
+    loaded, commands run without OPcache rather than failing.
+    """
+    directory = os.path.join(
+        os.path.expanduser(opcache_directory or DEFAULT_OPCACHE_DIRECTORY),
+        hashlib.sha256(os.path.realpath(path).encode()).hexdigest()[:16],
+    )
+
+    return {
+        "opcache.enable_cli": "1",
+        "opcache.file_cache": directory,
+        "opcache.file_cache_only": "1",
+    }
+
+
+def get_command(
+    command: List[str],
+    php_bin: Optional[str] = None,
+    php_ini_settings: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """Get full command to run `occ` command.
+
+    php_bin defaults to PHP on PATH.
+    """
+    return (
+        [php_bin or get_php_bin()]
+        + get_php_ini_arguments(php_ini_settings)
+        + ["occ", "--no-interaction"]
+        + command
+    )
+
+
+def get_subcommand(command: List[str]) -> str:
+    """Get `occ` subcommand for metrics."""
+    return command[0] if command else ""
+
+
+# When waiting for a command that can be cancelled, check whether it was
+# cancelled this often (in seconds)
+
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def kill_process_group(pid: int) -> None:
+    """Kill process group, i.e. a process started in a new session and its children."""
     try:
-        return subprocess.run(
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def is_expired(
+    deadline: Optional[float], cancel_event: Optional[threading.Event]
+) -> bool:
+    """Get if deadline passed, or cancel_event was set."""
+    if cancel_event and cancel_event.is_set():
+        return True
+
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def get_wait_interval(
+    deadline: Optional[float], cancel_event: Optional[threading.Event]
+) -> Optional[float]:
+    """Get how long to wait before checking is_expired again (None is forever)."""
+    intervals = []
+
+    if deadline is not None:
+        intervals.append(max(0.0, deadline - time.monotonic()))
+
+    if cancel_event:
+        intervals.append(CANCEL_POLL_INTERVAL)
+
+    return min(intervals) if intervals else None
+
+
+def _wait(
+    pid: int, deadline: Optional[float], cancel_event: Optional[threading.Event]
+) -> Optional[Tuple[int, Any]]:
+    """Wait for process, and get its wait status and resource usage.
+
+    None is returned when the deadline passed, or cancel_event was set.
+    """
+    pidfd = os.pidfd_open(pid)
+
+    try:
+        while True:
+            waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+
+            if waited_pid:
+                return status, rusage
+
+            if is_expired(deadline, cancel_event):
+                return None
+
+            # The pidfd becomes readable when the process exits
+
+            select.select([pidfd], [], [], get_wait_interval(deadline, cancel_event))
+    finally:
+        os.close(pidfd)
+
+
+def execute(
+    command: List[str],
+    cwd: str,
+    *,
+    subcommand: str,
+    metrics_hooks: Iterable[MetricsHook] = (),
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+    env: Optional[Dict[str, str]] = None,
+    stdin: Optional[IO[bytes]] = None,
+) -> str:
+    """Run any command and get output.
+
+    Output is written to files rather than pipes, so that the process can be
+    waited for with `os.wait4`, which returns its resource usage. Likewise,
+    stdin should be a file, if set.
+
+    env is added to the environment of the process (e.g. for secrets, which
+    should not be passed as arguments).
+
+    The process runs in its own process group. When it runs longer than timeout
+    seconds, or cancel_event is set, the process group is killed (so that child
+    processes are killed too), and CommandTimeoutError or CommandCancelledError
+    is raised.
+    """
+    started_at = time.monotonic()
+
+    with tempfile.TemporaryFile() as stdout_f, tempfile.TemporaryFile() as stderr_f:
+        process = subprocess.Popen(
             command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+            stdin=stdin,
+            stdout=stdout_f,
+            stderr=stderr_f,
             cwd=cwd,
-        ).stdout.rstrip()
-    except subprocess.CalledProcessError as e:
+            start_new_session=True,
+            env={**os.environ, **env} if env else None,
+        )
+
+        try:
+            result = _wait(
+                process.pid,
+                started_at + timeout if timeout is not None else None,
+                cancel_event,
+            )
+        except BaseException:
+            kill_process_group(process.pid)
+            process.wait()
+
+            raise
+
+        if result is None:
+            kill_process_group(process.pid)
+
+            _, status, rusage = os.wait4(process.pid, 0)
+        else:
+            status, rusage = result
+
+        # Prevent Popen from waiting for the already reaped process
+
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        wall_time = time.monotonic() - started_at
+
+        stdout_f.seek(0)
+        stderr_f.seek(0)
+
+        stdout = stdout_f.read()
+        stderr = stderr_f.read()
+
+    emit(
+        CommandMetrics(
+            path=cwd,
+            command=command,
+            subcommand=subcommand,
+            wall_time=wall_time,
+            cpu_time=rusage.ru_utime + rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * 1024,  # KiB on Linux
+            return_code=process.returncode,
+            output_size=len(stdout) + len(stderr),
+        ),
+        metrics_hooks,
+    )
+
+    if result is None:
+        # Output may be cut off in the middle of a character
+
+        if cancel_event and cancel_event.is_set():
+            raise CommandCancelledError(
+                return_code=process.returncode,
+                stdout=stdout.decode(errors="replace"),
+                stderr=stderr.decode(errors="replace"),
+                command=command,
+            )
+
+        assert timeout is not None
+
+        raise CommandTimeoutError(
+            return_code=process.returncode,
+            stdout=stdout.decode(errors="replace"),
+            stderr=stderr.decode(errors="replace"),
+            command=command,
+            timeout=timeout,
+        )
+
+    if process.returncode != 0:
         raise CommandFailedError(
-            return_code=e.returncode,
-            stdout=e.stdout,
-            stderr=e.stderr,
+            return_code=process.returncode,
+            stdout=stdout.decode(),
+            stderr=stderr.decode(),
             command=command,
         )
+
+    return stdout.decode().rstrip()
+
+
+def run_command(
+    command: List[str],
+    cwd: str,
+    *,
+    php_bin: Optional[str] = None,
+    php_ini_settings: Optional[Dict[str, str]] = None,
+    metrics_hooks: Iterable[MetricsHook] = (),
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> str:
+    """Run command and get output.
+
+    See execute for timeout, cancel_event and env.
+    """
+    return execute(
+        get_command(command, php_bin, php_ini_settings),
+        cwd,
+        subcommand=get_subcommand(command),
+        metrics_hooks=metrics_hooks,
+        timeout=timeout,
+        cancel_event=cancel_event,
+        env=env,
+    )
+
+
+async def execute_async(
+    command: List[str],
+    cwd: str,
+    *,
+    subcommand: str,
+    metrics_hooks: Iterable[MetricsHook] = (),
+    timeout: Optional[float] = None,
+) -> str:
+    """Run any command asynchronously and get output.
+
+    The process runs in its own process group. When the calling task is
+    cancelled, or the process runs longer than timeout seconds, the process
+    group is killed. On timeout, CommandTimeoutError is raised.
+    """
+    import asyncio
+
+    started_at = time.monotonic()
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+    )
+
+    # Read output in chunks, so that output is kept when the process is killed
+
+    stdout_chunks: List[bytes] = []
+    stderr_chunks: List[bytes] = []
+
+    async def _read(stream: asyncio.StreamReader, chunks: List[bytes]) -> None:
+        while chunk := await stream.read(65536):
+            chunks.append(chunk)
+
+    assert process.stdout is not None
+    assert process.stderr is not None
+
+    timed_out = False
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                _read(process.stdout, stdout_chunks),
+                _read(process.stderr, stderr_chunks),
+                process.wait(),
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+
+        kill_process_group(process.pid)
+
+        await process.wait()
+    except asyncio.CancelledError:
+        kill_process_group(process.pid)
+
+        await process.wait()
+
+        raise
+
+    assert process.returncode is not None
+
+    stdout = b"".join(stdout_chunks)
+    stderr = b"".join(stderr_chunks)
+
+    # The event loop reaps the process, so its resource usage is unknown
+
+    emit(
+        CommandMetrics(
+            path=cwd,
+            command=command,
+            subcommand=subcommand,
+            wall_time=time.monotonic() - started_at,
+            cpu_time=None,
+            max_rss=None,
+            return_code=process.returncode,
+            output_size=len(stdout) + len(stderr),
+        ),
+        metrics_hooks,
+    )
+
+    if timed_out:
+        assert timeout is not None
+
+        raise CommandTimeoutError(
+            return_code=process.returncode,
+            stdout=stdout.decode(errors="replace"),
+            stderr=stderr.decode(errors="replace"),
+            command=command,
+            timeout=timeout,
+        )
+
+    if process.returncode != 0:
+        raise CommandFailedError(
+            return_code=process.returncode,
+            stdout=stdout.decode(),
+            stderr=stderr.decode(),
+            command=command,
+        )
+
+    return stdout.decode().rstrip()
+
+
+async def run_command_async(
+    command: List[str],
+    cwd: str,
+    *,
+    php_bin: Optional[str] = None,
+    php_ini_settings: Optional[Dict[str, str]] = None,
+    metrics_hooks: Iterable[MetricsHook] = (),
+    timeout: Optional[float] = None,
+) -> str:
+    """Run command asynchronously and get output.
+
+    See execute_async for timeout.
+    """
+    return await execute_async(
+        get_command(command, php_bin, php_ini_settings),
+        cwd,
+        subcommand=get_subcommand(command),
+        metrics_hooks=metrics_hooks,
+        timeout=timeout,
+    )
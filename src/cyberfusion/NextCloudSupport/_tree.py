@@ -0,0 +1,26 @@
+"""Functions to copy and link code trees."""
+
+import subprocess
+from typing import List
+
+# Files in the code directory that NextCloud writes to in place, so that they
+# are copied instead of hardlinked
+
+WRITABLE_FILES = [".htaccess", ".user.ini"]
+
+
+def copy(sources: List[str], destination: str, *, hardlink: bool = False) -> None:
+    """Copy files and directories into destination directory.
+
+    Copies are reflinks when the filesystem supports it, or hardlinks if
+    hardlink is set.
+    """
+    if not sources:
+        return
+
+    subprocess.run(
+        ["cp", "-a", "-l" if hardlink else "--reflink=auto"]
+        + sources
+        + [destination + "/"],
+        check=True,
+    )
@@ -0,0 +1,461 @@
+"""Long-lived `occ` worker.
+
+Booting NextCloud (autoloader, config, database connection) dominates the
+runtime of most `occ` commands. The worker boots NextCloud's console
+application once, and then runs commands sent to it over stdin. Results are
+written to stdout as JSON lines.
+
+As NextCloud is booted once, state that is read when booting can become
+stale when it is changed by other processes. Therefore, the worker is
+restarted when the config, `version.php` or apps directories change (see
+_filesystem.get_fingerprint), and the app config cache is cleared before
+every command. Other state (e.g. the user cache) is not reloaded.
+"""
+
+import json
+import select
+import subprocess
+import tempfile
+import threading
+import time
+from typing import IO, Dict, Iterable, List, Optional
+
+from cyberfusion.NextCloudSupport import _filesystem
+from cyberfusion.NextCloudSupport._occ import (
+    get_php_bin,
+    get_php_ini_arguments,
+    get_subcommand,
+    get_wait_interval,
+    is_expired,
+    kill_process_group,
+)
+from cyberfusion.NextCloudSupport.exceptions import (
+    CommandCancelledError,
+    CommandFailedError,
+    CommandTimeoutError,
+)
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics, MetricsHook, emit
+
+# After these commands, the set of available commands or loaded apps may have
+# changed. As the worker loads commands once, it is restarted after running them.
+
+RESTART_COMMANDS = {
+    "app:disable",
+    "app:enable",
+    "app:install",
+    "app:remove",
+    "app:update",
+    "maintenance:install",
+    "maintenance:mode",
+    "maintenance:repair",
+    "upgrade",
+}
+
+# The worker exits by itself when idle for longer than its idle timeout plus
+# this grace period. The grace period prevents a race between the worker
+# exiting, and a command being sent to it.
+
+IDLE_TIMEOUT_GRACE = 5
+
+WORKER_CODE = """
+define('OC_CONSOLE', 1);
+
+require_once getcwd() . '/lib/base.php';
+
+use OC\\Console\\Application;
+use Symfony\\Component\\Console\\Input\\ArgvInput;
+use Symfony\\Component\\Console\\Output\\BufferedOutput;
+use Symfony\\Component\\Console\\Output\\ConsoleOutputInterface;
+use Symfony\\Component\\Console\\Output\\ConsoleSectionOutput;
+use Symfony\\Component\\Console\\Output\\OutputInterface;
+
+class BufferedConsoleOutput extends BufferedOutput implements ConsoleOutputInterface {
+    private ?OutputInterface $errorOutput = null;
+
+    public function getErrorOutput(): OutputInterface {
+        return $this->errorOutput ??= new BufferedOutput();
+    }
+
+    public function setErrorOutput(OutputInterface $error): void {
+        $this->errorOutput = $error;
+    }
+
+    public function section(): ConsoleSectionOutput {
+        throw new LogicException('Sections are not supported');
+    }
+}
+
+// Output of loading commands (e.g. of apps that fail to load) is discarded
+
+$application = \\OCP\\Server::get(Application::class);
+$application->loadCommands(new ArgvInput(['occ']), new BufferedConsoleOutput());
+
+// Running a command must not exit the worker
+
+$property = new ReflectionProperty($application, 'application');
+$property->setAccessible(true);
+$property->getValue($application)->setAutoExit(false);
+
+$idleTimeout = (int) $argv[1];
+
+while (true) {
+    $read = [STDIN];
+    $write = null;
+    $except = null;
+
+    if (stream_select($read, $write, $except, $idleTimeout) === 0) {
+        break;
+    }
+
+    $line = fgets(STDIN);
+
+    if ($line === false) {
+        break;
+    }
+
+    $request = json_decode($line, true);
+
+    // App config may have been changed by other processes
+
+    $appConfig = \\OCP\\Server::get(\\OCP\\IAppConfig::class);
+
+    if (method_exists($appConfig, 'clearCache')) {
+        $appConfig->clearCache();
+    }
+
+    $output = new BufferedConsoleOutput();
+
+    ob_start();
+
+    try {
+        $returnCode = $application->run(
+            new ArgvInput(array_merge(['occ'], $request['command'])),
+            $output
+        );
+    } catch (Throwable $e) {
+        $output->getErrorOutput()->writeln((string) $e);
+
+        $returnCode = 1;
+    }
+
+    $stdout = ob_get_clean() . $output->fetch();
+
+    fwrite(STDOUT, json_encode([
+        'return_code' => $returnCode,
+        'stdout' => $stdout,
+        'stderr' => $output->getErrorOutput()->fetch(),
+    ], JSON_INVALID_UTF8_SUBSTITUTE) . PHP_EOL);
+    fflush(STDOUT);
+}
+"""
+
+
+class Worker:
+    """Represents long-lived `occ` process for instance.
+
+    The process is started when the first command is run, and restarted
+    automatically when it crashed or exited because it was idle.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        idle_timeout: int = 300,
+        php_bin: Optional[str] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+        metrics_hooks: Iterable[MetricsHook] = (),
+    ) -> None:
+        """Set attributes.
+
+        php_bin defaults to PHP on PATH. php_ini_settings apply to all commands,
+        as they are run by the same process.
+        """
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self._php_bin = php_bin
+        self.php_ini_settings = php_ini_settings
+        self.metrics_hooks = metrics_hooks
+
+        self._process: Optional[subprocess.Popen] = None
+        self._stderr: Optional[IO[bytes]] = None
+        self._fingerprint: List[Optional[float]] = []
+        self._last_used_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def php_bin(self) -> str:
+        """Get path to PHP binary."""
+        return self._php_bin or get_php_bin()
+
+    @property
+    def is_running(self) -> bool:
+        """Get if process is running."""
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self) -> None:
+        """Start process."""
+        self._stderr = tempfile.TemporaryFile()
+
+        self._process = subprocess.Popen(
+            [self.php_bin]
+            + get_php_ini_arguments(self.php_ini_settings)
+            + ["-r", WORKER_CODE, str(self.idle_timeout + IDLE_TIMEOUT_GRACE)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+            text=True,
+            cwd=self.path,
+            start_new_session=True,
+        )
+
+    def stop(self) -> None:
+        """Stop process.
+
+        Closing stdin makes the process exit after finishing the current command.
+        """
+        if self._process is None:
+            return
+
+        if self._process.stdin:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+        if self._process.stdout:
+            self._process.stdout.close()
+
+        if self._stderr:
+            self._stderr.close()
+
+        self._process = None
+        self._stderr = None
+
+    def _read_stderr(self) -> str:
+        """Get stderr of crashed process."""
+        if not self._stderr:
+            return ""
+
+        self._stderr.seek(0)
+
+        return self._stderr.read().decode(errors="replace")
+
+    def _emit_metrics(
+        self,
+        command: List[str],
+        started_at: float,
+        *,
+        return_code: int,
+        output_size: int,
+    ) -> None:
+        """Call metrics hooks for command.
+
+        As the process runs multiple commands, its resource usage is unknown.
+        """
+        emit(
+            CommandMetrics(
+                path=self.path,
+                command=[self.php_bin, "occ", "--no-interaction"] + command,
+                subcommand=get_subcommand(command),
+                wall_time=time.monotonic() - started_at,
+                cpu_time=None,
+                max_rss=None,
+                return_code=return_code,
+                output_size=output_size,
+            ),
+            self.metrics_hooks,
+        )
+
+    def _readline(
+        self, deadline: Optional[float], cancel_event: Optional[threading.Event]
+    ) -> Optional[str]:
+        """Read line from process, or get None if deadline passed or cancelled."""
+        assert self._process is not None
+        assert self._process.stdout is not None
+
+        while not is_expired(deadline, cancel_event):
+            # The process writes a single line per command, so nothing is
+            # buffered when waiting for the next one
+
+            readable, _, _ = select.select(
+                [self._process.stdout],
+                [],
+                [],
+                get_wait_interval(deadline, cancel_event),
+            )
+
+            if readable:
+                return self._process.stdout.readline()
+
+        return None
+
+    def run_command(
+        self,
+        command: List[str],
+        *,
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> str:
+        """Run command and get output.
+
+        Behaves like `run_command`: the output is returned, and CommandFailedError
+        is raised when the command fails, or when the process crashed while
+        running it.
+
+        When the command runs longer than timeout seconds, or cancel_event is
+        set, the process (group) is killed, and CommandTimeoutError or
+        CommandCancelledError is raised. Its stdout is empty, as the process
+        only writes output when the command finishes.
+        """
+        full_command = [self.php_bin, "occ", "--no-interaction"] + command
+
+        with self._lock:
+            fingerprint = _filesystem.get_fingerprint(self.path)
+
+            # Restart when idle for too long, or when the instance changed
+
+            if self.is_running and (
+                time.monotonic() - self._last_used_at >= self.idle_timeout
+                or fingerprint != self._fingerprint
+            ):
+                self.stop()
+
+            if not self.is_running:
+                self.stop()  # Clean up crashed process, if any
+                self._start()
+
+                self._fingerprint = fingerprint
+
+            assert self._process is not None
+            assert self._process.stdin is not None
+            assert self._process.stdout is not None
+
+            started_at = time.monotonic()
+
+            deadline = started_at + timeout if timeout is not None else None
+
+            try:
+                self._process.stdin.write(
+                    json.dumps({"command": ["--no-interaction"] + command}) + "\n"
+                )
+                self._process.stdin.flush()
+
+                line = self._readline(deadline, cancel_event)
+            except BrokenPipeError:
+                line = ""
+
+            if line is None:
+                kill_process_group(self._process.pid)
+
+                return_code = self._process.wait()
+                stderr = self._read_stderr()
+
+                self.stop()
+
+                self._emit_metrics(
+                    command,
+                    started_at,
+                    return_code=return_code,
+                    output_size=len(stderr),
+                )
+
+                if cancel_event and cancel_event.is_set():
+                    raise CommandCancelledError(
+                        return_code=return_code,
+                        stdout="",
+                        stderr=stderr,
+                        command=full_command,
+                    )
+
+                assert timeout is not None
+
+                raise CommandTimeoutError(
+                    return_code=return_code,
+                    stdout="",
+                    stderr=stderr,
+                    command=full_command,
+                    timeout=timeout,
+                )
+
+            if not line:
+                return_code = self._process.wait()
+                stderr = self._read_stderr()
+
+                self.stop()
+
+                self._emit_metrics(
+                    command,
+                    started_at,
+                    return_code=return_code,
+                    output_size=len(stderr),
+                )
+
+                raise CommandFailedError(
+                    return_code=return_code,
+                    stdout="",
+                    stderr=stderr,
+                    command=full_command,
+                )
+
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                result = None
+
+            # Output other than the result (e.g. PHP notices written to stdout)
+            # leaves the process out of sync, so it is stopped
+
+            if not isinstance(result, dict):
+                kill_process_group(self._process.pid)
+
+                return_code = self._process.wait()
+                stderr = self._read_stderr()
+
+                self.stop()
+
+                self._emit_metrics(
+                    command,
+                    started_at,
+                    return_code=return_code,
+                    output_size=len(line) + len(stderr),
+                )
+
+                raise CommandFailedError(
+                    return_code=return_code,
+                    stdout=line,
+                    stderr=stderr,
+                    command=full_command,
+                )
+
+            self._last_used_at = time.monotonic()
+
+            # Changes made by the command itself are loaded by the process
+
+            self._fingerprint = _filesystem.get_fingerprint(self.path)
+
+            self._emit_metrics(
+                command,
+                started_at,
+                return_code=result["return_code"],
+                output_size=len(result["stdout"]) + len(result["stderr"]),
+            )
+
+            if command and command[0] in RESTART_COMMANDS:
+                self.stop()
+
+        if result["return_code"] != 0:
+            raise CommandFailedError(
+                return_code=result["return_code"],
+                stdout=result["stdout"],
+                stderr=result["stderr"],
+                command=full_command,
+            )
+
+        return result["stdout"].rstrip()
@@ -1,17 +1,62 @@
 """App."""
 
-import os
 import re
-import tarfile
-from typing import TYPE_CHECKING, Optional, Tuple
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from cyberfusion.Common import download_from_url
-from cyberfusion.NextCloudSupport._occ import run_command
+from cyberfusion.NextCloudSupport._archive import extract_app_from_url
 from cyberfusion.NextCloudSupport.exceptions import AppNotInstalledError
 
 if TYPE_CHECKING:  # pragma: no cover
     from cyberfusion.NextCloudSupport.instance import Instance
 
+APP_UPDATE_REGEX = re.compile("^(.*) new version available: (.*)$")
+
+
+@dataclass
+class AppRecord:
+    """Installed app in app index.
+
+    is_enabled is None when unknown, i.e. when the index was built from the
+    filesystem.
+    """
+
+    name: str
+    version: str
+    is_enabled: Optional[bool]
+
+
+def _get_app_index(raw_app_list: dict) -> Dict[str, AppRecord]:
+    """Get installed apps by name from `app:list` output."""
+    result = {}
+
+    for key, is_enabled in [("enabled", True), ("disabled", False)]:
+        for name, version in raw_app_list[key].items():
+            # Sometimes, NextCloud suffixes the version by another version number.
+            # It's unclear why or when, but we don't want it.
+            # Code: https://github.com/nextcloud/server/blob/72b6db40435ce0407d0aafa626945d4f2380460f/core/Command/App/ListApps.php#L91
+
+            result[name] = AppRecord(
+                name=name, version=version.split(" ")[0], is_enabled=is_enabled
+            )
+
+    return result
+
+
+def _get_available_app_updates(raw_app_update_list: List[str]) -> Dict[str, str]:
+    """Get versions that apps can be updated to from `app:update --showonly` output."""
+    result = {}
+
+    for line in raw_app_update_list:
+        match = APP_UPDATE_REGEX.fullmatch(line)
+
+        if not match:
+            continue
+
+        result[match.group(1)] = match.group(2)
+
+    return result
+
 
 class App:
     """Represents app."""
@@ -41,44 +86,57 @@ class App:
         Note that installing apps from a specific URL is not officially
         supported, and the way we do it is undocumented, and therefore
         a hack.
+
+        When installing by URL, the archive is extracted while downloading,
+        and the app directory is put in place atomically. If the instance has
+        an archive cache, the archive is taken from it.
         """
         if name and url:
             raise ValueError("Specify either name or URL")
 
         if name:
-            run_command(["app:install", name], instance.path)
+            instance.run_command(["app:install", name])
 
             return
 
-        with tarfile.open(download_from_url(url)) as f:
-            name = os.path.commonpath(f.getnames())
-
-            f.extractall(path=os.path.join(instance.path, "apps"))
+        name = extract_app_from_url(url, instance.path, instance.archive_cache)
 
-        run_command(
+        instance.run_command(
             ["app:enable", name],
-            instance.path,
         )
 
     @property
     def is_enabled(self) -> bool:
-        """Get if app is enabled."""
+        """Get if app is enabled.
+
+        Whether apps are enabled is only stored in the database. Unless the app
+        index was read from the database (see Instance.database_reads), it is
+        read using `app:list`, also when filesystem reads are enabled.
+        """
+        record = self.instance.app_index.get(self.name)
+
+        # Apps that are not installed are not enabled
+
+        if record is None:
+            return False
+
+        if record.is_enabled is not None:
+            return record.is_enabled
+
         return self.name in self.instance.raw_app_list["enabled"]
 
     def enable(self) -> None:
         """Enable app."""
-        run_command(
+        self.instance.run_command(
             ["app:enable", self.name],
-            self.instance.path,
         )
 
         self.instance.refresh_raw_app_list()
 
     def disable(self) -> None:
         """Disable app."""
-        run_command(
+        self.instance.run_command(
             ["app:disable", self.name],
-            self.instance.path,
         )
 
         self.instance.refresh_raw_app_list()
@@ -86,26 +144,15 @@ class App:
     @property
     def version(self) -> str:
         """Get version."""
-        for app_name, version in (
-            self.instance.raw_app_list["enabled"]
-            | self.instance.raw_app_list["disabled"]
-        ).items():
-            if app_name != self.name:
-                continue
-
-            # Sometimes, NextCloud suffixes the version by another version number.
-            # It's unclear why or when, but we don't want it.
-            # Code: https://github.com/nextcloud/server/blob/72b6db40435ce0407d0aafa626945d4f2380460f/core/Command/App/ListApps.php#L91
-
-            return version.split(" ")[0]
-
-        raise AppNotInstalledError
+        try:
+            return self.instance.app_index[self.name].version
+        except KeyError:
+            raise AppNotInstalledError
 
     def remove(self) -> None:
         """Remove app."""
-        run_command(
+        self.instance.run_command(
             ["app:remove", self.name],
-            self.instance.path,
         )
 
         self.instance.refresh_raw_app_list()
@@ -114,9 +161,8 @@ class App:
         """Update app."""
         old_version = self.version
 
-        run_command(
+        self.instance.run_command(
             ["app:update", self.name],
-            self.instance.path,
         )
 
         self.instance.refresh_raw_app_list()
@@ -129,18 +175,7 @@ class App:
     @property
     def available_version(self) -> Optional[str]:
         """Get version that app can be updated to."""
-        for line in self.instance.raw_app_update_list:
-            match = re.fullmatch("^(.*) new version available: (.*)$", line)
-
-            if not match:
-                continue
-
-            if match.group(1) != self.name:
-                continue
-
-            return match.group(2)
-
-        return None
+        return self.instance.available_app_updates.get(self.name)
 
     def __str__(self) -> str:
         """Get string representation."""
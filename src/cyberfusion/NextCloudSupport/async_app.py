@@ -0,0 +1,106 @@
+"""App, with asynchronous methods."""
+
+import asyncio
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from cyberfusion.NextCloudSupport._archive import extract_app_from_url
+from cyberfusion.NextCloudSupport.exceptions import AppNotInstalledError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from cyberfusion.NextCloudSupport.async_instance import AsyncInstance
+
+
+class AsyncApp:
+    """Represents app, with asynchronous methods.
+
+    Mirrors App.
+    """
+
+    def __init__(
+        self,
+        instance: "AsyncInstance",
+        name: str,
+    ) -> None:
+        """Set attributes."""
+        self.instance = instance
+        self.name = name
+
+    @staticmethod
+    async def install(
+        instance: "AsyncInstance",
+        name: Optional[str] = None,
+        url: Optional[str] = None,
+    ) -> None:
+        """Install app by name or URL.
+
+        See App.install.
+        """
+        if name and url:
+            raise ValueError("Specify either name or URL")
+
+        if name:
+            await instance.run_command(["app:install", name])
+
+            return
+
+        name = await asyncio.to_thread(
+            extract_app_from_url, url, instance.path, instance.archive_cache
+        )
+
+        await instance.run_command(
+            ["app:enable", name],
+        )
+
+    async def is_enabled(self) -> bool:
+        """Get if app is enabled."""
+        return self.name in (await self.instance.raw_app_list())["enabled"]
+
+    async def enable(self) -> None:
+        """Enable app."""
+        await self.instance.run_command(
+            ["app:enable", self.name],
+        )
+
+        self.instance.refresh_raw_app_list()
+
+    async def disable(self) -> None:
+        """Disable app."""
+        await self.instance.run_command(
+            ["app:disable", self.name],
+        )
+
+        self.instance.refresh_raw_app_list()
+
+    async def version(self) -> str:
+        """Get version."""
+        try:
+            return (await self.instance.app_index())[self.name].version
+        except KeyError:
+            raise AppNotInstalledError
+
+    async def remove(self) -> None:
+        """Remove app."""
+        await self.instance.run_command(
+            ["app:remove", self.name],
+        )
+
+        self.instance.refresh_raw_app_list()
+
+    async def update(self) -> Tuple[str, str]:
+        """Update app."""
+        old_version = await self.version()
+
+        await self.instance.run_command(
+            ["app:update", self.name],
+        )
+
+        self.instance.refresh_raw_app_list()
+        self.instance.refresh_raw_app_update_list()
+
+        new_version = await self.version()
+
+        return old_version, new_version
+
+    async def available_version(self) -> Optional[str]:
+        """Get version that app can be updated to."""
+        return (await self.instance.available_app_updates()).get(self.name)
@@ -0,0 +1,493 @@
+"""Instance, with asynchronous methods."""
+
+import asyncio
+import json
+import os
+import tempfile
+import weakref
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Tuple, Union
+
+from cyberfusion.NextCloudSupport._occ import (
+    get_fast_cli_php_ini_settings,
+    get_php_bin,
+    execute_async,
+    run_command_async,
+)
+from cyberfusion.NextCloudSupport.app import (
+    AppRecord,
+    _get_app_index,
+    _get_available_app_updates,
+)
+from cyberfusion.NextCloudSupport.async_app import AsyncApp
+from cyberfusion.NextCloudSupport.cache import ArchiveCache
+from cyberfusion.NextCloudSupport.exceptions import AppNotInstalledError
+from cyberfusion.NextCloudSupport.instance import (
+    DatabaseType,
+    MailAccountAuthMethod,
+    SSLMode,
+    SystemConfigValue,
+    _get_create_mail_account_command,
+    _get_install_command,
+    _get_set_system_config_command,
+    _get_system_config_changes,
+    _get_user_list_command,
+    _get_user_report_command,
+    _parse_system_config_output,
+    _parse_system_config_value,
+    _parse_update_check_output,
+    _parse_user_list_output,
+    _parse_user_report_output,
+)
+from cyberfusion.NextCloudSupport.metrics import MetricsHook
+from cyberfusion.NextCloudSupport.user import User
+
+# Locks are bound to an event loop, so they are kept per event loop. Locks are
+# referenced by coroutines that hold or wait for them, so they are kept weakly,
+# and removed when unused.
+
+_locks: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, weakref.WeakValueDictionary[str, asyncio.Lock]
+] = weakref.WeakKeyDictionary()
+
+
+def _get_lock(path: str) -> asyncio.Lock:
+    """Get lock for instance.
+
+    The lock is shared by all AsyncInstance objects for the same path, so that
+    commands are never run on the same instance concurrently.
+    """
+    locks = _locks.setdefault(asyncio.get_running_loop(), weakref.WeakValueDictionary())
+
+    return locks.setdefault(os.path.realpath(path), asyncio.Lock())
+
+
+class AsyncInstance:
+    """Represents NextCloud instance, with asynchronous methods.
+
+    Mirrors Instance. Commands are run one at a time per instance.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        archive_cache: Optional[ArchiveCache] = None,
+        metrics_hooks: Optional[List[MetricsHook]] = None,
+        php_bin: Optional[str] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+        fast_cli: bool = False,
+        opcache_directory: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Set attributes.
+
+        See Instance for archive_cache, metrics_hooks, php_bin, php_ini_settings,
+        fast_cli, opcache_directory and timeout.
+        Commands are cancelled by cancelling the calling task.
+        """
+        self.path = path
+        self.archive_cache = archive_cache
+        self.metrics_hooks = metrics_hooks if metrics_hooks is not None else []
+        self._php_bin = php_bin
+        self.php_ini_settings = {
+            **(
+                get_fast_cli_php_ini_settings(path, opcache_directory)
+                if fast_cli
+                else {}
+            ),
+            **(php_ini_settings or {}),
+        }
+        self.timeout = timeout
+
+        self._system_config: Optional[Dict[str, SystemConfigValue]] = None
+        self._raw_app_list: Optional[dict] = None
+        self._app_index: Optional[Dict[str, AppRecord]] = None
+        self._raw_app_update_list: Optional[List[str]] = None
+        self._available_app_updates: Optional[Dict[str, str]] = None
+
+    @property
+    def php_bin(self) -> str:
+        """Get path to PHP binary."""
+        return self._php_bin or get_php_bin()
+
+    async def run_command(
+        self,
+        command: List[str],
+        *,
+        timeout: Optional[float] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Run `occ` command on instance and get output.
+
+        See Instance.run_command.
+        """
+        async with _get_lock(self.path):
+            return await run_command_async(
+                command,
+                self.path,
+                php_bin=self.php_bin,
+                php_ini_settings={**self.php_ini_settings, **(php_ini_settings or {})},
+                metrics_hooks=self.metrics_hooks,
+                timeout=timeout if timeout is not None else self.timeout,
+            )
+
+    @staticmethod
+    async def install(
+        path: str,
+        *,
+        database_host: str,
+        database_name: str,
+        database_username: str,
+        database_password: str,
+        admin_user: str,
+        admin_password: str,
+        database_type: DatabaseType = DatabaseType.MYSQL,
+        php_bin: Optional[str] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Install downloaded NextCloud instance.
+
+        NextCloud must be downloaded before calling this method.
+        """
+        async with _get_lock(path):
+            await run_command_async(
+                _get_install_command(
+                    path,
+                    database_host=database_host,
+                    database_name=database_name,
+                    database_username=database_username,
+                    database_password=database_password,
+                    admin_user=admin_user,
+                    admin_password=admin_password,
+                    database_type=database_type,
+                ),
+                path,
+                php_bin=php_bin,
+                php_ini_settings=php_ini_settings,
+            )
+
+    async def get_app(self, name: str) -> AsyncApp:
+        """Get installed app by name."""
+        if name not in await self.app_index():
+            raise AppNotInstalledError
+
+        return AsyncApp(self, name)
+
+    async def enable_apps(self, names: List[str]) -> None:
+        """Enable apps using a single command."""
+        if not names:
+            return
+
+        try:
+            await self.run_command(["app:enable"] + names)
+        finally:
+            self.refresh_raw_app_list()
+
+    async def disable_apps(self, names: List[str]) -> None:
+        """Disable apps using a single command."""
+        if not names:
+            return
+
+        try:
+            await self.run_command(["app:disable"] + names)
+        finally:
+            self.refresh_raw_app_list()
+
+    async def update_apps(
+        self, names: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, str]]:
+        """Update apps that have an available update, and get versions by name.
+
+        See Instance.update_apps.
+        """
+        available_app_updates = await self.available_app_updates()
+
+        if names is None:
+            names = list(available_app_updates)
+        else:
+            names = [name for name in names if name in available_app_updates]
+
+        if not names:
+            return {}
+
+        app_index = await self.app_index()
+
+        old_versions = {name: app_index[name].version for name in names}
+
+        try:
+            if set(names) == set(available_app_updates):
+                await self.run_command(["app:update", "--all"])
+            else:
+                for name in names:
+                    await self.run_command(["app:update", name])
+        finally:
+            self.refresh_raw_app_list()
+            self.refresh_raw_app_update_list()
+
+        app_index = await self.app_index()
+
+        return {name: (old_versions[name], app_index[name].version) for name in names}
+
+    async def get_system_config(self, name: str) -> SystemConfigValue:
+        """Get system config value by name.
+
+        See Instance.get_system_config.
+        """
+        system_config = await self.system_config()
+
+        if name in system_config:
+            return _parse_system_config_value(system_config[name])
+
+        return _parse_system_config_output(
+            await self.run_command(
+                [
+                    "config:system:get",
+                    name,
+                ],
+            )
+        )
+
+    async def set_system_config(
+        self,
+        name: str,
+        value: Union[str, int, float, bool],
+        index: Optional[int] = None,
+    ) -> None:
+        """Set system config value.
+
+        See Instance.set_system_config.
+        """
+        await self.run_command(_get_set_system_config_command(name, value, index))
+
+        self.refresh_system_config()
+
+    async def set_system_configs(
+        self,
+        values: Mapping[Union[str, Tuple[str, int]], SystemConfigValue],
+    ) -> Dict[str, SystemConfigValue]:
+        """Set multiple system config values using a single command.
+
+        See Instance.set_system_configs.
+        """
+        changes = _get_system_config_changes(await self.system_config(), values)
+
+        if not changes:
+            return changes
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump({"system": changes}, f)
+
+            f.flush()
+
+            await self.run_command(["config:import", f.name])
+
+        self.refresh_system_config()
+
+        return changes
+
+    async def update(self, *, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """Update NextCloud.
+
+        See Instance.update.
+        """
+        old_version = await self.version()
+
+        async with _get_lock(self.path):
+            await execute_async(
+                [self.php_bin, "updater/updater.phar", "--no-interaction"],
+                self.path,
+                subcommand="updater",
+                metrics_hooks=self.metrics_hooks,
+                timeout=timeout if timeout is not None else self.timeout,
+            )
+
+        self.refresh_system_config()
+
+        new_version = await self.version()
+
+        return old_version, new_version
+
+    async def available_version(self) -> Optional[str]:
+        """Get version that instance can be updated to."""
+        return _parse_update_check_output(
+            await self.run_command(
+                [
+                    "update:check",
+                ],
+            )
+        )
+
+    async def version(self) -> str:
+        """Get version."""
+        return await self.get_system_config("version")
+
+    async def create_mail_account(
+        self,
+        *,
+        user_id: str,
+        name: str,
+        email_address: str,
+        imap_hostname: str,
+        imap_port: int,
+        imap_ssl_mode: SSLMode,
+        imap_username: str,
+        imap_password: str,
+        smtp_host: str,
+        smtp_port: int,
+        smtp_ssl_mode: SSLMode,
+        smtp_username: str,
+        smtp_password: str,
+        auth_method: MailAccountAuthMethod,
+    ) -> None:
+        """Create mail account."""
+        await self.run_command(
+            _get_create_mail_account_command(
+                user_id=user_id,
+                name=name,
+                email_address=email_address,
+                imap_hostname=imap_hostname,
+                imap_port=imap_port,
+                imap_ssl_mode=imap_ssl_mode,
+                imap_username=imap_username,
+                imap_password=imap_password,
+                smtp_host=smtp_host,
+                smtp_port=smtp_port,
+                smtp_ssl_mode=smtp_ssl_mode,
+                smtp_username=smtp_username,
+                smtp_password=smtp_password,
+                auth_method=auth_method,
+            )
+        )
+
+    async def users(self) -> List[User]:
+        """Get users."""
+        return [user async for user in self.iter_users()]
+
+    async def iter_users(self, page_size: int = 500) -> AsyncIterator[User]:
+        """Get users, retrieving page_size users at a time."""
+        offset = 0
+
+        while True:
+            output = _parse_user_list_output(
+                await self.run_command(_get_user_list_command(page_size, offset))
+            )
+
+            for id_, name in output.items():
+                yield User(self, id_, name)
+
+            if len(output) < page_size:
+                break
+
+            offset += page_size
+
+    async def user_count(self) -> int:
+        """Get amount of users.
+
+        Before NextCloud 28, users are counted by retrieving them, as counting
+        them using `user:report` scans the data directory, which is slower.
+        """
+        command = _get_user_report_command(await self.version())
+
+        if command is None:
+            return len([user async for user in self.iter_users()])
+
+        return _parse_user_report_output(await self.run_command(command))
+
+    def refresh_system_config(self) -> None:
+        """Clear the system config cache."""
+        self._system_config = None
+
+    async def system_config(self) -> Dict[str, SystemConfigValue]:
+        """Get snapshot of system config.
+
+        See Instance.system_config.
+        """
+        if self._system_config is None:
+            self._system_config = json.loads(
+                await self.run_command(
+                    [
+                        "config:list",
+                        "system",
+                        "--private",
+                        "--output",
+                        "json",
+                    ],
+                )
+            )["system"]
+
+        return self._system_config
+
+    def refresh_raw_app_list(self) -> None:
+        """Clear the raw app list cache."""
+        self._raw_app_list = None
+        self._app_index = None
+
+    def refresh_raw_app_update_list(self) -> None:
+        """Clear the raw app list cache."""
+        self._raw_app_update_list = None
+        self._available_app_updates = None
+
+    async def raw_app_update_list(self) -> List[str]:
+        """Get raw app list output."""
+        if self._raw_app_update_list is None:
+            self._raw_app_update_list = (
+                await self.run_command(
+                    [
+                        "app:update",
+                        "--showonly",
+                    ],
+                )
+            ).splitlines()
+
+        return self._raw_app_update_list
+
+    async def available_app_updates(self) -> Dict[str, str]:
+        """Get versions that apps can be updated to, by name.
+
+        Apps without available update are not included.
+        """
+        if self._available_app_updates is None:
+            self._available_app_updates = _get_available_app_updates(
+                await self.raw_app_update_list()
+            )
+
+        return self._available_app_updates
+
+    async def raw_app_list(self) -> dict:
+        """Get raw app list output."""
+        if self._raw_app_list is None:
+            self._raw_app_list = json.loads(
+                await self.run_command(
+                    [
+                        "app:list",
+                        "--output",
+                        "json",
+                    ],
+                )
+            )
+
+        return self._raw_app_list
+
+    async def app_index(self) -> Dict[str, AppRecord]:
+        """Get installed apps by name.
+
+        Built once per app list refresh.
+        """
+        if self._app_index is None:
+            self._app_index = _get_app_index(await self.raw_app_list())
+
+        return self._app_index
+
+    async def installed_apps(self) -> List[AsyncApp]:
+        """Get installed apps."""
+        result = []
+
+        for name in await self.app_index():
+            app = AsyncApp(
+                self,
+                name,
+            )
+
+            result.append(app)
+
+        return result
@@ -0,0 +1,342 @@
+"""On-disk caches for instance state and archives."""
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator, Optional
+
+from cyberfusion.NextCloudSupport import _filesystem
+from cyberfusion.NextCloudSupport._download import (
+    ProgressCallback,
+    download_to_file,
+    get_sha256,
+    verify_sha256,
+)
+
+
+class Cache:
+    """Represents on-disk cache for instance state.
+
+    Entries are valid as long as they are younger than ttl seconds, and the
+    mtimes of the instance's config, `version.php` and apps directories did not
+    change. The least recently used entries are evicted when there are more
+    than max_entries.
+
+    Note that enabling or disabling apps only changes the database. When done
+    outside this library, the app list is refreshed once the TTL expires.
+
+    As entries may contain secrets (such as the system config), the directory
+    and its files are only accessible by the current user.
+    """
+
+    def __init__(
+        self, directory: str, *, ttl: int = 3600, max_entries: int = 10000
+    ) -> None:
+        """Set attributes."""
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def _get_entry_path(self, instance_path: str, key: str) -> str:
+        """Get path of entry file."""
+        return os.path.join(
+            self.directory,
+            hashlib.sha256(
+                (os.path.realpath(instance_path) + "\0" + key).encode()
+            ).hexdigest()
+            + ".json",
+        )
+
+    def get(self, instance_path: str, key: str) -> Optional[Any]:
+        """Get value, or None if it is not cached, expired or outdated."""
+        path = self._get_entry_path(instance_path, key)
+
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if time.time() - entry["created_at"] > self.ttl:
+            return None
+
+        if entry["fingerprint"] != _filesystem.get_fingerprint(instance_path):
+            return None
+
+        # Mark as recently used
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return entry["value"]
+
+    def set(self, instance_path: str, key: str, value: Any) -> None:
+        """Set value."""
+        entry = {
+            "created_at": time.time(),
+            "fingerprint": _filesystem.get_fingerprint(instance_path),
+            "value": value,
+        }
+
+        # Write atomically, as other processes may read the entry
+
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+
+        os.replace(temporary_path, self._get_entry_path(instance_path, key))
+
+        self._evict()
+
+    def delete(self, instance_path: str, key: str) -> None:
+        """Delete value."""
+        try:
+            os.unlink(self._get_entry_path(instance_path, key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        """Delete least recently used entries when there are too many."""
+        paths = glob.glob(os.path.join(self.directory, "*.json"))
+
+        if len(paths) <= self.max_entries:
+            return
+
+        mtimes = {}
+
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+
+        for path in sorted(mtimes, key=mtimes.__getitem__)[
+            : len(mtimes) - self.max_entries
+        ]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+class ArchiveCache:
+    """Represents on-disk cache for downloaded archives.
+
+    Archives are stored by SHA-256 checksum of their contents (in `blobs/`),
+    and looked up by URL (in `urls/`). Archives are verified against their
+    checksum when used. The least recently used archives are evicted when their
+    total size exceeds max_size bytes.
+
+    The cache may be shared by multiple processes: a URL is downloaded by one
+    process at a time, and archives are not evicted while they are used.
+    """
+
+    def __init__(self, directory: str, *, max_size: int = 10 * 1024**3) -> None:
+        """Set attributes."""
+        self.directory = directory
+        self.max_size = max_size
+
+        for name in ["blobs", "urls", "locks"]:
+            os.makedirs(os.path.join(self.directory, name), mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def _get_url_hash(url: str) -> str:
+        """Get hash of URL, for use in file names."""
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _get_blob_path(self, sha256: str) -> str:
+        """Get path of archive file."""
+        return os.path.join(self.directory, "blobs", sha256.lower())
+
+    def _get_url_path(self, url: str) -> str:
+        """Get path of file containing checksum of archive at URL."""
+        return os.path.join(self.directory, "urls", self._get_url_hash(url) + ".json")
+
+    @contextmanager
+    def _lock_url(self, url: str) -> Iterator[None]:
+        """Lock URL, so that only one process downloads it."""
+        with open(
+            os.path.join(self.directory, "locks", self._get_url_hash(url) + ".lock"),
+            "w",
+        ) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _get_cached_sha256(self, url: str) -> Optional[str]:
+        """Get checksum of cached archive at URL, or None if it is not cached."""
+        try:
+            with open(self._get_url_path(url), "r") as f:
+                sha256 = json.load(f)["sha256"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        if not os.path.isfile(self._get_blob_path(sha256)):
+            return None
+
+        return sha256
+
+    def _download(
+        self,
+        url: str,
+        sha256: Optional[str],
+        progress_callback: Optional[ProgressCallback],
+    ) -> str:
+        """Download archive at URL to cache, and get its checksum."""
+        fd, temporary_path = tempfile.mkstemp(
+            dir=os.path.join(self.directory, "blobs"), suffix=".tmp"
+        )
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                actual = download_to_file(url, f, progress_callback=progress_callback)
+
+            verify_sha256(temporary_path, actual, sha256)
+
+            os.replace(temporary_path, self._get_blob_path(actual))
+        except BaseException:
+            os.unlink(temporary_path)
+
+            raise
+
+        # Write atomically, as other processes may read the file
+
+        fd, temporary_path = tempfile.mkstemp(
+            dir=os.path.join(self.directory, "urls"), suffix=".tmp"
+        )
+
+        with os.fdopen(fd, "w") as f:
+            json.dump({"url": url, "sha256": actual}, f)
+
+        os.replace(temporary_path, self._get_url_path(url))
+
+        return actual
+
+    def _open_blob(self, sha256: str) -> Optional[BinaryIO]:
+        """Open and lock archive, or get None if it was evicted.
+
+        The archive is locked, so that it is not evicted while used.
+        """
+        path = self._get_blob_path(sha256)
+
+        try:
+            blob = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        fcntl.flock(blob, fcntl.LOCK_SH)
+
+        # Another process may have evicted the archive before it was locked
+
+        try:
+            if os.stat(path).st_ino == os.fstat(blob.fileno()).st_ino:
+                return blob
+        except FileNotFoundError:
+            pass
+
+        blob.close()
+
+        return None
+
+    @contextmanager
+    def get(
+        self,
+        url: str,
+        *,
+        sha256: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Iterator[str]:
+        """Get path to archive at URL, downloading it if it is not cached.
+
+        If sha256 is set, and the cached archive has another checksum (e.g.
+        because the URL points to the latest version), it is downloaded again.
+
+        The path is only valid within the context.
+        """
+        blob = None
+
+        with self._lock_url(url):
+            cached_sha256 = self._get_cached_sha256(url)
+
+            if cached_sha256 is not None and (
+                sha256 is None or cached_sha256.lower() == sha256.lower()
+            ):
+                blob = self._open_blob(cached_sha256)
+
+                # Verify integrity, as the archive may have been corrupted
+
+                if blob is not None and get_sha256(blob.name) != cached_sha256:
+                    blob.close()
+                    blob = None
+
+                    os.unlink(self._get_blob_path(cached_sha256))
+
+                if blob is not None:
+                    os.utime(blob.name)  # Mark as recently used
+
+            while blob is None:
+                blob = self._open_blob(self._download(url, sha256, progress_callback))
+
+        try:
+            self._evict()
+
+            yield str(blob.name)
+        finally:
+            blob.close()
+
+    def _evict(self) -> None:
+        """Delete least recently used archives when they are too large.
+
+        Archives that are in use are skipped.
+        """
+        sizes = {}
+        mtimes = {}
+
+        for path in glob.glob(os.path.join(self.directory, "blobs", "*")):
+            if path.endswith(".tmp"):
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            sizes[path] = stat.st_size
+            mtimes[path] = stat.st_mtime
+
+        total_size = sum(sizes.values())
+
+        for path in sorted(mtimes, key=mtimes.__getitem__):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                blob = open(path, "rb")
+            except FileNotFoundError:
+                continue
+
+            with blob:
+                try:
+                    fcntl.flock(blob, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+            total_size -= sizes[path]
@@ -0,0 +1,392 @@
+"""Code store, from which instances share their code.
+
+Every instance normally has its own copy of the NextCloud code, although the
+code is the same for instances of the same release. Instead, the code of every
+release is extracted once into a code store, and instances consist of
+hardlinks to it. Only the config, data directory, apps that are not shipped
+with NextCloud (e.g. installed from the app store), and files that NextCloud
+writes to are instance-specific.
+
+Hardlinks are used instead of symlinks, as NextCloud derives its root from
+the resolved path of its code, so it would look for its config in the code
+store. Therefore, the code store and instances must be on the same filesystem.
+
+Files in the code store are read-only, as changing them would change them for
+all instances. Updating instances using the updater (or web updater) is
+therefore not possible, see Instance.update.
+"""
+
+import filecmp
+import os
+import shutil
+import stat
+import tempfile
+from typing import List, Optional
+
+from cyberfusion.NextCloudSupport import _filesystem
+from cyberfusion.NextCloudSupport._archive import extract_zip
+from cyberfusion.NextCloudSupport._download import (
+    ProgressCallback,
+    download,
+    get_published_sha256,
+    get_sha256,
+    verify_sha256,
+)
+from cyberfusion.NextCloudSupport._tree import WRITABLE_FILES, copy
+from cyberfusion.NextCloudSupport.cache import ArchiveCache
+from cyberfusion.NextCloudSupport.exceptions import DirectoryNotEmptyError
+
+URL_ZIP_NEXTCLOUD_RELEASE = (
+    "https://download.nextcloud.com/server/releases/nextcloud-{release}.zip"
+)
+
+# Files and directories in the code that are instance-specific
+
+INSTANCE_NAMES = ["config"] + WRITABLE_FILES
+
+
+def _make_read_only(path: str) -> None:
+    """Remove write permissions from files in directory.
+
+    Instance-specific files and directories are skipped, as they are copied to
+    instances, which write to them. Directories stay writable, so that the tree
+    can be removed.
+    """
+    for root, directories, files in os.walk(path):
+        if root == path:
+            directories[:] = [
+                name for name in directories if name not in INSTANCE_NAMES
+            ]
+            files = [name for name in files if name not in INSTANCE_NAMES]
+
+        for name in files:
+            file_path = os.path.join(root, name)
+
+            mode = os.lstat(file_path).st_mode
+
+            if stat.S_ISREG(mode):
+                os.chmod(file_path, stat.S_IMODE(mode) & ~0o222)
+
+
+class CodeStore:
+    """Represents code store, containing code of NextCloud releases.
+
+    The code of every release is in a directory named after the release (e.g.
+    '29.0.1').
+    """
+
+    def __init__(
+        self, directory: str, *, archive_cache: Optional[ArchiveCache] = None
+    ) -> None:
+        """Set attributes.
+
+        If archive_cache is set, releases are downloaded using it.
+        """
+        self.directory = directory
+        self.archive_cache = archive_cache
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def releases(self) -> List[str]:
+        """Get releases in code store."""
+        return sorted(
+            name for name in os.listdir(self.directory) if not name.startswith(".")
+        )
+
+    def get_path(self, release: str) -> str:
+        """Get path to code of release."""
+        return os.path.join(self.directory, release)
+
+    def _add(self, staging_path: str) -> str:
+        """Move extracted code into place, and get its release.
+
+        When the release was already added (e.g. by another process), the
+        extracted code is removed.
+        """
+        release = _filesystem.get_release(staging_path)
+
+        if release is None:
+            raise ValueError("Archive does not contain NextCloud")
+
+        _make_read_only(staging_path)
+
+        try:
+            os.rename(staging_path, self.get_path(release))
+        except OSError:
+            if not os.path.isdir(self.get_path(release)):
+                raise
+
+            shutil.rmtree(staging_path)
+
+        return release
+
+    def add(
+        self,
+        zip_path: str,
+        *,
+        sha256: Optional[str] = None,
+        threads: int = 4,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> str:
+        """Add release from NextCloud ZIP, and get the release.
+
+        If sha256 is set, the checksum of the ZIP is verified against it. For
+        threads and progress_callback, see Instance.download.
+        """
+        if sha256 is not None:
+            verify_sha256(zip_path, get_sha256(zip_path), sha256)
+
+        staging_path = tempfile.mkdtemp(dir=self.directory, prefix=".")
+
+        try:
+            extract_zip(
+                zip_path,
+                staging_path,
+                strip_prefix="nextcloud/",
+                threads=threads,
+                progress_callback=progress_callback,
+            )
+
+            return self._add(staging_path)
+        finally:
+            if os.path.isdir(staging_path):
+                shutil.rmtree(staging_path)
+
+    def add_release(
+        self,
+        release: str,
+        *,
+        sha256: Optional[str] = None,
+        threads: int = 4,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> str:
+        """Download release (e.g. '29.0.1') from NextCloud if not in code store.
+
+        The checksum is verified against the published checksum, or sha256 if
+        set. Returns the path to the code of the release.
+        """
+        if release in self.releases:
+            return self.get_path(release)
+
+        url = URL_ZIP_NEXTCLOUD_RELEASE.format(release=release)
+
+        if sha256 is None:
+            sha256 = get_published_sha256(url)
+
+        if self.archive_cache:
+            with self.archive_cache.get(
+                url, sha256=sha256, progress_callback=progress_callback
+            ) as zip_path:
+                self.add(zip_path, threads=threads, progress_callback=progress_callback)
+
+            return self.get_path(release)
+
+        fd, zip_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".zip")
+
+        os.close(fd)
+
+        try:
+            download(url, zip_path, sha256=sha256, progress_callback=progress_callback)
+
+            self.add(zip_path, threads=threads, progress_callback=progress_callback)
+        finally:
+            if os.path.exists(zip_path):
+                os.unlink(zip_path)
+
+        return self.get_path(release)
+
+    def get_linked_release(self, instance_path: str) -> Optional[str]:
+        """Get release that instance is linked to, or None if it is not."""
+        release = _filesystem.get_release(instance_path)
+
+        if release is None or release not in self.releases:
+            return None
+
+        try:
+            linked = os.path.samefile(
+                os.path.join(instance_path, "version.php"),
+                os.path.join(self.get_path(release), "version.php"),
+            )
+        except FileNotFoundError:
+            return None
+
+        return release if linked else None
+
+    def _link(self, release: str, destination_path: str, *, copy_names: bool) -> None:
+        """Hardlink code of release into directory.
+
+        If copy_names is set, instance-specific files and directories are
+        copied, otherwise they are skipped.
+        """
+        path = self.get_path(release)
+
+        names = os.listdir(path)
+
+        copy(
+            [os.path.join(path, name) for name in names if name not in INSTANCE_NAMES],
+            destination_path,
+            hardlink=True,
+        )
+
+        if copy_names:
+            copy(
+                [os.path.join(path, name) for name in names if name in INSTANCE_NAMES],
+                destination_path,
+            )
+
+    def link(self, release: str, instance_path: str) -> None:
+        """Lay out code of release in empty directory, like Instance.download.
+
+        The release must be in the code store (see add_release).
+        """
+        if os.listdir(instance_path):
+            raise DirectoryNotEmptyError
+
+        self._link(release, instance_path, copy_names=True)
+
+    def relink(self, instance_path: str, release: str) -> None:
+        """Replace code of linked instance by code of release.
+
+        The config, files that NextCloud writes to, and apps that are not
+        shipped with the current release are kept. Code is linked into a
+        staging directory first, and swapped into place per top-level directory.
+        The instance should be in maintenance mode, and must be upgraded
+        afterwards.
+
+        The replaced code is moved into a directory in the instance directory,
+        which is removed afterwards. If swapping fails, it is kept there.
+        """
+        old_release = self.get_linked_release(instance_path)
+
+        if old_release is None:
+            raise ValueError("Instance is not linked to code store")
+
+        if release not in self.releases:
+            raise ValueError(f"Release '{release}' is not in code store")
+
+        old_names = set(os.listdir(self.get_path(old_release))) - set(INSTANCE_NAMES)
+
+        staging_path = tempfile.mkdtemp(dir=instance_path, prefix=".code-")
+        old_path = tempfile.mkdtemp(dir=instance_path, prefix=".code-old-")
+
+        try:
+            self._link(release, staging_path, copy_names=False)
+
+            new_names = set(os.listdir(staging_path))
+
+            for name in sorted(old_names | new_names):
+                if os.path.lexists(os.path.join(instance_path, name)):
+                    os.rename(
+                        os.path.join(instance_path, name), os.path.join(old_path, name)
+                    )
+
+                if name in new_names:
+                    os.rename(
+                        os.path.join(staging_path, name),
+                        os.path.join(instance_path, name),
+                    )
+        finally:
+            shutil.rmtree(staging_path)
+
+        # Move back apps that are not shipped with either release
+
+        old_apps_path = os.path.join(old_path, "apps")
+        apps_path = os.path.join(instance_path, "apps")
+
+        if os.path.isdir(old_apps_path):
+            for name in os.listdir(old_apps_path):
+                if os.path.lexists(
+                    os.path.join(self.get_path(old_release), "apps", name)
+                ) or os.path.lexists(os.path.join(apps_path, name)):
+                    continue
+
+                os.rename(
+                    os.path.join(old_apps_path, name), os.path.join(apps_path, name)
+                )
+
+        shutil.rmtree(old_path)
+
+    def deduplicate(self, instance_path: str) -> int:
+        """Replace code of existing instance by hardlinks to code store.
+
+        The release of the instance is downloaded if it is not in the code store
+        (see add_release). Only files that are identical to those in the code
+        store are replaced, so modified files are kept. Instance-specific files
+        and directories are skipped.
+
+        Hardlinks share the owner and mode of the code store's files, so
+        replaced files become read-only, and can no longer be changed in place
+        (e.g. by the updater, see Instance.update). Files with another owner,
+        group or mode (other than write permissions) than the code store's
+        files are skipped, as replacing them would change those.
+
+        Returns the amount of bytes saved. Files are replaced atomically, so
+        this can be done while the instance is used.
+        """
+        release = _filesystem.get_release(instance_path)
+
+        if release is None:
+            raise ValueError("Instance does not contain NextCloud")
+
+        path = self.add_release(release)
+
+        # Check up front, so that the instance is not deduplicated partially
+
+        if os.stat(path).st_dev != os.stat(instance_path).st_dev:
+            raise ValueError("Code store and instance must be on same filesystem")
+
+        saved = 0
+
+        for root, directories, files in os.walk(path):
+            relative_path = os.path.relpath(root, path)
+
+            if relative_path == os.curdir:
+                directories[:] = [
+                    name for name in directories if name not in INSTANCE_NAMES
+                ]
+                files = [name for name in files if name not in INSTANCE_NAMES]
+
+            for name in files:
+                source_path = os.path.join(root, name)
+                target_path = os.path.join(instance_path, relative_path, name)
+
+                try:
+                    target_stat = os.lstat(target_path)
+                except FileNotFoundError:
+                    continue
+
+                source_stat = os.lstat(source_path)
+
+                if (
+                    not stat.S_ISREG(target_stat.st_mode)
+                    or not stat.S_ISREG(source_stat.st_mode)
+                    or os.path.samestat(source_stat, target_stat)
+                    or target_stat.st_dev != source_stat.st_dev
+                    or target_stat.st_uid != source_stat.st_uid
+                    or target_stat.st_gid != source_stat.st_gid
+                    or stat.S_IMODE(target_stat.st_mode) & ~0o222
+                    != stat.S_IMODE(source_stat.st_mode) & ~0o222
+                    or not filecmp.cmp(source_path, target_path, shallow=False)
+                ):
+                    continue
+
+                # Link next to target, then rename over it. A file left by an
+                # interrupted run is replaced.
+
+                temporary_path = os.path.join(
+                    os.path.dirname(target_path), f".{name}.dedup"
+                )
+
+                try:
+                    os.unlink(temporary_path)
+                except FileNotFoundError:
+                    pass
+
+                os.link(source_path, temporary_path)
+                os.replace(temporary_path, target_path)
+
+                if target_stat.st_nlink == 1:
+                    saved += target_stat.st_size
+
+        return saved
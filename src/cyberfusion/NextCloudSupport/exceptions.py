@@ -1,7 +1,7 @@
 """Exceptions."""
 
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 
 class DirectoryNotEmptyError(Exception):
@@ -29,3 +29,44 @@ class CommandFailedError(Exception):
     def streams(self) -> str:
         """Combine output streams."""
         return f"Stdout:\n\n{self.stdout}\n\nStderr:\n\n{self.stderr}"
+
+
+@dataclass
+class CommandTimeoutError(CommandFailedError):
+    """Command did not finish within timeout, and was killed.
+
+    stdout and stderr contain the output until the command was killed.
+    """
+
+    timeout: float
+
+
+class CommandCancelledError(CommandFailedError):
+    """Command was cancelled, and was killed.
+
+    stdout and stderr contain the output until the command was killed.
+    """
+
+    pass
+
+
+@dataclass
+class ChecksumMismatchError(Exception):
+    """Checksum of downloaded file does not match expected checksum."""
+
+    path: str
+    expected: str
+    actual: str
+
+
+@dataclass
+class AppVersionUnavailableError(Exception):
+    """Desired version of app is not available from the app store.
+
+    available_version is the version that the app can be updated to (or that
+    the app store installed), if any.
+    """
+
+    name: str
+    version: str
+    available_version: Optional[str]
@@ -0,0 +1,174 @@
+"""Fleet of instances."""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+from cyberfusion.NextCloudSupport import _database, _filesystem
+from cyberfusion.NextCloudSupport.instance import Instance
+
+T = TypeVar("T")
+
+
+@dataclass
+class Result(Generic[T]):
+    """Result of operation on instance.
+
+    When the operation raised an exception (such as CommandFailedError), it is
+    set as error, and value is None.
+    """
+
+    path: str
+    value: Optional[T] = None
+    error: Optional[Exception] = None
+
+    @property
+    def succeeded(self) -> bool:
+        """Get if operation succeeded."""
+        return self.error is None
+
+
+class Fleet:
+    """Represents multiple instances, on which operations run in parallel.
+
+    As `occ` is CPU-bound, max_workers defaults to the amount of CPUs. To avoid
+    overloading database servers, max_workers_per_database_host limits the
+    amount of operations that run concurrently for instances using the same
+    database host. The database host is read from `config/config.php`, so that
+    no command runs outside the limit, unless the config contains anything other
+    than literals.
+
+    Each instance is created by instance_factory, which can be used to pass
+    options (such as use_worker) to Instance.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        *,
+        max_workers: Optional[int] = None,
+        max_workers_per_database_host: Optional[int] = None,
+        instance_factory: Callable[[str], Instance] = Instance,
+    ) -> None:
+        """Set attributes."""
+        self.paths = paths
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_workers_per_database_host = max_workers_per_database_host
+        self.instance_factory = instance_factory
+
+        self._database_host_semaphores: Dict[str, threading.Semaphore] = {}
+        self._database_host_semaphores_lock = threading.Lock()
+
+    def _get_database_host_semaphore(self, instance: Instance) -> threading.Semaphore:
+        """Get semaphore for database host of instance."""
+        config = _filesystem.read_config(instance.path)
+
+        if config is not None:
+            database_host = str(config.get("dbhost", ""))
+        else:
+            database_host = str(instance.get_system_config("dbhost"))
+
+        with self._database_host_semaphores_lock:
+            if database_host not in self._database_host_semaphores:
+                self._database_host_semaphores[database_host] = threading.Semaphore(
+                    self.max_workers_per_database_host  # type: ignore[arg-type]
+                )
+
+            return self._database_host_semaphores[database_host]
+
+    def _run_operation(
+        self, path: str, operation: Callable[[Instance], T]
+    ) -> Result[T]:
+        """Run operation on single instance."""
+        instance: Optional[Instance] = None
+
+        try:
+            instance = self.instance_factory(path)
+
+            if self.max_workers_per_database_host is None:
+                return Result(path=path, value=operation(instance))
+
+            with self._get_database_host_semaphore(instance):
+                return Result(path=path, value=operation(instance))
+        except Exception as e:
+            return Result(path=path, error=e)
+        finally:
+            # Don't keep idle worker around until its idle timeout
+
+            if instance and instance.worker:
+                instance.worker.stop()
+
+    def _iter_results(
+        self, operation: Callable[[Instance], T]
+    ) -> Iterator[Tuple[int, Result[T]]]:
+        """Like iter_results, but yield index of path with every result."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._run_operation, path, operation): index
+                for index, path in enumerate(self.paths)
+            }
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def iter_results(self, operation: Callable[[Instance], T]) -> Iterator[Result[T]]:
+        """Run operation on all instances, and yield results as they complete."""
+        for _, result in self._iter_results(operation):
+            yield result
+
+    def run(self, operation: Callable[[Instance], T]) -> List[Result[T]]:
+        """Run operation on all instances, and get results in order of paths.
+
+        Afterwards, the connections of database reads are closed.
+        """
+        try:
+            results = dict(self._iter_results(operation))
+        finally:
+            _database.dispose_engines()
+
+        return [results[index] for index in range(len(self.paths))]
+
+    def write_inventory(self, f: TextIO) -> Tuple[int, int]:
+        """Write inventory of every instance to file as JSON lines, as they complete.
+
+        Every line is an object with the path, and the inventory (see
+        Instance.inventory) or the error. As instances run in parallel, the
+        commands of every instance run serially.
+
+        The amounts of succeeded and failed instances are returned.
+        """
+        succeeded = failed = 0
+
+        for result in self.iter_results(
+            lambda instance: instance.inventory(max_workers=1)
+        ):
+            f.write(
+                json.dumps(
+                    {
+                        "path": result.path,
+                        "inventory": asdict(result.value) if result.value else None,
+                        "error": repr(result.error) if result.error else None,
+                    }
+                )
+                + "\n"
+            )
+
+            if result.succeeded:
+                succeeded += 1
+            else:
+                failed += 1
+
+        return succeeded, failed
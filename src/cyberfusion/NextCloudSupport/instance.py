@@ -1,27 +1,110 @@
 """Instance."""
 
+import functools
 import json
 import os
 import re
-import shutil
-import subprocess
-import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from enum import StrEnum
-from functools import cached_property
-from typing import List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 
-from cyberfusion.Common import download_from_url
-from cyberfusion.NextCloudSupport._occ import PHP_BIN, run_command
-from cyberfusion.NextCloudSupport.app import App
+from cyberfusion.NextCloudSupport import _database, _filesystem
+from cyberfusion.NextCloudSupport._archive import extract_zip
+from cyberfusion.NextCloudSupport._download import (
+    ProgressCallback,
+    download,
+    get_published_sha256,
+    get_sha256,
+    verify_sha256,
+)
+from cyberfusion.NextCloudSupport._occ import (
+    execute,
+    get_fast_cli_php_ini_settings,
+    get_php_bin,
+    run_command,
+)
+from cyberfusion.NextCloudSupport._worker import Worker
+from cyberfusion.NextCloudSupport.app import (
+    App,
+    AppRecord,
+    _get_app_index,
+    _get_available_app_updates,
+)
+from cyberfusion.NextCloudSupport.cache import ArchiveCache, Cache
+from cyberfusion.NextCloudSupport.code_store import CodeStore
 from cyberfusion.NextCloudSupport.exceptions import (
     AppNotInstalledError,
     CommandFailedError,
     DirectoryNotEmptyError,
 )
+from cyberfusion.NextCloudSupport.metrics import MetricsHook
 from cyberfusion.NextCloudSupport.user import User
 
 URL_ZIP_NEXTCLOUD = "https://download.nextcloud.com/server/releases/latest.zip"
 
+SystemConfigValue = Union[str, int, float, bool, list, dict]
+
+T = TypeVar("T")
+
+_NOT_FOUND = object()
+
+
+class cached_property(functools.cached_property[T]):
+    """Like functools.cached_property, without lock.
+
+    Before Python 3.12, functools.cached_property holds a lock shared by all
+    objects while computing the value. In a Fleet, instances would then run
+    `occ` commands for the same property one at a time.
+
+    Like on Python 3.12, the value may be computed more than once when it is
+    accessed by multiple threads at the same time.
+    """
+
+    def __init__(self, func: Callable[[Any], T]) -> None:
+        """Set attributes."""
+        super().__init__(func)
+
+    @overload
+    def __get__(
+        self, instance: None, owner: Optional[type] = None
+    ) -> "cached_property[T]": ...
+
+    @overload
+    def __get__(self, instance: object, owner: Optional[type] = None) -> T: ...
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        """Get value, computing it when not cached."""
+        if instance is None:
+            return self
+
+        assert self.attrname is not None
+
+        value = instance.__dict__.get(self.attrname, _NOT_FOUND)
+
+        if value is _NOT_FOUND:
+            value = self.func(instance)
+
+            instance.__dict__[self.attrname] = value
+
+        return value
+
 
 class SSLMode(StrEnum):
     """SSL modes."""
@@ -38,6 +121,72 @@ class MailAccountAuthMethod(StrEnum):
     XOAUTH2 = "xoauth2"
 
 
+@dataclass
+class MailAccount:
+    """Mail account to create.
+
+    See Instance.create_mail_account.
+    """
+
+    user_id: str
+    name: str
+    email_address: str
+    imap_hostname: str
+    imap_port: int
+    imap_ssl_mode: SSLMode
+    imap_username: str
+    imap_password: str = field(repr=False)
+    smtp_host: str
+    smtp_port: int
+    smtp_ssl_mode: SSLMode
+    smtp_username: str
+    smtp_password: str = field(repr=False)
+    auth_method: MailAccountAuthMethod
+
+
+@dataclass
+class MailAccountResult:
+    """Result of creating mail account.
+
+    When the account already existed, skipped is set. When creating it failed,
+    error is set.
+    """
+
+    account: MailAccount
+    skipped: bool = False
+    error: Optional[CommandFailedError] = None
+
+    @property
+    def succeeded(self) -> bool:
+        """Get if mail account exists."""
+        return self.error is None
+
+
+@dataclass
+class AppInventory:
+    """App in inventory."""
+
+    name: str
+    version: str
+    is_enabled: bool
+    available_version: Optional[str]
+
+
+@dataclass
+class Inventory:
+    """Snapshot of instance state, see Instance.inventory.
+
+    Consists of basic types only, so `dataclasses.asdict` returns a dict that
+    can be serialized to e.g. JSON or msgpack.
+    """
+
+    path: str
+    version: str
+    available_version: Optional[str]
+    apps: List[AppInventory]
+    user_count: int
+
+
 class DatabaseType(StrEnum):
     """Database types."""
 
@@ -47,46 +196,514 @@ class DatabaseType(StrEnum):
     OCI = "oci"
 
 
+def _get_install_command(
+    path: str,
+    *,
+    database_host: str,
+    database_name: str,
+    database_username: str,
+    database_password: str,
+    admin_user: str,
+    admin_password: str,
+    database_type: DatabaseType,
+) -> List[str]:
+    """Get `occ` command to install NextCloud."""
+    return [
+        "maintenance:install",
+        "--database",
+        database_type,
+        "--database-host",
+        database_host,
+        "--database-name",
+        database_name,
+        "--database-user",
+        database_username,
+        "--database-pass",
+        database_password,
+        "--admin-user",
+        admin_user,
+        "--admin-pass",
+        admin_password,
+        "--data-dir",
+        os.path.join(path, "data"),
+    ]
+
+
+def _parse_system_config_value(value: SystemConfigValue) -> SystemConfigValue:
+    """Parse value from system config snapshot."""
+
+    # JSON encodes PHP arrays with non-sequential integer keys as objects (e.g.
+    # when an item was set by index). These are lists to us.
+
+    if isinstance(value, dict) and value and all(k.isdigit() for k in value):
+        return [value[k] for k in sorted(value, key=int)]
+
+    return value
+
+
+def _parse_system_config_output(output: str) -> SystemConfigValue:
+    """Parse output of `config:system:get`, which does not contain the type."""
+    if output.isdigit():
+        return int(output)
+
+    if output == "true":
+        return True
+
+    if output == "false":
+        return False
+
+    try:
+        return float(output)
+    except ValueError:
+        pass
+
+    return output
+
+
+def _get_set_system_config_command(
+    name: str,
+    value: Union[str, int, float, bool],
+    index: Optional[int] = None,
+) -> List[str]:
+    """Get `occ` command to set system config value."""
+
+    # Set type
+
+    type_ = "string"
+
+    if isinstance(value, int):
+        type_ = "integer"
+
+    if isinstance(value, float):
+        type_ = "float"
+
+    if isinstance(value, bool):
+        type_ = "boolean"
+
+    # Set value
+
+    _value = str(value)
+
+    if isinstance(value, bool):
+        _value = _value.lower()
+
+    # Set command
+
+    command = [
+        "config:system:set",
+        name,
+    ]
+
+    if index is not None:
+        command.append(str(index))
+
+    command.extend(["--value", _value, "--type", type_])
+
+    return command
+
+
+def _set_array_item(
+    array: SystemConfigValue, index: int, value: SystemConfigValue
+) -> Union[list, dict]:
+    """Set item in system config array, like `config:system:set` does by index.
+
+    PHP arrays with non-sequential integer keys are represented as dicts, as
+    that is how JSON encodes them.
+    """
+    if isinstance(array, dict) and not all(k.isdigit() for k in array):
+        return array | {str(index): value}
+
+    items: dict = {}
+
+    if isinstance(array, list):
+        items = dict(enumerate(array))
+    elif isinstance(array, dict):
+        items = {int(k): v for k, v in array.items()}
+
+    items[index] = value
+
+    if sorted(items) == list(range(len(items))):
+        return [items[i] for i in range(len(items))]
+
+    return {str(k): items[k] for k in sorted(items)}
+
+
+def _get_system_config_changes(
+    system_config: Dict[str, SystemConfigValue],
+    values: Mapping[Union[str, Tuple[str, int]], SystemConfigValue],
+) -> Dict[str, SystemConfigValue]:
+    """Get values that differ from system config.
+
+    Keys are names, or (name, index) tuples when manipulating arrays.
+    """
+    new_values: Dict[str, SystemConfigValue] = {}
+
+    for key, value in values.items():
+        if isinstance(key, tuple):
+            name, index = key
+
+            new_values[name] = _set_array_item(
+                new_values.get(name, system_config.get(name, [])),
+                index,
+                value,
+            )
+        else:
+            new_values[key] = value
+
+    # Compare JSON, so that e.g. True and 1 are considered different
+
+    return {
+        name: value
+        for name, value in new_values.items()
+        if name not in system_config
+        or json.dumps(value, sort_keys=True)
+        != json.dumps(system_config[name], sort_keys=True)
+    }
+
+
+def _parse_update_check_output(output: str) -> Optional[str]:
+    """Get available NextCloud version from `update:check` output."""
+    for line in output.splitlines():
+        match = re.fullmatch(
+            "^Nextcloud (.*) is available. Get more information on how to update at (.*).$",
+            line,
+        )
+
+        if not match:
+            continue
+
+        return match.group(1)
+
+    return None
+
+
+def _get_user_list_command(limit: int, offset: int) -> List[str]:
+    """Get command to list page of users."""
+    return [
+        "user:list",
+        "--limit",
+        str(limit),
+        "--offset",
+        str(offset),
+        "--output",
+        "json",
+    ]
+
+
+def _parse_user_list_output(output: str) -> Dict[str, str]:
+    """Get display names by user ID from `user:list` output."""
+    result = json.loads(output)
+
+    # PHP encodes an empty array as a JSON list
+
+    if not result:
+        return {}
+
+    return result
+
+
+def _get_user_report_command(version: str) -> Optional[List[str]]:
+    """Get command to count users, or None if NextCloud is older than 28.
+
+    Unless --disable-dir-scan is passed (added in NextCloud 28), `user:report`
+    also counts user directories, for which it scans the data directory.
+    """
+    if int(version.split(".")[0]) < 28:
+        return None
+
+    return ["user:report", "--disable-dir-scan"]
+
+
+def _parse_user_report_output(output: str) -> int:
+    """Get amount of users from `user:report` output."""
+    match = re.search(r"^\|\s*total users\s*\|\s*(\d+)\s*\|$", output, re.MULTILINE)
+
+    if not match:
+        raise ValueError("Amount of users not found in output")
+
+    return int(match.group(1))
+
+
+def _parse_mail_account_export_output(output: str) -> Set[str]:
+    """Get email addresses from `mail:account:export` output."""
+    return {
+        match.group(1).strip().lower()
+        for match in re.finditer(r"^- E-Mail: (.*)$", output, re.MULTILINE)
+    }
+
+
+def _get_create_mail_account_command(
+    *,
+    user_id: str,
+    name: str,
+    email_address: str,
+    imap_hostname: str,
+    imap_port: int,
+    imap_ssl_mode: SSLMode,
+    imap_username: str,
+    imap_password: str,
+    smtp_host: str,
+    smtp_port: int,
+    smtp_ssl_mode: SSLMode,
+    smtp_username: str,
+    smtp_password: str,
+    auth_method: MailAccountAuthMethod,
+) -> List[str]:
+    """Get `occ` command to create mail account."""
+    return [
+        "mail:account:create",
+        user_id,
+        name,
+        email_address,
+        imap_hostname,
+        str(imap_port),
+        imap_ssl_mode,
+        imap_username,
+        imap_password,
+        smtp_host,
+        str(smtp_port),
+        smtp_ssl_mode,
+        smtp_username,
+        smtp_password,
+        auth_method,
+    ]
+
+
 class Instance:
     """Represents NextCloud instance."""
 
-    def __init__(self, path: str) -> None:
-        """Set attributes."""
+    def __init__(
+        self,
+        path: str,
+        *,
+        use_worker: bool = False,
+        worker_idle_timeout: int = 300,
+        cache: Optional[Cache] = None,
+        filesystem_reads: bool = False,
+        database_reads: bool = False,
+        archive_cache: Optional[ArchiveCache] = None,
+        metrics_hooks: Optional[List[MetricsHook]] = None,
+        php_bin: Optional[str] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+        fast_cli: bool = False,
+        opcache_directory: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        code_store: Optional[CodeStore] = None,
+    ) -> None:
+        """Set attributes.
+
+        If use_worker is set, commands are run by a long-lived `occ` process, so
+        NextCloud is booted once instead of for every command. The process exits
+        after being idle for worker_idle_timeout seconds, and is started again
+        when needed. It is also restarted when the config or apps directories
+        change, and reloads app config for every command. Other state cached
+        by NextCloud (e.g. users) may be stale after changes by other processes.
+
+        If cache is set, the system config (including version) and app list are
+        cached on disk, so they persist across Instance objects and processes.
+
+        If filesystem_reads is set, the version and installed apps (and their
+        versions) are read from files, without running `occ`. When the files are
+        ambiguous, `occ` is used. Whether apps are enabled is not stored in
+        files, so it is still read using `occ`, unless database_reads is set.
+
+        If database_reads is set, installed apps (and their state and versions),
+        app config values and users are read from the database, using the
+        credentials in the config, without running `occ`. This requires
+        SQLAlchemy, and the driver for the database. When the database can't be
+        read from, or users are stored elsewhere (e.g. LDAP), `occ` is used.
+
+        If archive_cache is set, app archives installed by URL are downloaded
+        once, and reused for other instances.
+
+        metrics_hooks are called with metrics of every command run on this
+        instance, in addition to global hooks (see metrics.add_hook).
+
+        php_bin is the path to the PHP binary, e.g. of a specific PHP version.
+        It defaults to PHP on PATH.
+
+        php_ini_settings (e.g. {'memory_limit': '2G'}) are passed to PHP for
+        `occ` commands, in addition to DEFAULT_PHP_INI_SETTINGS.
+
+        If fast_cli is set, OPcache is enabled for `occ` commands, with a file
+        cache in opcache_directory, so that NextCloud is not compiled for every
+        command. See get_fast_cli_php_ini_settings.
+
+        If timeout is set, commands that run longer than timeout seconds are
+        killed (including their child processes), and CommandTimeoutError is
+        raised. When cancel_event is set, running commands are killed, and
+        CommandCancelledError is raised.
+
+        If code_store is set and the instance is linked to it, the instance is
+        updated using it (see update).
+        """
         self.path = path
+        self.cache = cache
+        self.archive_cache = archive_cache
+        self.metrics_hooks = metrics_hooks if metrics_hooks is not None else []
+        self._php_bin = php_bin
+        self.php_ini_settings = {
+            **(
+                get_fast_cli_php_ini_settings(path, opcache_directory)
+                if fast_cli
+                else {}
+            ),
+            **(php_ini_settings or {}),
+        }
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.code_store = code_store
+        self.filesystem_reads = filesystem_reads
+        self.database_reads = database_reads
+
+        self.worker: Optional[Worker] = None
+
+        if use_worker:
+            self.worker = Worker(
+                path,
+                idle_timeout=worker_idle_timeout,
+                php_bin=php_bin,
+                php_ini_settings=self.php_ini_settings,
+                metrics_hooks=self.metrics_hooks,
+            )
+
+    @property
+    def php_bin(self) -> str:
+        """Get path to PHP binary."""
+        return self._php_bin or get_php_bin()
+
+    def run_command(
+        self,
+        command: List[str],
+        *,
+        timeout: Optional[float] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Run `occ` command on instance and get output.
+
+        timeout defaults to the instance's timeout. php_ini_settings are merged
+        with the instance's. As the worker's settings cannot be changed, commands
+        with php_ini_settings are not run by the worker.
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        if self.worker and not php_ini_settings:
+            return self.worker.run_command(
+                command, timeout=timeout, cancel_event=self.cancel_event
+            )
+
+        return run_command(
+            command,
+            self.path,
+            php_bin=self.php_bin,
+            php_ini_settings={**self.php_ini_settings, **(php_ini_settings or {})},
+            metrics_hooks=self.metrics_hooks,
+            timeout=timeout,
+            cancel_event=self.cancel_event,
+        )
+
+    def _get_cached(self, key: str, function: Callable[[], T]) -> T:
+        """Get value from on-disk cache, or from function when not cached."""
+        if not self.cache:
+            return function()
+
+        value = self.cache.get(self.path, key)
+
+        if value is None:
+            value = function()
+
+            self.cache.set(self.path, key, value)
+
+        return value
+
+    def _delete_cached(self, key: str) -> None:
+        """Delete value from on-disk cache."""
+        if not self.cache:
+            return
+
+        self.cache.delete(self.path, key)
 
     @staticmethod
-    def download(destination_path: str, zip_path: Optional[str] = None) -> None:
+    def download(
+        destination_path: str,
+        zip_path: Optional[str] = None,
+        *,
+        sha256: Optional[str] = None,
+        threads: int = 4,
+        progress_callback: Optional[ProgressCallback] = None,
+        archive_cache: Optional[ArchiveCache] = None,
+    ) -> None:
         """Download NextCloud to path.
 
-        If zip_path is not set, NextCloud is downloaded from their website.
+        If zip_path is not set, NextCloud is downloaded from their website, and
+        its checksum is verified against the published checksum while
+        downloading. If sha256 is set, the checksum is verified against it
+        instead (also when zip_path is set).
+
+        Files are extracted straight to their final path (without the
+        `nextcloud/` directory), by multiple threads.
+
+        progress_callback is called with the stage ('download' or 'extract'), the
+        processed amount of bytes, and the total amount of bytes.
+
+        If archive_cache is set, the ZIP is downloaded once, and reused as long
+        as its checksum matches the published checksum (or sha256).
         """
         if os.listdir(destination_path):
             raise DirectoryNotEmptyError
 
-        # Downlaod ZIP from NextCloud if not specified
-
-        if zip_path is None:
-            zip_path = download_from_url(
-                URL_ZIP_NEXTCLOUD,
-                root_directory=destination_path,
+        def _extract(zip_path: str) -> None:
+            extract_zip(
+                zip_path,
+                destination_path,
+                strip_prefix="nextcloud/",
+                threads=threads,
+                progress_callback=progress_callback,
             )
 
-        # Extract ZIP
+        if zip_path is not None:
+            if sha256 is not None:
+                verify_sha256(zip_path, get_sha256(zip_path), sha256)
 
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(destination_path)
+            _extract(zip_path)
 
-        # Move files from nextcloud/ to destination directory
+            return
 
-        temp_directory = os.path.join(
-            destination_path,
-            "nextcloud",
-        )
+        if sha256 is None:
+            sha256 = get_published_sha256(URL_ZIP_NEXTCLOUD)
+
+        # Get ZIP from cache, downloading it if needed
+
+        if archive_cache:
+            with archive_cache.get(
+                URL_ZIP_NEXTCLOUD, sha256=sha256, progress_callback=progress_callback
+            ) as zip_path:
+                _extract(zip_path)
 
-        for file_ in os.listdir(temp_directory):
-            shutil.move(os.path.join(temp_directory, file_), destination_path)
+            return
 
-        os.rmdir(temp_directory)
+        # Download ZIP from NextCloud
+
+        fd, zip_path = tempfile.mkstemp(dir=destination_path, prefix=".", suffix=".zip")
+
+        os.close(fd)
+
+        # Remove partial ZIP on failure, so that the directory can be retried
+
+        try:
+            download(
+                URL_ZIP_NEXTCLOUD,
+                zip_path,
+                sha256=sha256,
+                progress_callback=progress_callback,
+            )
+
+            _extract(zip_path)
+        finally:
+            if os.path.exists(zip_path):
+                os.unlink(zip_path)
 
     @staticmethod
     def install(
@@ -99,76 +716,134 @@ class Instance:
         admin_user: str,
         admin_password: str,
         database_type: DatabaseType = DatabaseType.MYSQL,
+        php_bin: Optional[str] = None,
+        php_ini_settings: Optional[Dict[str, str]] = None,
     ) -> None:
         """Install downloaded NextCloud instance.
 
         NextCloud must be downloaded before calling this method.
         """
         run_command(
-            [
-                "maintenance:install",
-                "--database",
-                database_type,
-                "--database-host",
-                database_host,
-                "--database-name",
-                database_name,
-                "--database-user",
-                database_username,
-                "--database-pass",
-                database_password,
-                "--admin-user",
-                admin_user,
-                "--admin-pass",
-                admin_password,
-                "--data-dir",
-                os.path.join(path, "data"),
-            ],
+            _get_install_command(
+                path,
+                database_host=database_host,
+                database_name=database_name,
+                database_username=database_username,
+                database_password=database_password,
+                admin_user=admin_user,
+                admin_password=admin_password,
+                database_type=database_type,
+            ),
             path,
+            php_bin=php_bin,
+            php_ini_settings=php_ini_settings,
         )
 
     def get_app(self, name: str) -> App:
         """Get installed app by name."""
-        for app in self.installed_apps:
-            if name != app.name:
-                continue
-
-            return app
-
-        raise AppNotInstalledError
-
-    def get_system_config(
-        self, name: str
-    ) -> Union[
-        str,
-        int,
-        float,
-        bool,
-    ]:
-        """Get system config value by name."""
-        output = run_command(
-            [
-                "config:system:get",
-                name,
-            ],
-            self.path,
+        if name not in self.app_index:
+            raise AppNotInstalledError
+
+        return App(self, name)
+
+    def enable_apps(self, names: List[str]) -> None:
+        """Enable apps using a single command."""
+        if not names:
+            return
+
+        try:
+            self.run_command(["app:enable"] + names)
+        finally:
+            self.refresh_raw_app_list()
+
+    def disable_apps(self, names: List[str]) -> None:
+        """Disable apps using a single command."""
+        if not names:
+            return
+
+        try:
+            self.run_command(["app:disable"] + names)
+        finally:
+            self.refresh_raw_app_list()
+
+    def update_apps(
+        self, names: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, str]]:
+        """Update apps that have an available update, and get versions by name.
+
+        If names is not set, all apps are updated using a single command.
+        Otherwise, a command is run for every app in names that has an
+        available update (`app:update` supports a single app only).
+
+        The old and new version are returned for updated apps.
+        """
+        available_app_updates = self.available_app_updates
+
+        if names is None:
+            names = list(available_app_updates)
+        else:
+            names = [name for name in names if name in available_app_updates]
+
+        if not names:
+            return {}
+
+        old_versions = {name: self.app_index[name].version for name in names}
+
+        try:
+            if set(names) == set(available_app_updates):
+                self.run_command(["app:update", "--all"])
+            else:
+                for name in names:
+                    self.run_command(["app:update", name])
+        finally:
+            self.refresh_raw_app_list()
+            self.refresh_raw_app_update_list()
+
+        return {
+            name: (old_versions[name], self.app_index[name].version) for name in names
+        }
+
+    def get_system_config(self, name: str) -> SystemConfigValue:
+        """Get system config value by name.
+
+        The value is served from the system config snapshot. Values that are
+        missing from it are retrieved separately, which raises CommandFailedError
+        when the value is not set.
+        """
+        if name in self.system_config:
+            return _parse_system_config_value(self.system_config[name])
+
+        return _parse_system_config_output(
+            self.run_command(
+                [
+                    "config:system:get",
+                    name,
+                ],
+            )
         )
 
-        if output.isdigit():
-            return int(output)
+    def get_app_config(self, app: str, name: str) -> Optional[str]:
+        """Get app config value by app and name, or None if it is not set."""
+        if self.database_reads:
+            app_config = _database.get_app_config(self.path, [name], app=app)
 
-        if output == "true":
-            return True
+            if app_config is not None:
+                value = app_config.get(app, {}).get(name)
 
-        if output == "false":
-            return False
+                if value is None or not value.startswith(
+                    _database.ENCRYPTED_VALUE_PREFIX
+                ):
+                    return value
 
         try:
-            return float(output)
-        except ValueError:
-            pass
+            return self.run_command(["config:app:get", app, name])
+        except CommandFailedError as e:
+            # Returned when the value is not set
+
+            if e.return_code == 1:
+                return None
 
-        return output
+            raise
 
     def set_system_config(
         self,
@@ -181,95 +856,138 @@ class Instance:
         Index must be set when manipulating arrays, as it corresponds to the
         array item.
         """
+        self.run_command(_get_set_system_config_command(name, value, index))
 
-        # Set type
-
-        type_ = "string"
-
-        if isinstance(value, int):
-            type_ = "integer"
+        self.refresh_system_config()
 
-        if isinstance(value, float):
-            type_ = "float"
+    def set_system_configs(
+        self,
+        values: Mapping[Union[str, Tuple[str, int]], SystemConfigValue],
+    ) -> Dict[str, SystemConfigValue]:
+        """Set multiple system config values using a single command.
 
-        if isinstance(value, bool):
-            type_ = "boolean"
+        Keys are names, or (name, index) tuples when manipulating arrays (see
+        set_system_config). Only values that differ from the current system config
+        are set. The set values are returned.
+        """
+        changes = _get_system_config_changes(self.system_config, values)
 
-        # Set value
+        if changes:
+            self.import_system_config(changes)
 
-        _value = str(value)
+        return changes
 
-        if isinstance(value, bool):
-            _value = _value.lower()
+    def import_system_config(self, values: Dict[str, SystemConfigValue]) -> None:
+        """Set system config values as is, using a single command.
 
-        # Set command
+        Unlike set_system_configs, values are not compared to the current system
+        config, and arrays are replaced as a whole.
+        """
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump({"system": values}, f)
 
-        command = [
-            "config:system:set",
-            name,
-        ]
+            f.flush()
 
-        if index is not None:
-            command.append(str(index))
+            self.run_command(["config:import", f.name])
 
-        command.extend(["--value", _value, "--type", type_])
+        self.refresh_system_config()
 
-        # Run command
+    def update(self, *, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """Update NextCloud.
 
-        run_command(command, self.path)
+        If the instance is linked to code_store, the code of the available
+        version is added to the code store, and the instance is relinked to it
+        and upgraded, in maintenance mode. Otherwise, the updater is used.
 
-    def update(self) -> Tuple[str, str]:
-        """Update NextCloud."""
+        timeout applies to the updater or upgrade, and defaults to the
+        instance's timeout.
+        """
         old_version = self.version
 
-        command = [PHP_BIN, "updater/updater.phar", "--no-interaction"]
+        if timeout is None:
+            timeout = self.timeout
 
-        try:
-            subprocess.run(
-                command,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=self.path,
-            )
-        except subprocess.CalledProcessError as e:
-            raise CommandFailedError(
-                return_code=e.returncode,
-                stdout=e.stdout,
-                stderr=e.stderr,
-                command=command,
+        if self.code_store and self.code_store.get_linked_release(self.path):
+            self._update_linked(timeout)
+        else:
+            execute(
+                [self.php_bin, "updater/updater.phar", "--no-interaction"],
+                self.path,
+                subcommand="updater",
+                metrics_hooks=self.metrics_hooks,
+                timeout=timeout,
+                cancel_event=self.cancel_event,
             )
 
+        # The worker still has the old code loaded
+
+        if self.worker:
+            self.worker.stop()
+
+        self.refresh_system_config()
+
         new_version = self.version
 
         return old_version, new_version
 
-    @property
-    def available_version(self) -> Optional[str]:
-        """Get version that instance can be updated to."""
-        lines = run_command(
-            [
-                "update:check",
-            ],
-            self.path,
-        ).splitlines()
+    def _update_linked(self, timeout: Optional[float]) -> None:
+        """Update instance that is linked to code store.
+
+        Like the updater, maintenance mode stays enabled when the upgrade fails.
+        Commands are not run by the worker, as it has the old code loaded.
+        """
+        assert self.code_store
+
+        release = self.available_version
+
+        if release is None:
+            return
+
+        self.code_store.add_release(release)
+
+        if self.worker:
+            self.worker.stop()
 
-        for line in lines:
-            match = re.fullmatch(
-                "^Nextcloud (.*) is available. Get more information on how to update at (.*).$",
-                line,
+        def _run_command(command: List[str], timeout: Optional[float]) -> None:
+            run_command(
+                command,
+                self.path,
+                php_bin=self.php_bin,
+                php_ini_settings=self.php_ini_settings,
+                metrics_hooks=self.metrics_hooks,
+                timeout=timeout,
+                cancel_event=self.cancel_event,
             )
 
-            if not match:
-                continue
+        _run_command(["maintenance:mode", "--on"], self.timeout)
 
-            return match.group(1)
+        self.code_store.relink(self.path, release)
 
-        return None
+        _run_command(["upgrade"], timeout)
+        _run_command(["maintenance:mode", "--off"], self.timeout)
+
+        self.refresh_raw_app_list()
+
+    @property
+    def available_version(self) -> Optional[str]:
+        """Get version that instance can be updated to."""
+        return _parse_update_check_output(
+            self.run_command(
+                [
+                    "update:check",
+                ],
+            )
+        )
 
     @property
     def version(self) -> str:
         """Get version."""
+        if self.filesystem_reads:
+            version = _filesystem.get_version(self.path)
+
+            if version is not None:
+                return version
+
         return self.get_system_config("version")  # type: ignore[return-value]
 
     def create_mail_account(
@@ -291,97 +1009,317 @@ class Instance:
         auth_method: MailAccountAuthMethod,
     ) -> None:
         """Create mail account."""
-        run_command(
-            [
-                "mail:account:create",
-                user_id,
-                name,
-                email_address,
-                imap_hostname,
-                str(imap_port),
-                imap_ssl_mode,
-                imap_username,
-                imap_password,
-                smtp_host,
-                str(smtp_port),
-                smtp_ssl_mode,
-                smtp_username,
-                smtp_password,
-                auth_method,
-            ],
-            self.path,
+        self.run_command(
+            _get_create_mail_account_command(
+                user_id=user_id,
+                name=name,
+                email_address=email_address,
+                imap_hostname=imap_hostname,
+                imap_port=imap_port,
+                imap_ssl_mode=imap_ssl_mode,
+                imap_username=imap_username,
+                imap_password=imap_password,
+                smtp_host=smtp_host,
+                smtp_port=smtp_port,
+                smtp_ssl_mode=smtp_ssl_mode,
+                smtp_username=smtp_username,
+                smtp_password=smtp_password,
+                auth_method=auth_method,
+            )
         )
 
+    def _get_mail_account_email_addresses(self, user_id: str) -> Set[str]:
+        """Get email addresses of user's mail accounts.
+
+        If they can't be retrieved (e.g. because the user doesn't exist), none
+        are returned, so that creating the mail account reports the error.
+        """
+        try:
+            output = self.run_command(["mail:account:export", user_id])
+        except CommandFailedError:
+            return set()
+
+        return _parse_mail_account_export_output(output)
+
+    def create_mail_accounts(
+        self,
+        accounts: Iterable[MailAccount],
+        *,
+        max_workers: Optional[int] = None,
+    ) -> List[MailAccountResult]:
+        """Create mail accounts that don't exist yet, and get results in order.
+
+        Existing mail accounts are retrieved up front, once for every user.
+        Accounts of which a user already has the email address are skipped.
+
+        Commands run in parallel by max_workers threads (defaults to the amount
+        of CPUs). When the worker is used, commands run serially by the worker
+        instead, so NextCloud is booted once.
+        """
+        accounts = list(accounts)
+
+        if self.worker:
+            max_workers = 1
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 1
+        ) as executor:
+            user_ids = list(dict.fromkeys(account.user_id for account in accounts))
+
+            existing_email_addresses = dict(
+                zip(
+                    user_ids,
+                    executor.map(self._get_mail_account_email_addresses, user_ids),
+                )
+            )
+
+            def _create(account: MailAccount) -> MailAccountResult:
+                if (
+                    account.email_address.lower()
+                    in existing_email_addresses[account.user_id]
+                ):
+                    return MailAccountResult(account=account, skipped=True)
+
+                try:
+                    self.create_mail_account(**asdict(account))
+                except CommandFailedError as e:
+                    return MailAccountResult(account=account, error=e)
+
+                return MailAccountResult(account=account)
+
+            return list(executor.map(_create, accounts))
+
     @property
     def users(self) -> List[User]:
-        """Get users."""
-        result = []
+        """Get users.
 
-        output = json.loads(
-            run_command(
-                [
-                    "user:list",
-                    "--output",
-                    "json",
-                ],
-                self.path,
-            )
+        For instances with many users, use iter_users.
+        """
+        return list(self.iter_users())
+
+    def _get_users(self, limit: int, offset: int) -> Dict[str, str]:
+        """Get names of users by ID."""
+        if self.database_reads:
+            users = _database.get_users(self.path, limit, offset)
+
+            if users is not None:
+                return users
+
+        return _parse_user_list_output(
+            self.run_command(_get_user_list_command(limit, offset))
         )
 
-        for id_, name in output.items():
-            user = User(self, id_, name)
+    def iter_users(self, page_size: int = 500) -> Iterator[User]:
+        """Get users, retrieving page_size users at a time."""
+        offset = 0
 
-            result.append(user)
+        while True:
+            output = self._get_users(page_size, offset)
 
-        return result
+            for id_, name in output.items():
+                yield User(self, id_, name)
+
+            if len(output) < page_size:
+                break
+
+            offset += page_size
+
+    @property
+    def user_count(self) -> int:
+        """Get amount of users.
+
+        Before NextCloud 28, users are counted by retrieving them, as counting
+        them using `user:report` scans the data directory, which is slower.
+        """
+        if self.database_reads:
+            user_count = _database.get_user_count(self.path)
+
+            if user_count is not None:
+                return user_count
+
+        command = _get_user_report_command(self.version)
+
+        if command is None:
+            return sum(1 for _ in self.iter_users())
+
+        return _parse_user_report_output(self.run_command(command))
+
+    def inventory(self, *, max_workers: Optional[int] = None) -> Inventory:
+        """Get snapshot of instance state.
+
+        Every piece of state is retrieved by a single command, or without
+        running `occ` (see filesystem_reads and database_reads). Without
+        database_reads, whether apps are enabled is retrieved using `occ`. Commands run in
+        parallel by max_workers threads (defaults to all commands at once). When
+        the worker is used, commands run serially by the worker instead.
+        """
+        if self.worker:
+            max_workers = 1
+
+        with ThreadPoolExecutor(max_workers=max_workers or 5) as executor:
+            version = executor.submit(lambda: self.version)
+            available_version = executor.submit(lambda: self.available_version)
+            user_count = executor.submit(lambda: self.user_count)
+
+            # Cached for installed apps
+
+            app_index = executor.submit(lambda: self.app_index)
+            available_app_updates = executor.submit(lambda: self.available_app_updates)
+
+            app_index.result()
+            available_app_updates.result()
+
+        # When the app index was built from the filesystem, whether apps are
+        # enabled is retrieved from the app list (see App.is_enabled)
+
+        return Inventory(
+            path=self.path,
+            version=version.result(),
+            available_version=available_version.result(),
+            apps=[
+                AppInventory(
+                    name=app.name,
+                    version=app.version,
+                    is_enabled=app.is_enabled,
+                    available_version=app.available_version,
+                )
+                for app in self.installed_apps
+            ],
+            user_count=user_count.result(),
+        )
+
+    def refresh_system_config(self) -> None:
+        """Clear the system config cache."""
+        self._delete_cached("system_config")
 
-    def refresh_raw_app_list(self) -> None:
-        """Clear the raw app list cache."""
         try:
-            del self.raw_app_list
+            del self.system_config
         except AttributeError:
             pass
 
+    @cached_property
+    def system_config(self) -> Dict[str, SystemConfigValue]:
+        """Get snapshot of system config.
+
+        Values have the types they have in the config file.
+        """
+        return self._get_cached(
+            "system_config",
+            lambda: json.loads(
+                self.run_command(
+                    [
+                        "config:list",
+                        "system",
+                        "--private",
+                        "--output",
+                        "json",
+                    ],
+                )
+            )["system"],
+        )
+
+    def refresh_raw_app_list(self) -> None:
+        """Clear the raw app list cache."""
+        self._delete_cached("raw_app_list")
+
+        for attribute in [
+            "raw_app_list",
+            "database_app_index",
+            "filesystem_app_versions",
+            "app_index",
+        ]:
+            try:
+                delattr(self, attribute)
+            except AttributeError:
+                pass
+
     def refresh_raw_app_update_list(self) -> None:
         """Clear the raw app list cache."""
-        try:
-            del self.raw_app_update_list
-        except AttributeError:
-            pass
+        for attribute in ["raw_app_update_list", "available_app_updates"]:
+            try:
+                delattr(self, attribute)
+            except AttributeError:
+                pass
 
     @cached_property
     def raw_app_update_list(self) -> List[str]:
         """Get raw app list output."""
-        return run_command(
+        return self.run_command(
             [
                 "app:update",
                 "--showonly",
             ],
-            self.path,
         ).splitlines()
 
+    @cached_property
+    def available_app_updates(self) -> Dict[str, str]:
+        """Get versions that apps can be updated to, by name.
+
+        Apps without available update are not included.
+        """
+        return _get_available_app_updates(self.raw_app_update_list)
+
     @cached_property
     def raw_app_list(self) -> dict:
         """Get raw app list output."""
-        return json.loads(
-            run_command(
-                [
-                    "app:list",
-                    "--output",
-                    "json",
-                ],
-                self.path,
-            )
+        return self._get_cached(
+            "raw_app_list",
+            lambda: json.loads(
+                self.run_command(
+                    [
+                        "app:list",
+                        "--output",
+                        "json",
+                    ],
+                )
+            ),
         )
 
+    @cached_property
+    def database_app_index(self) -> Optional[Dict[str, AppRecord]]:
+        """Get installed apps by name from the database, without running `occ`.
+
+        None if database reads are disabled, or the database can't be read from.
+        """
+        if not self.database_reads:
+            return None
+
+        return _database.get_app_index(self.path)
+
+    @cached_property
+    def filesystem_app_versions(self) -> Optional[Dict[str, str]]:
+        """Get app versions from apps directories, without running `occ`.
+
+        None if filesystem reads are disabled, or the files are ambiguous.
+        """
+        if not self.filesystem_reads:
+            return None
+
+        return _filesystem.get_app_versions(self.path)
+
+    @cached_property
+    def app_index(self) -> Dict[str, AppRecord]:
+        """Get installed apps by name.
+
+        Built once per app list refresh.
+        """
+        if self.database_app_index is not None:
+            return self.database_app_index
+
+        if self.filesystem_app_versions is not None:
+            return {
+                name: AppRecord(name=name, version=version, is_enabled=None)
+                for name, version in self.filesystem_app_versions.items()
+            }
+
+        return _get_app_index(self.raw_app_list)
+
     @property
     def installed_apps(self) -> List[App]:
         """Get installed apps."""
         result = []
 
-        for name, _ in (
-            self.raw_app_list["enabled"] | self.raw_app_list["disabled"]
-        ).items():
+        for name in self.app_index:
             app = App(
                 self,
                 name,
@@ -0,0 +1,139 @@
+"""Metrics of commands.
+
+Hooks are called with CommandMetrics after every command. They can be added
+globally (see add_hook), or per instance (see Instance).
+"""
+
+import bisect
+import copy
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class CommandMetrics:
+    """Metrics of command.
+
+    subcommand is the `occ` subcommand (e.g. 'app:list'), or 'updater' for the
+    updater.
+
+    cpu_time (user and system, in seconds) and max_rss (in bytes) are those of
+    the process that ran the command. They are None when unknown, i.e. when the
+    command was run by the worker (which runs multiple commands), or
+    asynchronously.
+    """
+
+    path: str
+    command: List[str]
+    subcommand: str
+    wall_time: float
+    cpu_time: Optional[float]
+    max_rss: Optional[int]
+    return_code: int
+    output_size: int
+
+
+logger = logging.getLogger(__name__)
+
+MetricsHook = Callable[[CommandMetrics], None]
+
+_hooks: List[MetricsHook] = []
+
+
+def add_hook(hook: MetricsHook) -> None:
+    """Add hook that is called for commands on all instances."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: MetricsHook) -> None:
+    """Remove hook added by add_hook."""
+    _hooks.remove(hook)
+
+
+def emit(metrics: CommandMetrics, hooks: Iterable[MetricsHook] = ()) -> None:
+    """Call global hooks and hooks with metrics.
+
+    Exceptions raised by hooks are logged, so that they don't hide the result
+    of the command.
+    """
+    for hook in _hooks + list(hooks):
+        try:
+            hook(metrics)
+        except Exception:
+            logger.exception("Metrics hook %r failed", hook)
+
+
+# Upper bounds of histogram buckets, in seconds. The last bucket has no bound.
+
+HISTOGRAM_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+@dataclass
+class SubcommandStats:
+    """Aggregated metrics of subcommand.
+
+    histogram contains the amount of commands per bucket in HISTOGRAM_BUCKETS,
+    plus one for commands that took longer than the last bucket.
+    """
+
+    count: int = 0
+    failures: int = 0
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    max_rss: int = 0
+    output_size: int = 0
+    histogram: List[int] = field(
+        default_factory=lambda: [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    )
+
+    @property
+    def mean_wall_time(self) -> float:
+        """Get mean wall time."""
+        return self.wall_time / self.count if self.count else 0.0
+
+
+class MetricsAggregator:
+    """Aggregates metrics in memory, by subcommand.
+
+    Use as hook, e.g. `add_hook(MetricsAggregator())`.
+    """
+
+    def __init__(self) -> None:
+        """Set attributes."""
+        self._stats: Dict[str, SubcommandStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: CommandMetrics) -> None:
+        """Add metrics."""
+        with self._lock:
+            stats = self._stats.setdefault(metrics.subcommand, SubcommandStats())
+
+            stats.count += 1
+            stats.wall_time += metrics.wall_time
+            stats.cpu_time += metrics.cpu_time or 0.0
+            stats.max_rss = max(stats.max_rss, metrics.max_rss or 0)
+            stats.output_size += metrics.output_size
+            stats.histogram[
+                bisect.bisect_left(HISTOGRAM_BUCKETS, metrics.wall_time)
+            ] += 1
+
+            if metrics.return_code != 0:
+                stats.failures += 1
+
+    @property
+    def stats(self) -> Dict[str, SubcommandStats]:
+        """Get stats by subcommand, with the most total wall time first."""
+        with self._lock:
+            return {
+                subcommand: copy.deepcopy(stats)
+                for subcommand, stats in sorted(
+                    self._stats.items(), key=lambda item: -item[1].wall_time
+                )
+            }
+
+    def reset(self) -> None:
+        """Clear stats."""
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,212 @@
+"""Reconcile instance with desired state of apps and system config.
+
+The current state is read using a single command. When the instance already
+has the desired state, nothing else is run.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+from cyberfusion.NextCloudSupport._archive import extract_app_from_url
+from cyberfusion.NextCloudSupport.exceptions import AppVersionUnavailableError
+from cyberfusion.NextCloudSupport.instance import (
+    Instance,
+    SystemConfigValue,
+    _get_system_config_changes,
+)
+
+
+@dataclass
+class DesiredApp:
+    """Desired state of app.
+
+    If url is set, the app is installed from the archive at url when it is not
+    installed, or when its version differs from version (which should be the
+    version in the archive). Otherwise, the app is installed from the app store,
+    and updated when its version differs from version. As the app store only
+    offers the latest version, version must then be the version that the app
+    store installs, or the available update.
+    """
+
+    name: str
+    version: Optional[str] = None
+    url: Optional[str] = None
+    enabled: bool = True
+
+
+@dataclass
+class DesiredState:
+    """Desired state of instance.
+
+    Apps that are not in apps are left alone. For system_config, see
+    Instance.set_system_configs.
+    """
+
+    apps: List[DesiredApp] = field(default_factory=list)
+    system_config: Mapping[Union[str, Tuple[str, int]], SystemConfigValue] = field(
+        default_factory=dict
+    )
+
+
+@dataclass
+class Plan:
+    """Changes needed to get instance in desired state.
+
+    install_apps contains apps to install by name, and apps to install (or
+    replace) from their URL.
+    """
+
+    install_apps: List[DesiredApp] = field(default_factory=list)
+    update_apps: List[str] = field(default_factory=list)
+    enable_apps: List[str] = field(default_factory=list)
+    disable_apps: List[str] = field(default_factory=list)
+    system_config: Dict[str, SystemConfigValue] = field(default_factory=dict)
+
+    @property
+    def is_empty(self) -> bool:
+        """Get if instance is in desired state."""
+        return not (
+            self.install_apps
+            or self.update_apps
+            or self.enable_apps
+            or self.disable_apps
+            or self.system_config
+        )
+
+
+def _get_current_state(instance: Instance) -> dict:
+    """Get system config and app config using a single command."""
+    return json.loads(
+        instance.run_command(["config:list", "--private", "--output", "json"])
+    )
+
+
+def get_plan(instance: Instance, desired_state: DesiredState) -> Plan:
+    """Get changes needed to get instance in desired state.
+
+    AppVersionUnavailableError is raised when an app should be updated from
+    the app store to a version that is not the available update, as the
+    instance would then never get in desired state.
+    """
+    current_state = _get_current_state(instance)
+
+    plan = Plan(
+        system_config=_get_system_config_changes(
+            current_state["system"], desired_state.system_config
+        )
+    )
+
+    app_config: Dict[str, Dict[str, str]] = current_state.get("apps", {})
+
+    for app in desired_state.apps:
+        values = app_config.get(app.name, {})
+
+        version = values.get("installed_version")
+        is_enabled = values.get("enabled", "no") != "no"
+
+        # Apps that were never enabled (such as shipped apps) have no app
+        # config, but may exist. Only then, the app list is retrieved.
+
+        if version is None and app.name in instance.app_index:
+            version = instance.app_index[app.name].version
+            is_enabled = instance.get_app(app.name).is_enabled
+
+        if version is None:
+            plan.install_apps.append(app)
+
+            if app.enabled:
+                plan.enable_apps.append(app.name)
+
+            continue
+
+        if app.version is not None and version != app.version:
+            if app.url:
+                plan.install_apps.append(app)
+
+                # Like App.install, enable app so that it is migrated
+
+                if app.enabled:
+                    plan.enable_apps.append(app.name)
+            else:
+                available_version = instance.available_app_updates.get(app.name)
+
+                if available_version != app.version:
+                    raise AppVersionUnavailableError(
+                        name=app.name,
+                        version=app.version,
+                        available_version=available_version,
+                    )
+
+                plan.update_apps.append(app.name)
+
+        if app.enabled and not is_enabled and app.name not in plan.enable_apps:
+            plan.enable_apps.append(app.name)
+        elif not app.enabled and is_enabled:
+            plan.disable_apps.append(app.name)
+
+    return plan
+
+
+def apply_plan(instance: Instance, plan: Plan) -> None:
+    """Make changes in plan.
+
+    System config values are set as is using a single command, as the plan
+    only contains changes. Apps are installed (kept disabled), then updated,
+    then enabled and disabled using a single command each.
+
+    The app store only offers the latest version of apps, which is not known
+    until an app is installed. When an app that is installed from the app store
+    does not have the desired version, it is removed before it is enabled, and
+    AppVersionUnavailableError is raised.
+    """
+    if plan.system_config:
+        instance.import_system_config(plan.system_config)
+
+    try:
+        for app in plan.install_apps:
+            if app.url:
+                extract_app_from_url(app.url, instance.path, instance.archive_cache)
+            else:
+                instance.run_command(["app:install", "--keep-disabled", app.name])
+    finally:
+        if plan.install_apps:
+            instance.refresh_raw_app_list()
+
+    for app in plan.install_apps:
+        if app.url or app.version is None:
+            continue
+
+        record = instance.app_index.get(app.name)
+        installed_version = record.version if record else None
+
+        if installed_version != app.version:
+            instance.run_command(["app:remove", app.name])
+            instance.refresh_raw_app_list()
+
+            raise AppVersionUnavailableError(
+                name=app.name,
+                version=app.version,
+                available_version=installed_version,
+            )
+
+    if plan.update_apps:
+        instance.update_apps(plan.update_apps)
+
+    instance.enable_apps(plan.enable_apps)
+    instance.disable_apps(plan.disable_apps)
+
+
+def reconcile(
+    instance: Instance, desired_state: DesiredState, *, dry_run: bool = False
+) -> Plan:
+    """Get instance in desired state, and get the plan.
+
+    If dry_run is set, the plan is returned without making changes.
+    """
+    plan = get_plan(instance, desired_state)
+
+    if not dry_run and not plan.is_empty:
+        apply_plan(instance, plan)
+
+    return plan
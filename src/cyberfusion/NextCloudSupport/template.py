@@ -0,0 +1,478 @@
+"""Template, from which instances are cloned.
+
+Installing NextCloud (see Instance.install) creates the database schema and
+installs default apps, which takes long. Instead, NextCloud can be installed
+once into a template, which is then cloned: the code and data directory are
+copied, the database is loaded from a dump, and instance-specific values in
+the config are regenerated.
+"""
+
+import json
+import os
+import secrets
+import shutil
+import stat
+import string
+import tempfile
+from typing import IO, Any, Dict, List, Optional
+
+from cyberfusion.NextCloudSupport._database import _get_host_and_port
+from cyberfusion.NextCloudSupport._occ import execute, get_php_bin, run_command
+from cyberfusion.NextCloudSupport._tree import WRITABLE_FILES, copy
+from cyberfusion.NextCloudSupport.exceptions import DirectoryNotEmptyError
+from cyberfusion.NextCloudSupport.instance import Instance, SystemConfigValue
+
+READ_CONFIG_CODE = """
+include $argv[1];
+
+echo json_encode($CONFIG);
+"""
+
+# Like NextCloud writes its config
+
+WRITE_CONFIG_CODE = """
+$config = json_decode(file_get_contents($argv[1]), true);
+
+file_put_contents(
+    $argv[2],
+    '<?php' . PHP_EOL . '$CONFIG = ' . var_export($config, true) . ';' . PHP_EOL
+);
+"""
+
+
+def _generate_secret(length: int, characters: str) -> str:
+    """Generate random string."""
+    return "".join(secrets.choice(characters) for _ in range(length))
+
+
+def _clear_directory(path: str) -> None:
+    """Remove contents of directory."""
+    for name in os.listdir(path):
+        child_path = os.path.join(path, name)
+
+        if os.path.isdir(child_path) and not os.path.islink(child_path):
+            shutil.rmtree(child_path)
+        else:
+            os.unlink(child_path)
+
+
+def _replace_path(value: Any, old_path: str, new_path: str) -> Any:
+    """Replace path prefix in (nested) string values."""
+    if isinstance(value, str) and (
+        value == old_path or value.startswith(old_path + os.sep)
+    ):
+        return new_path + value[len(old_path) :]
+
+    if isinstance(value, list):
+        return [_replace_path(item, old_path, new_path) for item in value]
+
+    if isinstance(value, dict):
+        return {k: _replace_path(v, old_path, new_path) for k, v in value.items()}
+
+    return value
+
+
+class Template:
+    """Represents template, i.e. installed instance that is cloned.
+
+    For MySQL and PostgreSQL, the database is dumped to dump_path (see dump),
+    which should not be in the template's directory. For SQLite, the database
+    is in the data directory, so it is copied with it.
+
+    The template should not be used as instance, as values such as user data
+    are copied to clones. Its secret is regenerated for clones, so values
+    encrypted with it (such as stored credentials) are unusable in clones.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        dump_path: Optional[str] = None,
+        php_bin: Optional[str] = None,
+    ) -> None:
+        """Set attributes."""
+        self.path = path
+        self.dump_path = dump_path
+        self._php_bin = php_bin
+
+    @property
+    def php_bin(self) -> str:
+        """Get path to PHP binary."""
+        return self._php_bin or get_php_bin()
+
+    @property
+    def config(self) -> Dict[str, SystemConfigValue]:
+        """Get config from `config/config.php`.
+
+        Read by PHP, as the config is PHP code.
+        """
+        return json.loads(
+            execute(
+                [
+                    self.php_bin,
+                    "-r",
+                    READ_CONFIG_CODE,
+                    os.path.join(self.path, "config", "config.php"),
+                ],
+                self.path,
+                subcommand="php",
+            )
+        )
+
+    def _write_config(self, path: str, config: Dict[str, Any]) -> None:
+        """Write config to `config/config.php` of clone at path.
+
+        The config is replaced atomically, keeping the mode of the copied config.
+        """
+        config_path = os.path.join(path, "config", "config.php")
+
+        fd, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(config_path), prefix=".config-", suffix=".php"
+        )
+
+        os.close(fd)
+
+        try:
+            os.chmod(temporary_path, stat.S_IMODE(os.stat(config_path).st_mode))
+
+            with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+                json.dump(config, f)
+
+                f.flush()
+
+                execute(
+                    [self.php_bin, "-r", WRITE_CONFIG_CODE, f.name, temporary_path],
+                    path,
+                    subcommand="php",
+                )
+
+            os.replace(temporary_path, config_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+
+    @staticmethod
+    def _get_database_arguments(config: Dict[str, Any]) -> List[str]:
+        """Get arguments to connect to database server with mysql(dump) or psql."""
+        host, port, socket = _get_host_and_port(config)
+
+        arguments = []
+
+        if config["dbtype"] == "mysql":
+            if host:
+                arguments.append(f"--host={host}")
+
+            if socket:
+                arguments.append(f"--socket={socket}")
+        elif host or socket:
+            arguments.append(f"--host={host or socket}")
+
+        if port:
+            arguments.append(f"--port={port}")
+
+        return arguments
+
+    @staticmethod
+    def _run_database_command(
+        config: Dict[str, Any],
+        command: List[str],
+        cwd: str,
+        *,
+        stdin: Optional[IO[bytes]] = None,
+    ) -> None:
+        """Run mysql(dump) or psql command, passing credentials using files."""
+        if config["dbtype"] == "pgsql":
+            execute(
+                command[:1]
+                + Template._get_database_arguments(config)
+                + [f"--username={config['dbuser']}"]
+                + command[1:],
+                cwd,
+                subcommand=command[0],
+                env={"PGPASSWORD": config["dbpassword"]},
+                stdin=stdin,
+            )
+
+            return
+
+        with tempfile.NamedTemporaryFile("w", suffix=".cnf") as f:
+            f.write(
+                "[client]\n"
+                + "".join(
+                    f'{name}="'
+                    + config[key].replace("\\", "\\\\").replace('"', '\\"')
+                    + '"\n'
+                    for name, key in [("user", "dbuser"), ("password", "dbpassword")]
+                )
+            )
+            f.flush()
+
+            # --defaults-extra-file must be the first argument
+
+            execute(
+                command[:1]
+                + [f"--defaults-extra-file={f.name}"]
+                + Template._get_database_arguments(config)
+                + command[1:],
+                cwd,
+                subcommand=command[0],
+                stdin=stdin,
+            )
+
+    def dump(self) -> None:
+        """Dump database to dump_path.
+
+        Not needed for SQLite.
+        """
+        config = self.config
+
+        if config["dbtype"] == "sqlite3":
+            return
+
+        if not self.dump_path:
+            raise ValueError("dump_path must be set")
+
+        if config["dbtype"] == "mysql":
+            command = [
+                "mysqldump",
+                "--single-transaction",
+                f"--result-file={self.dump_path}",
+                str(config["dbname"]),
+            ]
+        else:
+            command = [
+                "pg_dump",
+                "--no-owner",
+                f"--file={self.dump_path}",
+                str(config["dbname"]),
+            ]
+
+        self._run_database_command(config, command, self.path)
+
+    def _load(self, config: Dict[str, Any], path: str) -> None:
+        """Load dump into (empty) database in config."""
+        if not self.dump_path:
+            raise ValueError("dump_path must be set")
+
+        if config["dbtype"] == "mysql":
+            command = ["mysql", f"--database={config['dbname']}"]
+        else:
+            command = [
+                "psql",
+                "--quiet",
+                "--set=ON_ERROR_STOP=1",
+                f"--dbname={config['dbname']}",
+            ]
+
+        # Pass dump on stdin, so that its path needs no quoting
+
+        with open(self.dump_path, "rb") as f:
+            self._run_database_command(config, command, path, stdin=f)
+
+    def clone(
+        self,
+        path: str,
+        *,
+        admin_user: str,
+        admin_password: str,
+        database_name: Optional[str] = None,
+        database_host: Optional[str] = None,
+        database_username: Optional[str] = None,
+        database_password: Optional[str] = None,
+        data_directory: Optional[str] = None,
+        system_config: Optional[Dict[str, SystemConfigValue]] = None,
+        hardlink: bool = False,
+    ) -> Instance:
+        """Clone template to empty directory, and get instance.
+
+        For MySQL and PostgreSQL, the database must exist and be empty. Database
+        values that are not set are taken from the template.
+
+        data_directory defaults to the `data` directory in path. system_config
+        values (e.g. 'trusted_domains') are set in the clone's config. Paths to
+        the template (e.g. in 'apps_paths') are replaced by paths to the clone.
+
+        instanceid, passwordsalt and secret are regenerated, and the password of
+        admin_user (the template's admin user) is set to admin_password.
+
+        If hardlink is set, code is hardlinked instead of copied. This saves disk
+        space, but files must then never be changed in place (which updates
+        don't do). The config, data directory and files that NextCloud writes
+        are always copied.
+
+        When cloning fails, the copied files are removed. For MySQL and
+        PostgreSQL, the database may contain the loaded dump, and must then be
+        emptied before cloning again.
+        """
+        if os.listdir(path):
+            raise DirectoryNotEmptyError
+
+        if data_directory is None:
+            data_directory = os.path.join(path, "data")
+
+        # Only remove data directory on failure when it was created or empty
+
+        remove_data_directory = not os.path.exists(data_directory)
+        clear_data_directory = not remove_data_directory and not os.listdir(
+            data_directory
+        )
+
+        try:
+            return self._clone(
+                path,
+                admin_user=admin_user,
+                admin_password=admin_password,
+                database_name=database_name,
+                database_host=database_host,
+                database_username=database_username,
+                database_password=database_password,
+                data_directory=data_directory,
+                system_config=system_config,
+                hardlink=hardlink,
+            )
+        except BaseException:
+            if remove_data_directory and os.path.isdir(data_directory):
+                shutil.rmtree(data_directory)
+            elif clear_data_directory:
+                _clear_directory(data_directory)
+
+            _clear_directory(path)
+
+            raise
+
+    def _clone(
+        self,
+        path: str,
+        *,
+        admin_user: str,
+        admin_password: str,
+        database_name: Optional[str],
+        database_host: Optional[str],
+        database_username: Optional[str],
+        database_password: Optional[str],
+        data_directory: str,
+        system_config: Optional[Dict[str, SystemConfigValue]],
+        hardlink: bool,
+    ) -> Instance:
+        """Clone template, see clone."""
+        template_config = self.config
+
+        template_data_directory = os.path.normpath(
+            str(template_config.get("datadirectory", os.path.join(self.path, "data")))
+        )
+
+        # Copy code, and files that are written to
+
+        names = [
+            name
+            for name in os.listdir(self.path)
+            if os.path.join(self.path, name) != template_data_directory
+        ]
+
+        copy(
+            [
+                os.path.join(self.path, name)
+                for name in names
+                if hardlink and name not in WRITABLE_FILES + ["config"]
+            ],
+            path,
+            hardlink=True,
+        )
+        copy(
+            [
+                os.path.join(self.path, name)
+                for name in names
+                if not hardlink or name in WRITABLE_FILES + ["config"]
+            ],
+            path,
+        )
+
+        # Copy data directory, including SQLite database
+
+        os.makedirs(data_directory, exist_ok=True)
+
+        copy(
+            [
+                os.path.join(template_data_directory, name)
+                for name in os.listdir(template_data_directory)
+                if name != "nextcloud.log"
+            ],
+            data_directory,
+        )
+
+        # Get config for clone
+
+        config: Dict[str, Any] = _replace_path(
+            _replace_path(template_config, template_data_directory, data_directory),
+            os.path.normpath(self.path),
+            os.path.normpath(path),
+        )
+
+        config |= {
+            "instanceid": "oc"
+            + _generate_secret(10, string.ascii_lowercase + string.digits),
+            "passwordsalt": _generate_secret(30, string.ascii_letters + string.digits),
+            "secret": _generate_secret(48, string.ascii_letters + string.digits),
+            "datadirectory": data_directory,
+        }
+
+        for key, value in [
+            ("dbname", database_name),
+            ("dbhost", database_host),
+            ("dbuser", database_username),
+            ("dbpassword", database_password),
+        ]:
+            if value is not None:
+                config[key] = value
+
+        config |= system_config or {}
+
+        # App data directory is named after instance ID
+
+        app_data_path = os.path.join(
+            data_directory, f"appdata_{template_config['instanceid']}"
+        )
+
+        if os.path.isdir(app_data_path):
+            os.rename(
+                app_data_path,
+                os.path.join(data_directory, f"appdata_{config['instanceid']}"),
+            )
+
+        # Load database
+
+        if config["dbtype"] == "sqlite3":
+            old_database_path = os.path.join(
+                data_directory, f"{template_config.get('dbname', 'owncloud')}.db"
+            )
+            new_database_path = os.path.join(
+                data_directory, f"{config.get('dbname', 'owncloud')}.db"
+            )
+
+            if new_database_path != old_database_path:
+                os.rename(old_database_path, new_database_path)
+        else:
+            self._load(config, path)
+
+        # Write config before running `occ`, as the copied config is the
+        # template's, so `occ` would use the template's database and data
+        # directory
+
+        self._write_config(path, config)
+
+        instance = Instance(path, php_bin=self._php_bin)
+
+        # File cache refers to storages by data directory, so rebuild it
+
+        instance.run_command(["files:scan", "--all"])
+        instance.run_command(["files:scan-app-data"])
+
+        run_command(
+            ["user:resetpassword", "--password-from-env", admin_user],
+            path,
+            php_bin=self._php_bin,
+            env={"OC_PASS": admin_password},
+        )
+
+        return instance
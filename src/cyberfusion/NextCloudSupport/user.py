@@ -1,15 +1,22 @@
 """User."""
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Union
 
 if TYPE_CHECKING:  # pragma: no cover
+    from cyberfusion.NextCloudSupport.async_instance import AsyncInstance
     from cyberfusion.NextCloudSupport.instance import Instance
 
 
 class User:
     """Represents user."""
 
-    def __init__(self, instance: "Instance", id_: str, name: str) -> None:
+    # Instances may have many users, so keep objects small
+
+    __slots__ = ("instance", "id", "name")
+
+    def __init__(
+        self, instance: Union["Instance", "AsyncInstance"], id_: str, name: str
+    ) -> None:
         """Set attributes."""
         self.instance = instance
         self.id = id_
@@ -1,6 +1,9 @@
+import os
+
 import pytest
 
 from cyberfusion.NextCloudSupport.app import App
+from cyberfusion.NextCloudSupport.cache import ArchiveCache
 from cyberfusion.NextCloudSupport.instance import Instance
 from tests._urls import URL_BOOKMARKS, URL_COSPEND, URL_POLLS
 
@@ -103,6 +106,19 @@ def test_app_install_url(instance_installed_static_version: Instance) -> None:
     instance_installed_static_version.get_app("cospend")
 
 
+@pytest.mark.xdist_group(name="app")
+def test_app_install_url_archive_cache(
+    instance_installed_static_version: Instance, tmp_path
+) -> None:
+    instance_installed_static_version.archive_cache = ArchiveCache(str(tmp_path))
+
+    App.install(instance_installed_static_version, url=URL_POLLS)
+
+    instance_installed_static_version.get_app("polls")
+
+    assert len(os.listdir(os.path.join(tmp_path, "blobs"))) == 1
+
+
 @pytest.mark.xdist_group(name="app")
 def test_app_update_available(instance_installed_static_version: Instance) -> None:
     ORIGINAL_VERSION = "14.2.1"
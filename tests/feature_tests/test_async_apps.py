@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from cyberfusion.NextCloudSupport.async_app import AsyncApp
+from cyberfusion.NextCloudSupport.async_instance import AsyncInstance
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+@pytest.mark.xdist_group(name="app")
+def test_async_app_version(instance_installed_static_version: Instance) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def get_version() -> str:
+        app = await instance.get_app("provisioning_api")
+
+        return await app.version()
+
+    assert (
+        asyncio.run(get_version())
+        == instance_installed_static_version.get_app("provisioning_api").version
+    )
+
+
+@pytest.mark.xdist_group(name="app")
+def test_async_app_enable_disable(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def enable_disable() -> tuple:
+        app = await instance.get_app("encryption")  # Disabled by default
+
+        await app.enable()
+
+        enabled = await app.is_enabled()
+
+        await app.disable()
+
+        return enabled, await app.is_enabled()
+
+    assert asyncio.run(enable_disable()) == (True, False)
+
+
+@pytest.mark.xdist_group(name="app")
+def test_async_app_install_name(instance_installed_static_version: Instance) -> None:
+    APP_NAME = "polls"
+
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def install() -> None:
+        await AsyncApp.install(instance, name=APP_NAME)
+
+        await instance.get_app(APP_NAME)
+
+    asyncio.run(install())
+
+
+@pytest.mark.xdist_group(name="app")
+def test_async_app_update_unavailable(
+    instance_installed_static_version: Instance,
+) -> None:
+    APP_NAME = "polls"
+
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def update() -> tuple:
+        await AsyncApp.install(instance, name=APP_NAME)
+
+        app = await instance.get_app(APP_NAME)
+
+        return await app.update()
+
+    old_version, new_version = asyncio.run(update())
+
+    assert old_version == new_version
@@ -0,0 +1,90 @@
+import asyncio
+
+from cyberfusion.NextCloudSupport.async_instance import AsyncInstance
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+def test_async_instance_version(instance_installed_static_version: Instance) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    assert asyncio.run(instance.version()) == instance_installed_static_version.version
+
+
+def test_async_instance_set_get_system_config(
+    instance_installed_static_version: Instance,
+) -> None:
+    NAME = "loglevel"
+    VALUE = 1
+
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def set_get() -> int:
+        await instance.set_system_config(NAME, VALUE)
+
+        return await instance.get_system_config(NAME)
+
+    assert asyncio.run(set_get()) == VALUE
+
+
+def test_async_instance_set_system_configs(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def set_get() -> bool:
+        await instance.set_system_configs({"maintenance": True})
+
+        return await instance.get_system_config("maintenance")
+
+    assert asyncio.run(set_get()) is True
+
+
+def test_async_instance_installed_apps(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    assert len(asyncio.run(instance.installed_apps())) >= 49
+
+
+def test_async_instance_users(instance_installed_static_version: Instance) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    assert len(asyncio.run(instance.users())) == 1
+
+
+def test_async_instance_user_count(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    assert asyncio.run(instance.user_count()) == 1
+
+
+def test_async_instance_available_version_unavailable(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    assert asyncio.run(instance.available_version()) is None
+
+
+def test_async_instance_concurrent_commands(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    async def gather() -> list:
+        return await asyncio.gather(
+            instance.version(),
+            instance.raw_app_list(),
+            instance.raw_app_update_list(),
+            instance.users(),
+        )
+
+    version, raw_app_list, raw_app_update_list, users = asyncio.run(gather())
+
+    assert version == instance_installed_static_version.version
+    assert isinstance(raw_app_list, dict)
+    assert isinstance(raw_app_update_list, list)
+    assert len(users) == 1
@@ -0,0 +1,83 @@
+import os
+import shutil
+from typing import Generator
+
+import pytest
+
+from cyberfusion.Common import generate_random_string
+from cyberfusion.NextCloudSupport.code_store import CodeStore
+from cyberfusion.NextCloudSupport.instance import DatabaseType, Instance
+
+
+@pytest.fixture
+def code_store(
+    workspace_directory: str, nextcloud_2900_archive: str
+) -> Generator[CodeStore, None, None]:
+    # Must be on the same filesystem as the workspace directory
+
+    path = workspace_directory + "-store"
+
+    code_store = CodeStore(path)
+
+    code_store.add(nextcloud_2900_archive)
+
+    yield code_store
+
+    shutil.rmtree(path)
+
+
+def test_code_store_deduplicate(
+    instance_installed_static_version: Instance, code_store: CodeStore
+) -> None:
+    assert code_store.get_linked_release(instance_installed_static_version.path) is None
+
+    assert code_store.deduplicate(instance_installed_static_version.path) > 0
+
+    assert (
+        code_store.get_linked_release(instance_installed_static_version.path)
+        == "29.0.0"
+    )
+
+    instance = Instance(instance_installed_static_version.path)
+
+    assert instance.version == "29.0.0.19"
+    assert instance.get_app("files").is_enabled
+
+
+def test_code_store_update(
+    workspace_directory: str,
+    code_store: CodeStore,
+    database_name: str,
+    database_host: str,
+    database_username: str,
+    database_password: str,
+) -> None:
+    code_store.link("29.0.0", workspace_directory)
+
+    Instance.install(
+        workspace_directory,
+        database_host=database_host,
+        database_name=database_name,
+        database_username=database_username,
+        database_password=database_password,
+        admin_user="admin",
+        admin_password=generate_random_string(),
+        database_type=DatabaseType.MYSQL,
+    )
+
+    instance = Instance(workspace_directory, code_store=code_store)
+
+    old_version, new_version = instance.update()
+
+    assert old_version == "29.0.0.19"
+    assert new_version != old_version
+
+    release = code_store.get_linked_release(workspace_directory)
+
+    assert release is not None
+    assert release != "29.0.0"
+    assert code_store.releases == ["29.0.0", release]
+    assert not instance.get_system_config("maintenance")
+    assert not any(
+        name.startswith(".code-") for name in os.listdir(workspace_directory)
+    )
@@ -0,0 +1,29 @@
+from cyberfusion.NextCloudSupport.fleet import Fleet
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+def test_fleet_run(instance_installed_static_version: Instance) -> None:
+    fleet = Fleet([instance_installed_static_version.path] * 2, max_workers=2)
+
+    results = fleet.run(lambda instance: instance.version)
+
+    assert len(results) == 2
+
+    for result in results:
+        assert result.succeeded
+        assert result.value == instance_installed_static_version.version
+
+
+def test_fleet_run_max_workers_per_database_host(
+    instance_installed_static_version: Instance,
+) -> None:
+    fleet = Fleet(
+        [instance_installed_static_version.path],
+        max_workers_per_database_host=1,
+        instance_factory=lambda path: Instance(path, use_worker=True),
+    )
+
+    (result,) = fleet.run(lambda instance: len(instance.installed_apps))
+
+    assert result.succeeded
+    assert result.value >= 49
@@ -1,15 +1,21 @@
+import json
 import os
 import subprocess
+from dataclasses import asdict
 from typing import Generator
 
 import pytest
 
 from cyberfusion.Common import generate_random_string
+from cyberfusion.NextCloudSupport._download import get_sha256
 from cyberfusion.NextCloudSupport._occ import PHP_BIN
 from cyberfusion.NextCloudSupport.app import App
+from cyberfusion.NextCloudSupport.cache import Cache
+from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
 from cyberfusion.NextCloudSupport.instance import (
     DatabaseType,
     Instance,
+    MailAccount,
     MailAccountAuthMethod,
     SSLMode,
 )
@@ -33,6 +39,26 @@ def test_instance_download_from_zip(
     assert os.path.isfile(os.path.join(workspace_directory, "index.php"))
 
 
+def test_instance_download_from_zip_sha256(
+    workspace_directory: Generator[str, None, None],
+    nextcloud_2900_archive: str,
+) -> None:
+    progress = []
+
+    Instance.download(
+        workspace_directory,
+        zip_path=nextcloud_2900_archive,
+        sha256=get_sha256(nextcloud_2900_archive),
+        threads=2,
+        progress_callback=lambda *args: progress.append(args),
+    )
+
+    assert os.path.isfile(os.path.join(workspace_directory, "index.php"))
+    assert not os.path.exists(os.path.join(workspace_directory, "nextcloud"))
+    assert progress[-1][0] == "extract"
+    assert progress[-1][1] == progress[-1][2]
+
+
 def test_instance_install(
     workspace_directory: Generator[str, None, None],
     database_name: str,
@@ -226,6 +252,16 @@ def test_instance_users(instance_installed_static_version: Instance) -> None:
     assert len(instance_installed_static_version.users) == 1
 
 
+def test_instance_iter_users(instance_installed_static_version: Instance) -> None:
+    assert [
+        user.id for user in instance_installed_static_version.iter_users(page_size=1)
+    ] == [user.id for user in instance_installed_static_version.users]
+
+
+def test_instance_user_count(instance_installed_static_version: Instance) -> None:
+    assert instance_installed_static_version.user_count == 1
+
+
 @pytest.mark.xdist_group(name="app")
 def test_instance_create_mail_account(
     instance_installed_static_version: Instance,
@@ -250,6 +286,51 @@ def test_instance_create_mail_account(
     )
 
 
+@pytest.mark.xdist_group(name="app")
+def test_instance_create_mail_accounts(
+    instance_installed_static_version: Instance,
+) -> None:
+    App.install(instance_installed_static_version, "mail")
+
+    def _get_account(user_id: str, email_address: str) -> MailAccount:
+        return MailAccount(
+            user_id=user_id,
+            name="Example",
+            email_address=email_address,
+            imap_hostname="localhost",
+            imap_port=143,
+            imap_ssl_mode=SSLMode.NONE,
+            imap_username=email_address,
+            imap_password="pass",
+            smtp_host="localhost",
+            smtp_port=25,
+            smtp_ssl_mode=SSLMode.NONE,
+            smtp_username=email_address,
+            smtp_password="pass",
+            auth_method=MailAccountAuthMethod.PASSWORD,
+        )
+
+    USER_ID = instance_installed_static_version.users[0].id
+
+    accounts = [
+        _get_account(USER_ID, "bulk1@example.com"),
+        _get_account(USER_ID, "bulk2@example.com"),
+    ]
+
+    results = instance_installed_static_version.create_mail_accounts(accounts)
+
+    assert [(r.succeeded, r.skipped) for r in results] == [(True, False)] * 2
+
+    results = instance_installed_static_version.create_mail_accounts(
+        accounts + [_get_account("doesntexist", "bulk3@example.com")]
+    )
+
+    assert [(r.succeeded, r.skipped) for r in results] == [(True, True)] * 2 + [
+        (False, False)
+    ]
+    assert isinstance(results[2].error, CommandFailedError)
+
+
 @pytest.mark.xdist_group(name="app")
 def test_instance_raw_app_list(instance_installed_static_version: Instance) -> None:
     assert isinstance(instance_installed_static_version.raw_app_list, dict)
@@ -334,3 +415,219 @@ def test_instance_refresh_raw_app_update_list(
         line.split(" ")[0]
         for line in instance_installed_static_version.raw_app_update_list
     ]
+
+
+def test_instance_system_config(instance_installed_static_version: Instance) -> None:
+    assert isinstance(instance_installed_static_version.system_config, dict)
+
+    assert (
+        instance_installed_static_version.system_config["version"]
+        == instance_installed_static_version.version
+    )
+
+
+def test_instance_system_config_typed(
+    instance_installed_static_version: Instance,
+) -> None:
+    assert isinstance(
+        instance_installed_static_version.system_config["installed"], bool
+    )
+    assert isinstance(
+        instance_installed_static_version.system_config["trusted_domains"], list
+    )
+
+
+def test_instance_set_system_config_refreshes_system_config(
+    instance_installed_static_version: Instance,
+) -> None:
+    NAME = "loglevel"
+
+    instance_installed_static_version.set_system_config(NAME, 3)
+
+    assert instance_installed_static_version.system_config[NAME] == 3
+
+    instance_installed_static_version.set_system_config(NAME, 1)
+
+    assert instance_installed_static_version.system_config[NAME] == 1
+
+
+def test_instance_set_system_configs(
+    instance_installed_static_version: Instance,
+) -> None:
+    VALUES = {
+        "defaultapp": "deck",
+        "loglevel": 1,
+        "maintenance": True,
+        "version": 1.1,
+        ("trusted_domains", 2): "example.com",
+    }
+
+    changes = instance_installed_static_version.set_system_configs(VALUES)
+
+    assert "trusted_domains" in changes
+
+    for name in ["defaultapp", "loglevel", "maintenance", "version"]:
+        assert instance_installed_static_version.get_system_config(name) == VALUES[name]
+
+    assert "example.com" in instance_installed_static_version.get_system_config(
+        "trusted_domains"
+    )
+
+
+def test_instance_set_system_configs_unchanged(
+    instance_installed_static_version: Instance,
+) -> None:
+    VALUES = {"loglevel": 1, "maintenance": False}
+
+    instance_installed_static_version.set_system_configs(VALUES)
+
+    assert instance_installed_static_version.set_system_configs(VALUES) == {}
+
+
+def test_instance_cache(instance_installed_static_version: Instance, tmp_path) -> None:
+    cache = Cache(str(tmp_path))
+
+    instance = Instance(instance_installed_static_version.path, cache=cache)
+
+    version = instance.version
+    raw_app_list = instance.raw_app_list
+
+    assert cache.get(instance.path, "system_config")["version"] == version
+    assert cache.get(instance.path, "raw_app_list") == raw_app_list
+
+    instance.refresh_raw_app_list()
+
+    assert cache.get(instance.path, "raw_app_list") is None
+
+
+def test_instance_filesystem_reads(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = Instance(instance_installed_static_version.path, filesystem_reads=True)
+
+    assert instance.version == instance_installed_static_version.version
+
+    assert instance.filesystem_app_versions is not None
+
+    assert {app.name: app.version for app in instance.installed_apps} == {
+        app.name: app.version
+        for app in instance_installed_static_version.installed_apps
+    }
+
+    assert "raw_app_list" not in instance.__dict__
+
+
+def test_instance_app_index(instance_installed_static_version: Instance) -> None:
+    app_index = instance_installed_static_version.app_index
+
+    assert app_index["survey_client"].is_enabled is True  # Enabled by default
+    assert app_index["encryption"].is_enabled is False  # Disabled by default
+
+    assert [app.name for app in instance_installed_static_version.installed_apps] == [
+        *app_index
+    ]
+
+
+@pytest.mark.xdist_group(name="app")
+def test_instance_refresh_raw_app_list_refreshes_app_index(
+    instance_installed_static_version: Instance,
+) -> None:
+    app = instance_installed_static_version.get_app("encryption")
+
+    assert instance_installed_static_version.app_index["encryption"].is_enabled is False
+
+    app.enable()
+
+    assert instance_installed_static_version.app_index["encryption"].is_enabled is True
+
+
+@pytest.mark.xdist_group(name="app")
+def test_instance_available_app_updates(
+    instance_installed_static_version: Instance,
+) -> None:
+    App.install(instance_installed_static_version, url=URL_BOOKMARKS)
+
+    assert "bookmarks" in instance_installed_static_version.available_app_updates
+
+    assert (
+        instance_installed_static_version.get_app("bookmarks").available_version
+        == instance_installed_static_version.available_app_updates["bookmarks"]
+    )
+
+
+@pytest.mark.xdist_group(name="app")
+def test_instance_enable_disable_apps(
+    instance_installed_static_version: Instance,
+) -> None:
+    NAMES = ["admin_audit", "files_external"]
+
+    instance_installed_static_version.enable_apps(NAMES)
+
+    for name in NAMES:
+        assert instance_installed_static_version.app_index[name].is_enabled is True
+
+    instance_installed_static_version.disable_apps(NAMES)
+
+    for name in NAMES:
+        assert instance_installed_static_version.app_index[name].is_enabled is False
+
+
+@pytest.mark.xdist_group(name="app")
+def test_instance_update_apps(
+    instance_installed_static_version: Instance,
+) -> None:
+    ORIGINAL_VERSION = "14.2.1"
+
+    App.install(instance_installed_static_version, url=URL_BOOKMARKS)
+
+    result = instance_installed_static_version.update_apps(["bookmarks", "files"])
+
+    assert list(result) == ["bookmarks"]
+    assert result["bookmarks"][0] == ORIGINAL_VERSION
+    assert result["bookmarks"][1] != ORIGINAL_VERSION
+    assert "bookmarks" not in instance_installed_static_version.available_app_updates
+
+
+def test_instance_fast_cli(
+    instance_installed_static_version: Instance, tmp_path
+) -> None:
+    instance = Instance(
+        instance_installed_static_version.path,
+        fast_cli=True,
+        opcache_directory=str(tmp_path),
+    )
+
+    assert instance.version == instance_installed_static_version.version
+    assert instance.php_ini_settings["opcache.enable_cli"] == "1"
+
+
+def test_instance_run_command_php_ini_settings(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = Instance(
+        instance_installed_static_version.path,
+        use_worker=True,
+        php_ini_settings={"memory_limit": "1G"},
+    )
+
+    assert instance.worker is not None
+    assert instance.worker.php_ini_settings == {"memory_limit": "1G"}
+
+    # Not run by the worker, as its settings cannot be changed
+
+    instance.run_command(["status"], php_ini_settings={"memory_limit": "2G"})
+
+    assert not instance.worker.is_running
+
+
+def test_instance_inventory(instance_installed_static_version: Instance) -> None:
+    inventory = instance_installed_static_version.inventory()
+
+    assert inventory.path == instance_installed_static_version.path
+    assert inventory.version == instance_installed_static_version.version
+    assert inventory.user_count == 1
+    assert {app.name for app in inventory.apps} == set(
+        instance_installed_static_version.app_index
+    )
+
+    json.dumps(asdict(inventory))
@@ -0,0 +1,60 @@
+from typing import List
+
+import pytest
+
+from cyberfusion.NextCloudSupport.instance import Instance
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics
+from cyberfusion.NextCloudSupport.reconcile import (
+    DesiredApp,
+    DesiredState,
+    reconcile,
+)
+from tests._urls import URL_POLLS
+
+DESIRED_STATE = DesiredState(
+    apps=[
+        DesiredApp(name="polls", version="7.1.1", url=URL_POLLS),
+        DesiredApp(name="provisioning_api", enabled=False),
+    ],
+    system_config={"loglevel": 1},
+)
+
+
+@pytest.mark.xdist_group(name="app")
+def test_reconcile(instance_installed_static_version: Instance) -> None:
+    plan = reconcile(instance_installed_static_version, DESIRED_STATE)
+
+    assert [app.name for app in plan.install_apps] == ["polls"]
+    assert plan.enable_apps == ["polls"]
+    assert plan.disable_apps == ["provisioning_api"]
+    assert plan.system_config == {"loglevel": 1}
+
+    app = instance_installed_static_version.get_app("polls")
+
+    assert app.version == "7.1.1"
+    assert app.is_enabled
+    assert not instance_installed_static_version.get_app("provisioning_api").is_enabled
+    assert instance_installed_static_version.get_system_config("loglevel") == 1
+
+
+@pytest.mark.xdist_group(name="app")
+def test_reconcile_converged(instance_installed_static_version: Instance) -> None:
+    reconcile(instance_installed_static_version, DESIRED_STATE)
+
+    metrics: List[CommandMetrics] = []
+
+    instance = Instance(
+        instance_installed_static_version.path, metrics_hooks=[metrics.append]
+    )
+
+    assert reconcile(instance, DESIRED_STATE).is_empty
+    assert len(metrics) == 1
+
+
+@pytest.mark.xdist_group(name="app")
+def test_reconcile_dry_run(instance_installed_static_version: Instance) -> None:
+    plan = reconcile(instance_installed_static_version, DESIRED_STATE, dry_run=True)
+
+    assert not plan.is_empty
+    assert "polls" not in instance_installed_static_version.app_index
+    assert instance_installed_static_version.get_app("provisioning_api").is_enabled
@@ -0,0 +1,65 @@
+import os
+
+from cyberfusion.Common import generate_random_string
+
+from cyberfusion.NextCloudSupport.instance import DatabaseType, Instance
+from cyberfusion.NextCloudSupport.template import Template
+
+
+def test_template_clone_sqlite(
+    workspace_directory: str, nextcloud_2900_archive: str, tmp_path
+) -> None:
+    Instance.download(workspace_directory, zip_path=nextcloud_2900_archive)
+
+    Instance.install(
+        workspace_directory,
+        database_host="",
+        database_name="nextcloud",
+        database_username="",
+        database_password="",
+        admin_user="admin",
+        admin_password=generate_random_string(),
+        database_type=DatabaseType.SQLITE,
+    )
+
+    template = Template(workspace_directory)
+    template.dump()
+
+    path = os.path.join(tmp_path, "clone")
+
+    os.mkdir(path)
+
+    instance = template.clone(
+        path,
+        admin_user="admin",
+        admin_password=generate_random_string(),
+        system_config={"trusted_domains": ["clone.example.com"]},
+        hardlink=True,
+    )
+
+    template_config = template.config
+
+    assert instance.version == Instance(workspace_directory).version
+    assert instance.get_system_config("datadirectory") == os.path.join(path, "data")
+    assert instance.get_system_config("trusted_domains") == ["clone.example.com"]
+
+    for name in ["instanceid", "passwordsalt", "secret"]:
+        assert instance.get_system_config(name) != template_config[name]
+
+    assert os.path.isdir(
+        os.path.join(
+            path, "data", f"appdata_{instance.get_system_config('instanceid')}"
+        )
+    )
+    assert [user.id for user in instance.users] == ["admin"]
+
+    # Code is hardlinked, config is copied
+
+    assert (
+        os.stat(os.path.join(path, "index.php")).st_ino
+        == os.stat(os.path.join(workspace_directory, "index.php")).st_ino
+    )
+    assert (
+        os.stat(os.path.join(path, "config", "config.php")).st_ino
+        != os.stat(os.path.join(workspace_directory, "config", "config.php")).st_ino
+    )
@@ -0,0 +1,119 @@
+from cyberfusion.NextCloudSupport._worker import Worker
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+def test_worker_run_command(instance_installed_static_version: Instance) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    assert worker.run_command(["config:system:get", "version"]).count(".") >= 2
+
+    assert worker.is_running
+
+    worker.stop()
+
+
+def test_worker_reuses_process(instance_installed_static_version: Instance) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    worker.run_command(["status"])
+
+    pid = worker._process.pid
+
+    worker.run_command(["status"])
+
+    assert worker._process.pid == pid
+
+    worker.stop()
+
+
+def test_worker_restarts_after_crash(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    worker.run_command(["status"])
+
+    worker._process.kill()
+    worker._process.wait()
+
+    assert not worker.is_running
+
+    worker.run_command(["status"])
+
+    assert worker.is_running
+
+    worker.stop()
+
+
+def test_worker_restarts_after_idle_timeout(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path, idle_timeout=0)
+
+    worker.run_command(["status"])
+
+    pid = worker._process.pid
+
+    worker.run_command(["status"])
+
+    assert worker._process.pid != pid
+
+    worker.stop()
+
+
+def test_worker_stops_after_restart_command(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    worker.run_command(["app:disable", "survey_client"])
+
+    assert not worker.is_running
+
+
+def test_instance_use_worker(instance_installed_static_version: Instance) -> None:
+    instance = Instance(instance_installed_static_version.path, use_worker=True)
+
+    assert instance.version == instance_installed_static_version.version
+
+    assert instance.worker.is_running
+
+    instance.worker.stop()
+
+
+def test_worker_reloads_config_changed_by_other_process(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    worker.run_command(["status"])
+
+    pid = worker._process.pid
+
+    instance_installed_static_version.run_command(
+        ["config:system:set", "loglevel", "--value=1", "--type=integer"]
+    )
+
+    assert worker.run_command(["config:system:get", "loglevel"]) == "1"
+    assert worker._process.pid != pid
+
+    worker.stop()
+
+
+def test_worker_reloads_app_config_changed_by_other_process(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    worker.run_command(["config:app:set", "core", "test", "--value=a"])
+
+    pid = worker._process.pid
+
+    instance_installed_static_version.run_command(
+        ["config:app:set", "core", "test", "--value=b"]
+    )
+
+    assert worker.run_command(["config:app:get", "core", "test"]) == "b"
+    assert worker._process.pid == pid
+
+    worker.stop()
@@ -1,6 +1,11 @@
 import pytest
 
-from cyberfusion.NextCloudSupport.app import App
+from cyberfusion.NextCloudSupport.app import (
+    App,
+    AppRecord,
+    _get_app_index,
+    _get_available_app_updates,
+)
 from cyberfusion.NextCloudSupport.exceptions import AppNotInstalledError
 from cyberfusion.NextCloudSupport.instance import Instance
 
@@ -21,3 +26,26 @@ def test_app_install_name_and_url(
             name="example.com",
             url="https://example.com",
         )
+
+
+def test_get_app_index() -> None:
+    assert _get_app_index(
+        {
+            "enabled": {"mail": "3.0.0", "files": "2.0.0 (2.0.1)"},
+            "disabled": {"encryption": "1.0.0"},
+        }
+    ) == {
+        "mail": AppRecord(name="mail", version="3.0.0", is_enabled=True),
+        "files": AppRecord(name="files", version="2.0.0", is_enabled=True),
+        "encryption": AppRecord(name="encryption", version="1.0.0", is_enabled=False),
+    }
+
+
+def test_get_available_app_updates() -> None:
+    assert _get_available_app_updates(
+        [
+            "mail new version available: 3.1.0",
+            "polls new version available: 7.2.0",
+            "Some unrelated line",
+        ]
+    ) == {"mail": "3.1.0", "polls": "7.2.0"}
@@ -0,0 +1,158 @@
+import io
+import os
+import tarfile
+import zipfile
+from typing import Dict, Generator
+
+import pytest
+
+from cyberfusion.NextCloudSupport._archive import extract_app, extract_zip
+
+
+def _get_tar(files: Dict[str, str]) -> io.BytesIO:
+    result = io.BytesIO()
+
+    with tarfile.open(fileobj=result, mode="w:gz") as f:
+        for name, contents in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+
+            f.addfile(info, io.BytesIO(contents.encode()))
+
+    result.seek(0)
+
+    return result
+
+
+def test_extract_zip_strip_prefix(
+    workspace_directory: Generator[str, None, None],
+) -> None:
+    zip_path = os.path.join(workspace_directory, "test.zip")
+    destination_path = os.path.join(workspace_directory, "destination")
+
+    os.mkdir(destination_path)
+
+    with zipfile.ZipFile(zip_path, "w") as z:
+        z.writestr("nextcloud/", "")
+        z.writestr("nextcloud/index.php", "index")
+        z.writestr("nextcloud/lib/base.php", "base")
+        z.writestr("other.txt", "other")
+
+    extract_zip(zip_path, destination_path, strip_prefix="nextcloud/", threads=2)
+
+    assert sorted(os.listdir(destination_path)) == ["index.php", "lib"]
+
+    with open(os.path.join(destination_path, "lib", "base.php")) as f:
+        assert f.read() == "base"
+
+
+def test_extract_zip_outside_destination(
+    workspace_directory: Generator[str, None, None],
+) -> None:
+    zip_path = os.path.join(workspace_directory, "test.zip")
+    destination_path = os.path.join(workspace_directory, "destination")
+
+    os.mkdir(destination_path)
+
+    with zipfile.ZipFile(zip_path, "w") as z:
+        z.writestr("../evil.txt", "evil")
+
+    with pytest.raises(ValueError):
+        extract_zip(zip_path, destination_path)
+
+    assert not os.path.exists(os.path.join(workspace_directory, "evil.txt"))
+
+
+def test_extract_app(
+    workspace_directory: Generator[str, None, None],
+) -> None:
+    os.makedirs(os.path.join(workspace_directory, "apps", "polls"))
+
+    with open(os.path.join(workspace_directory, "apps", "polls", "old.txt"), "w"):
+        pass
+
+    name = extract_app(
+        _get_tar(
+            {
+                "polls/appinfo/info.xml": "<info />",
+                "polls/lib/Polls.php": "<?php",
+            }
+        ),
+        workspace_directory,
+    )
+
+    assert name == "polls"
+    assert sorted(os.listdir(os.path.join(workspace_directory, "apps", "polls"))) == [
+        "appinfo",
+        "lib",
+    ]
+    assert os.listdir(workspace_directory) == ["apps"]
+
+
+def test_extract_app_dot_prefix(
+    workspace_directory: Generator[str, None, None],
+) -> None:
+    os.mkdir(os.path.join(workspace_directory, "apps"))
+
+    f = io.BytesIO()
+
+    with tarfile.open(fileobj=f, mode="w:gz") as tar:
+        for name in ["./", "./polls/"]:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+
+            tar.addfile(info)
+
+        info = tarfile.TarInfo("./polls/appinfo/info.xml")
+        info.size = len("<info />")
+
+        tar.addfile(info, io.BytesIO(b"<info />"))
+
+    f.seek(0)
+
+    assert extract_app(f, workspace_directory) == "polls"
+    assert os.listdir(os.path.join(workspace_directory, "apps", "polls")) == ["appinfo"]
+
+
+def test_extract_app_multiple_directories(
+    workspace_directory: Generator[str, None, None],
+) -> None:
+    os.mkdir(os.path.join(workspace_directory, "apps"))
+
+    with pytest.raises(ValueError):
+        extract_app(
+            _get_tar({"polls/appinfo/info.xml": "", "other/info.xml": ""}),
+            workspace_directory,
+        )
+
+    assert os.listdir(workspace_directory) == ["apps"]
+    assert not os.listdir(os.path.join(workspace_directory, "apps"))
+
+
+def test_extract_app_rename_failed(
+    workspace_directory: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    app_path = os.path.join(workspace_directory, "apps", "polls")
+
+    os.makedirs(app_path)
+
+    with open(os.path.join(app_path, "old.txt"), "w"):
+        pass
+
+    rename = os.rename
+
+    def _rename(source: str, destination: str) -> None:
+        if destination == app_path and not source.endswith(".old"):
+            raise OSError
+
+        rename(source, destination)
+
+    monkeypatch.setattr(os, "rename", _rename)
+
+    with pytest.raises(OSError):
+        extract_app(
+            _get_tar({"polls/appinfo/info.xml": "<info />"}), workspace_directory
+        )
+
+    assert os.listdir(app_path) == ["old.txt"]
+    assert os.listdir(workspace_directory) == ["apps"]
@@ -0,0 +1,63 @@
+import asyncio
+import gc
+import os
+
+import pytest
+
+from cyberfusion.NextCloudSupport.async_instance import (
+    AsyncInstance,
+    _get_lock,
+    _locks,
+)
+from cyberfusion.NextCloudSupport.exceptions import (
+    AppNotInstalledError,
+    CommandFailedError,
+)
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+def test_async_instance_get_app_not_installed(
+    instance_installed_static_version: Instance,
+) -> None:
+    instance = AsyncInstance(instance_installed_static_version.path)
+
+    with pytest.raises(AppNotInstalledError):
+        asyncio.run(instance.get_app("doesntexist"))
+
+
+def test_async_instance_run_command_raises_exception() -> None:
+    instance = AsyncInstance(os.getcwd())
+
+    with pytest.raises(CommandFailedError) as e:
+        asyncio.run(instance.run_command(["doesntexist"]))
+
+    assert e.value.command is not None
+    assert e.value.return_code is not None
+    assert e.value.stdout is not None
+    assert e.value.stderr is not None
+
+
+def test_get_lock_shared_per_path() -> None:
+    async def get_locks() -> tuple:
+        return (
+            _get_lock("/tmp"),
+            _get_lock("/tmp/"),
+            _get_lock("/var"),
+        )
+
+    lock_a, lock_b, lock_c = asyncio.run(get_locks())
+
+    assert lock_a is lock_b
+    assert lock_a is not lock_c
+
+
+def test_get_lock_removed_when_unused() -> None:
+    async def use_lock() -> int:
+        async with _get_lock("/tmp"):
+            assert len(_locks[asyncio.get_running_loop()]) == 1
+
+        gc.collect()
+
+        return len(_locks[asyncio.get_running_loop()])
+
+    assert asyncio.run(use_lock()) == 0
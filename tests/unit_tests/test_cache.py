@@ -0,0 +1,172 @@
+import hashlib
+import os
+import time
+
+import pytest
+from requests_mock import Mocker
+
+from cyberfusion.NextCloudSupport.cache import ArchiveCache, Cache
+from cyberfusion.NextCloudSupport.exceptions import ChecksumMismatchError
+
+URL = "https://example.com/app.tar.gz"
+
+
+def test_cache_get_set(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path))
+
+    assert cache.get(workspace_directory, "key") is None
+
+    cache.set(workspace_directory, "key", {"value": 1})
+
+    assert cache.get(workspace_directory, "key") == {"value": 1}
+
+
+def test_cache_delete(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path))
+
+    cache.set(workspace_directory, "key", "value")
+    cache.delete(workspace_directory, "key")
+
+    assert cache.get(workspace_directory, "key") is None
+
+    cache.delete(workspace_directory, "key")  # Not cached
+
+
+def test_cache_expired(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path), ttl=0)
+
+    cache.set(workspace_directory, "key", "value")
+
+    time.sleep(0.01)
+
+    assert cache.get(workspace_directory, "key") is None
+
+
+def test_cache_outdated_config(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path))
+
+    os.mkdir(os.path.join(workspace_directory, "config"))
+
+    cache.set(workspace_directory, "key", "value")
+
+    with open(os.path.join(workspace_directory, "config", "config.php"), "w"):
+        pass
+
+    assert cache.get(workspace_directory, "key") is None
+
+
+def test_cache_outdated_apps(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path))
+
+    os.mkdir(os.path.join(workspace_directory, "apps"))
+
+    cache.set(workspace_directory, "key", "value")
+
+    time.sleep(0.01)
+
+    os.mkdir(os.path.join(workspace_directory, "apps", "mail"))
+
+    assert cache.get(workspace_directory, "key") is None
+
+
+def test_cache_evicts_least_recently_used(workspace_directory: str, tmp_path) -> None:
+    cache = Cache(str(tmp_path), max_entries=2)
+
+    cache.set(workspace_directory, "a", "value")
+    time.sleep(0.01)
+    cache.set(workspace_directory, "b", "value")
+    time.sleep(0.01)
+    cache.get(workspace_directory, "a")  # Mark as recently used
+    time.sleep(0.01)
+    cache.set(workspace_directory, "c", "value")
+
+    assert cache.get(workspace_directory, "a") == "value"
+    assert cache.get(workspace_directory, "b") is None
+    assert cache.get(workspace_directory, "c") == "value"
+
+
+def test_cache_directory_private(tmp_path) -> None:
+    path = os.path.join(str(tmp_path), "cache")
+
+    Cache(path)
+
+    assert os.stat(path).st_mode & 0o777 == 0o700
+
+
+def test_archive_cache_downloads_once(requests_mock: Mocker, tmp_path) -> None:
+    requests_mock.get(URL, content=b"archive")
+
+    cache = ArchiveCache(str(tmp_path))
+
+    for _ in range(2):
+        with cache.get(URL) as path:
+            with open(path, "rb") as f:
+                assert f.read() == b"archive"
+
+    assert requests_mock.call_count == 1
+
+
+def test_archive_cache_other_sha256(requests_mock: Mocker, tmp_path) -> None:
+    requests_mock.get(URL, content=b"old")
+
+    cache = ArchiveCache(str(tmp_path))
+
+    with cache.get(URL):
+        pass
+
+    requests_mock.get(URL, content=b"new")
+
+    with cache.get(URL, sha256=hashlib.sha256(b"new").hexdigest()) as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"new"
+
+    assert requests_mock.call_count == 2
+
+
+def test_archive_cache_checksum_mismatch(requests_mock: Mocker, tmp_path) -> None:
+    requests_mock.get(URL, content=b"archive")
+
+    cache = ArchiveCache(str(tmp_path))
+
+    with pytest.raises(ChecksumMismatchError):
+        with cache.get(URL, sha256="0" * 64):
+            pass
+
+    assert not os.listdir(os.path.join(tmp_path, "blobs"))
+
+
+def test_archive_cache_corrupted(requests_mock: Mocker, tmp_path) -> None:
+    requests_mock.get(URL, content=b"archive")
+
+    cache = ArchiveCache(str(tmp_path))
+
+    with cache.get(URL) as path:
+        pass
+
+    with open(path, "wb") as f:
+        f.write(b"corrupted")
+
+    with cache.get(URL) as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"archive"
+
+    assert requests_mock.call_count == 2
+
+
+def test_archive_cache_evicts_least_recently_used(
+    requests_mock: Mocker, tmp_path
+) -> None:
+    cache = ArchiveCache(str(tmp_path), max_size=10)
+
+    for i in range(3):
+        requests_mock.get(f"{URL}{i}", content=b"x" * 4 + str(i).encode())
+
+        with cache.get(f"{URL}{i}") as path:
+            assert os.path.isfile(path)  # Not evicted while used
+
+    assert len(os.listdir(os.path.join(tmp_path, "blobs"))) == 2
+
+    with cache.get(f"{URL}0"):
+        pass
+
+    assert requests_mock.call_count == 4
@@ -0,0 +1,182 @@
+import os
+import zipfile
+from typing import Dict
+
+import pytest
+
+from cyberfusion.NextCloudSupport._archive import extract_zip
+from cyberfusion.NextCloudSupport.code_store import CodeStore
+from cyberfusion.NextCloudSupport.exceptions import DirectoryNotEmptyError
+
+
+def _create_zip(path: str, release: str, files: Dict[str, str]) -> str:
+    zip_path = os.path.join(path, f"nextcloud-{release}.zip")
+
+    with zipfile.ZipFile(zip_path, "w") as z:
+        z.writestr(
+            "nextcloud/version.php",
+            f"<?php\n$OC_VersionString = '{release}';\n",
+        )
+        z.writestr("nextcloud/.htaccess", "# htaccess")
+        z.writestr("nextcloud/config/config.sample.php", "<?php")
+        z.writestr("nextcloud/apps/files/appinfo/info.xml", f"<info>{release}</info>")
+
+        for name, contents in files.items():
+            z.writestr(f"nextcloud/{name}", contents)
+
+    return zip_path
+
+
+@pytest.fixture
+def code_store(workspace_directory: str) -> CodeStore:
+    code_store = CodeStore(os.path.join(workspace_directory, "store"))
+
+    code_store.add(_create_zip(workspace_directory, "1.0.0", {"old.php": "<?php"}))
+    code_store.add(_create_zip(workspace_directory, "2.0.0", {"new.php": "<?php"}))
+
+    return code_store
+
+
+@pytest.fixture
+def instance_path(workspace_directory: str) -> str:
+    path = os.path.join(workspace_directory, "instance")
+
+    os.mkdir(path)
+
+    return path
+
+
+def test_add(code_store: CodeStore) -> None:
+    assert code_store.releases == ["1.0.0", "2.0.0"]
+
+    path = code_store.get_path("1.0.0")
+
+    assert not os.stat(os.path.join(path, "version.php")).st_mode & 0o222
+    assert os.stat(os.path.join(path, ".htaccess")).st_mode & 0o200
+
+
+def test_add_existing(code_store: CodeStore, workspace_directory: str) -> None:
+    assert code_store.add(_create_zip(workspace_directory, "1.0.0", {})) == "1.0.0"
+    assert code_store.releases == ["1.0.0", "2.0.0"]
+
+
+def test_link(code_store: CodeStore, instance_path: str) -> None:
+    code_store.link("1.0.0", instance_path)
+
+    path = code_store.get_path("1.0.0")
+
+    assert os.path.samefile(
+        os.path.join(instance_path, "apps", "files", "appinfo", "info.xml"),
+        os.path.join(path, "apps", "files", "appinfo", "info.xml"),
+    )
+    assert not os.path.samefile(
+        os.path.join(instance_path, ".htaccess"), os.path.join(path, ".htaccess")
+    )
+    assert not os.path.samefile(
+        os.path.join(instance_path, "config", "config.sample.php"),
+        os.path.join(path, "config", "config.sample.php"),
+    )
+    assert code_store.get_linked_release(instance_path) == "1.0.0"
+
+
+def test_link_not_empty(code_store: CodeStore, instance_path: str) -> None:
+    open(os.path.join(instance_path, "file"), "w").close()
+
+    with pytest.raises(DirectoryNotEmptyError):
+        code_store.link("1.0.0", instance_path)
+
+
+def test_relink(code_store: CodeStore, instance_path: str) -> None:
+    code_store.link("1.0.0", instance_path)
+
+    os.makedirs(os.path.join(instance_path, "apps", "polls"))
+
+    with open(os.path.join(instance_path, "config", "config.php"), "w") as f:
+        f.write("<?php")
+
+    code_store.relink(instance_path, "2.0.0")
+
+    assert code_store.get_linked_release(instance_path) == "2.0.0"
+    assert sorted(os.listdir(instance_path)) == [
+        ".htaccess",
+        "apps",
+        "config",
+        "new.php",
+        "version.php",
+    ]
+    assert sorted(os.listdir(os.path.join(instance_path, "apps"))) == [
+        "files",
+        "polls",
+    ]
+    assert os.path.isfile(os.path.join(instance_path, "config", "config.php"))
+
+    # Code store is not changed
+
+    assert os.path.isfile(os.path.join(code_store.get_path("1.0.0"), "old.php"))
+
+
+def test_relink_not_linked(code_store: CodeStore, instance_path: str) -> None:
+    with pytest.raises(ValueError):
+        code_store.relink(instance_path, "2.0.0")
+
+
+def test_deduplicate(
+    code_store: CodeStore, instance_path: str, workspace_directory: str
+) -> None:
+    extract_zip(
+        _create_zip(workspace_directory, "1.0.0", {"old.php": "<?php"}),
+        instance_path,
+        strip_prefix="nextcloud/",
+    )
+
+    with open(os.path.join(instance_path, "old.php"), "w") as f:
+        f.write("<?php // Modified")
+
+    path = code_store.get_path("1.0.0")
+
+    assert code_store.deduplicate(instance_path) == len(
+        "<?php\n$OC_VersionString = '1.0.0';\n"
+    ) + len("<info>1.0.0</info>")
+
+    assert os.path.samefile(
+        os.path.join(instance_path, "version.php"), os.path.join(path, "version.php")
+    )
+    assert not os.path.samefile(
+        os.path.join(instance_path, "old.php"), os.path.join(path, "old.php")
+    )
+    assert not os.path.samefile(
+        os.path.join(instance_path, ".htaccess"), os.path.join(path, ".htaccess")
+    )
+    assert code_store.get_linked_release(instance_path) == "1.0.0"
+
+    # Already deduplicated
+
+    assert code_store.deduplicate(instance_path) == 0
+
+
+def test_deduplicate_skips_mode_and_stale_files(
+    code_store: CodeStore, instance_path: str, workspace_directory: str
+) -> None:
+    extract_zip(
+        _create_zip(workspace_directory, "1.0.0", {"old.php": "<?php"}),
+        instance_path,
+        strip_prefix="nextcloud/",
+    )
+
+    os.chmod(os.path.join(instance_path, "old.php"), 0o755)
+
+    # Left by interrupted run
+
+    open(os.path.join(instance_path, ".version.php.dedup"), "w").close()
+
+    code_store.deduplicate(instance_path)
+
+    path = code_store.get_path("1.0.0")
+
+    assert not os.path.samefile(
+        os.path.join(instance_path, "old.php"), os.path.join(path, "old.php")
+    )
+    assert os.path.samefile(
+        os.path.join(instance_path, "version.php"), os.path.join(path, "version.php")
+    )
+    assert not os.path.exists(os.path.join(instance_path, ".version.php.dedup"))
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+from typing import Generator, List
+
+import pytest
+
+from cyberfusion.NextCloudSupport import _database
+from cyberfusion.NextCloudSupport.app import AppRecord
+from cyberfusion.NextCloudSupport.instance import Instance
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics
+
+CONFIG = """<?php
+$CONFIG = array (
+  'dbtype' => 'sqlite3',
+  'dbname' => 'nextcloud',
+  'dbtableprefix' => 'oc_',
+  'datadirectory' => '{data_directory}',
+);
+"""
+
+
+@pytest.fixture
+def instance_files(workspace_directory: str) -> Generator[str, None, None]:
+    data_directory = os.path.join(workspace_directory, "data")
+
+    os.mkdir(os.path.join(workspace_directory, "config"))
+    os.mkdir(data_directory)
+
+    with open(os.path.join(workspace_directory, "config", "config.php"), "w") as f:
+        f.write(CONFIG.format(data_directory=data_directory))
+
+    for name, version in [("files", "2.0.1"), ("mail", "3.0.1"), ("polls", "7.0.0")]:
+        os.makedirs(os.path.join(workspace_directory, "apps", name, "appinfo"))
+
+        with open(
+            os.path.join(workspace_directory, "apps", name, "appinfo", "info.xml"),
+            "w",
+        ) as f:
+            f.write(f"<info><id>{name}</id><version>{version}</version></info>")
+
+    connection = sqlite3.connect(os.path.join(data_directory, "nextcloud.db"))
+
+    connection.executescript(
+        """
+        CREATE TABLE oc_appconfig (appid TEXT, configkey TEXT, configvalue TEXT);
+        CREATE TABLE oc_users (uid TEXT, displayname TEXT, uid_lower TEXT);
+
+        INSERT INTO oc_appconfig VALUES
+            ('files', 'enabled', 'yes'),
+            ('files', 'installed_version', '2.0.0'),
+            ('mail', 'enabled', '["admin"]'),
+            ('mail', 'installed_version', '3.0.0'),
+            ('mail', 'secret', '$AppConfigEncryption$abc'),
+            ('polls', 'enabled', 'no'),
+            ('polls', 'installed_version', '6.0.0'),
+            ('removed', 'enabled', 'yes');
+
+        INSERT INTO oc_users VALUES
+            ('b', 'User B', 'b'),
+            ('A', NULL, 'a'),
+            ('c', 'User C', 'c');
+        """
+    )
+    connection.commit()
+    connection.close()
+
+    yield workspace_directory
+
+    _database.dispose_engines()
+
+
+def test_get_app_index(instance_files: str) -> None:
+    assert _database.get_app_index(instance_files) == {
+        "files": AppRecord(name="files", version="2.0.0", is_enabled=True),
+        "mail": AppRecord(name="mail", version="3.0.0", is_enabled=True),
+        "polls": AppRecord(name="polls", version="7.0.0", is_enabled=False),
+    }
+
+
+def test_get_app_config(instance_files: str) -> None:
+    assert _database.get_app_config(
+        instance_files, ["installed_version"], app="files"
+    ) == {"files": {"installed_version": "2.0.0"}}
+
+
+def test_get_users(instance_files: str) -> None:
+    assert _database.get_users(instance_files, 2, 0) == {"A": "A", "b": "User B"}
+    assert _database.get_users(instance_files, 2, 2) == {"c": "User C"}
+    assert _database.get_user_count(instance_files) == 3
+
+
+def test_get_users_user_backend_app(instance_files: str) -> None:
+    connection = sqlite3.connect(os.path.join(instance_files, "data", "nextcloud.db"))
+
+    connection.execute(
+        "INSERT INTO oc_appconfig VALUES ('user_ldap', 'enabled', 'yes')"
+    )
+    connection.commit()
+    connection.close()
+
+    assert _database.get_users(instance_files, 2, 0) is None
+    assert _database.get_user_count(instance_files) is None
+
+
+def test_database_missing(instance_files: str) -> None:
+    os.unlink(os.path.join(instance_files, "data", "nextcloud.db"))
+
+    assert _database.get_app_index(instance_files) is None
+
+    # Read-only, so the database is not created
+
+    assert not os.path.exists(os.path.join(instance_files, "data", "nextcloud.db"))
+
+
+def test_get_host_and_port() -> None:
+    assert _database._get_host_and_port({"dbhost": "db:3307"}) == ("db", 3307, None)
+    assert _database._get_host_and_port(
+        {"dbhost": "localhost:/run/mysqld/mysqld.sock"}
+    ) == ("localhost", None, "/run/mysqld/mysqld.sock")
+    assert _database._get_host_and_port({"dbhost": "db", "dbport": "3306"}) == (
+        "db",
+        3306,
+        None,
+    )
+
+
+def test_engine_shared_by_mysql_databases(workspace_directory: str) -> None:
+    locations = []
+
+    for name in ["a", "b"]:
+        path = os.path.join(workspace_directory, name)
+
+        os.makedirs(os.path.join(path, "config"))
+
+        with open(os.path.join(path, "config", "config.php"), "w") as f:
+            f.write(
+                "<?php\n$CONFIG = ['dbtype' => 'mysql', 'dbhost' => 'db',"
+                f" 'dbuser' => 'u', 'dbpassword' => 'p', 'dbname' => '{name}'];\n"
+            )
+
+        locations.append(_database._get_location(path))
+
+    assert [schema for _, schema, _ in locations] == ["a", "b"]
+    assert _database._get_engine(locations[0][0]) is _database._get_engine(
+        locations[1][0]
+    )
+    assert all(len(key) == 64 for key in _database._engines)
+
+    _database.dispose_engines()
+
+
+def test_engine_per_credentials() -> None:
+    from sqlalchemy import URL
+
+    engines = [
+        _database._get_engine(
+            URL.create("mysql+pymysql", username=username, password="p", host="db")
+        )
+        for username in ["a", "b"]
+    ]
+
+    assert engines[0] is not engines[1]
+
+    _database.dispose_engines()
+
+
+def test_engine_not_pooled() -> None:
+    from sqlalchemy import URL
+    from sqlalchemy.pool import NullPool
+
+    engine = _database._get_engine(URL.create("mysql+pymysql", host="db"))
+
+    assert isinstance(engine.pool, NullPool)
+
+    _database.dispose_engines()
+
+    assert not _database._engines
+
+
+def test_instance_database_reads(instance_files: str) -> None:
+    instance = Instance(instance_files, database_reads=True)
+
+    assert instance.get_app("mail").is_enabled
+    assert not instance.get_app("polls").is_enabled
+    assert instance.get_app("files").version == "2.0.0"
+    assert [user.id for user in instance.iter_users(page_size=2)] == ["A", "b", "c"]
+    assert instance.user_count == 3
+    assert instance.get_app_config("files", "installed_version") == "2.0.0"
+    assert instance.get_app_config("files", "doesntexist") is None
+
+
+def test_instance_filesystem_and_database_reads_is_enabled(
+    instance_files: str,
+) -> None:
+    metrics: List[CommandMetrics] = []
+
+    instance = Instance(
+        instance_files,
+        filesystem_reads=True,
+        database_reads=True,
+        metrics_hooks=[metrics.append],
+    )
+
+    assert [app.is_enabled for app in instance.installed_apps] == [
+        True,
+        True,
+        False,
+    ]
+    assert not instance.get_app("polls").is_enabled
+    assert not metrics
@@ -0,0 +1,151 @@
+import os
+
+import pytest
+
+from cyberfusion.NextCloudSupport import _filesystem
+
+CONFIG = """<?php
+$CONFIG = array (
+  'instanceid' => 'oc1234567890',
+  'passwordsalt' => 'a\\'b\\\\c',
+  'trusted_domains' =>
+  array (
+    0 => 'localhost',
+    2 => 'example.com',
+  ),
+  'overwrite.cli.url' => "http://localhost",
+  'version' => '29.0.0.19',
+  'installed' => true,
+  'loglevel' => 2,
+  'float' => 1.1,
+  'list' => ['a', 'b', ],
+  'null' => NULL, // Comment
+);
+"""
+
+VERSION = """<?php
+$OC_Version = array(29,0,0,19);
+$OC_VersionString = '29.0.0';
+"""
+
+
+@pytest.fixture
+def instance_files(workspace_directory: str) -> str:
+    os.mkdir(os.path.join(workspace_directory, "config"))
+
+    with open(os.path.join(workspace_directory, "config", "config.php"), "w") as f:
+        f.write(CONFIG)
+
+    with open(os.path.join(workspace_directory, "version.php"), "w") as f:
+        f.write(VERSION)
+
+    for name, version in [("files", "2.0.0"), ("mail", "3.0.0")]:
+        os.makedirs(os.path.join(workspace_directory, "apps", name, "appinfo"))
+
+        with open(
+            os.path.join(workspace_directory, "apps", name, "appinfo", "info.xml"),
+            "w",
+        ) as f:
+            f.write(f"<info><id>{name}</id><version>{version}</version></info>")
+
+    os.makedirs(os.path.join(workspace_directory, "apps", "notanapp"))
+
+    return workspace_directory
+
+
+def test_read_config(instance_files: str) -> None:
+    assert _filesystem.read_config(instance_files) == {
+        "instanceid": "oc1234567890",
+        "passwordsalt": "a'b\\c",
+        "trusted_domains": {"0": "localhost", "2": "example.com"},
+        "overwrite.cli.url": "http://localhost",
+        "version": "29.0.0.19",
+        "installed": True,
+        "loglevel": 2,
+        "float": 1.1,
+        "list": ["a", "b"],
+        "null": None,
+    }
+
+
+def test_read_config_additional_config_overrides(instance_files: str) -> None:
+    with open(os.path.join(instance_files, "config", "extra.config.php"), "w") as f:
+        f.write("<?php\n$CONFIG = ['loglevel' => 0];\n")
+
+    assert _filesystem.read_config(instance_files)["loglevel"] == 0
+
+
+def test_read_config_expression(instance_files: str) -> None:
+    with open(os.path.join(instance_files, "config", "apps.config.php"), "w") as f:
+        f.write(
+            "<?php\n$CONFIG = ['apps_paths' => [['path' => OC::$SERVERROOT . '/apps']]];\n"
+        )
+
+    assert _filesystem.read_config(instance_files) is None
+
+
+def test_read_config_missing(workspace_directory: str) -> None:
+    assert _filesystem.read_config(workspace_directory) is None
+
+
+def test_get_version(instance_files: str) -> None:
+    assert _filesystem.get_version(instance_files) == "29.0.0.19"
+
+
+def test_get_version_upgrade_pending(instance_files: str) -> None:
+    with open(os.path.join(instance_files, "version.php"), "w") as f:
+        f.write("<?php\n$OC_Version = array(30,0,0,1);\n")
+
+    assert _filesystem.get_version(instance_files) is None
+
+
+def test_get_release(instance_files: str) -> None:
+    assert _filesystem.get_release(instance_files) == "29.0.0"
+
+
+def test_get_release_missing(workspace_directory: str) -> None:
+    assert _filesystem.get_release(workspace_directory) is None
+
+
+def test_get_app_versions(instance_files: str) -> None:
+    assert _filesystem.get_app_versions(instance_files) == {
+        "files": "2.0.0",
+        "mail": "3.0.0",
+    }
+
+
+def test_get_app_versions_apps_paths(instance_files: str) -> None:
+    os.makedirs(os.path.join(instance_files, "custom_apps", "polls", "appinfo"))
+
+    with open(
+        os.path.join(instance_files, "custom_apps", "polls", "appinfo", "info.xml"),
+        "w",
+    ) as f:
+        f.write("<info><id>polls</id><version>7.1.1</version></info>")
+
+    with open(os.path.join(instance_files, "config", "apps.config.php"), "w") as f:
+        f.write(
+            f"""<?php
+$CONFIG = [
+  'apps_paths' => [
+    ['path' => '{instance_files}/apps', 'url' => '/apps', 'writable' => false],
+    ['path' => '{instance_files}/custom_apps', 'url' => '/custom_apps', 'writable' => true],
+  ],
+];
+"""
+        )
+
+    assert _filesystem.get_app_versions(instance_files) == {
+        "files": "2.0.0",
+        "mail": "3.0.0",
+        "polls": "7.1.1",
+    }
+
+
+def test_get_app_versions_no_version(instance_files: str) -> None:
+    with open(
+        os.path.join(instance_files, "apps", "mail", "appinfo", "info.xml"), "w"
+    ) as f:
+        f.write("<info><id>mail</id></info>")
+
+    assert _filesystem.get_app_versions(instance_files) is None
@@ -0,0 +1,93 @@
+import io
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cyberfusion.NextCloudSupport import _database
+from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
+from cyberfusion.NextCloudSupport.fleet import Fleet
+from cyberfusion.NextCloudSupport.instance import cached_property
+
+
+def test_fleet_run_isolates_errors(workspace_directory: str) -> None:
+    fleet = Fleet([workspace_directory, os.getcwd()])
+
+    results = fleet.run(lambda instance: instance.version)
+
+    assert [result.path for result in results] == [workspace_directory, os.getcwd()]
+
+    for result in results:
+        assert not result.succeeded
+        assert result.value is None
+        assert isinstance(result.error, CommandFailedError)
+
+
+def test_fleet_iter_results(workspace_directory: str) -> None:
+    fleet = Fleet([workspace_directory])
+
+    assert [
+        result.value for result in fleet.iter_results(lambda instance: instance.path)
+    ] == [workspace_directory]
+
+
+def test_fleet_write_inventory(workspace_directory: str) -> None:
+    f = io.StringIO()
+
+    assert Fleet([workspace_directory]).write_inventory(f) == (0, 1)
+
+    record = json.loads(f.getvalue())
+
+    assert record["path"] == workspace_directory
+    assert record["inventory"] is None
+    assert record["error"].startswith("CommandFailedError(")
+
+
+def test_fleet_run_duplicate_paths(workspace_directory: str) -> None:
+    counter = itertools.count()
+
+    results = Fleet([workspace_directory] * 2, max_workers=2).run(
+        lambda instance: next(counter)
+    )
+
+    assert sorted(result.value for result in results) == [0, 1]
+
+
+def test_fleet_run_disposes_engines(workspace_directory: str) -> None:
+    from sqlalchemy import URL
+
+    Fleet([workspace_directory]).run(
+        lambda instance: _database._get_engine(URL.create("sqlite"))
+    )
+
+    assert not _database._engines
+
+
+def test_fleet_max_workers_per_database_host(workspace_directory: str) -> None:
+    os.mkdir(os.path.join(workspace_directory, "config"))
+
+    with open(os.path.join(workspace_directory, "config", "config.php"), "w") as f:
+        f.write("<?php\n$CONFIG = ['dbhost' => 'db'];\n")
+
+    fleet = Fleet([workspace_directory], max_workers_per_database_host=1)
+
+    (result,) = fleet.run(lambda instance: instance.path)
+
+    assert result.value == workspace_directory
+    assert list(fleet._database_host_semaphores) == ["db"]
+
+
+def test_cached_property_not_serialized() -> None:
+    """Instances in a Fleet compute properties in parallel."""
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Object:
+        @cached_property
+        def value(self) -> int:
+            return barrier.wait()
+
+    objects = [Object(), Object()]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert sorted(executor.map(lambda o: o.value, objects)) == [0, 1]
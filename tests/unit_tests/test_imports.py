@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Modules that are slow to import, and are imported when used
+
+LAZY_MODULES = ["requests", "cyberfusion.Common", "asyncio", "sqlalchemy"]
+
+CODE = """
+import json, sys
+
+__import__(sys.argv[1])
+
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "cyberfusion.NextCloudSupport",
+        "cyberfusion.NextCloudSupport.instance",
+        "cyberfusion.NextCloudSupport.app",
+        "cyberfusion.NextCloudSupport.fleet",
+    ],
+)
+def test_lazy_modules_not_imported(tmp_path, module: str) -> None:
+    """Import in fresh interpreter without PHP on PATH, which must succeed."""
+    imported_modules = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", CODE, module],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+            env={**os.environ, "PATH": str(tmp_path)},
+        ).stdout
+    )
+
+    assert not [m for m in LAZY_MODULES if m in imported_modules]
@@ -1,15 +1,23 @@
 import os
+import zipfile
 from typing import Generator
 
 import pytest
 
 from cyberfusion.NextCloudSupport.exceptions import (
     AppNotInstalledError,
+    ChecksumMismatchError,
     CommandFailedError,
 )
+from cyberfusion.NextCloudSupport import instance
 from cyberfusion.NextCloudSupport.instance import (
     DirectoryNotEmptyError,
     Instance,
+    _get_user_report_command,
+    _parse_mail_account_export_output,
+    _parse_user_list_output,
+    _parse_user_report_output,
+    _set_array_item,
 )
 
 
@@ -25,6 +33,47 @@ def test_instance_download_directory_not_empty(
         )
 
 
+def test_instance_download_checksum_mismatch(
+    workspace_directory: Generator[str, None, None],
+    nextcloud_2900_archive: str,
+) -> None:
+    with pytest.raises(ChecksumMismatchError):
+        Instance.download(
+            workspace_directory,
+            zip_path=nextcloud_2900_archive,
+            sha256="0" * 64,
+        )
+
+    assert not os.listdir(workspace_directory)
+
+
+def test_instance_download_failed_retry(
+    workspace_directory: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def _download_failing(url: str, path: str, **kwargs: object) -> None:
+        with open(path, "wb") as f:
+            f.write(b"partial")
+
+        raise ConnectionError
+
+    def _download(url: str, path: str, **kwargs: object) -> None:
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("nextcloud/index.php", "<?php")
+
+    monkeypatch.setattr(instance, "download", _download_failing)
+
+    with pytest.raises(ConnectionError):
+        Instance.download(workspace_directory, sha256="0" * 64)
+
+    assert not os.listdir(workspace_directory)
+
+    monkeypatch.setattr(instance, "download", _download)
+
+    Instance.download(workspace_directory, sha256="0" * 64)
+
+    assert os.listdir(workspace_directory) == ["index.php"]
+
+
 def test_instance_get_app_not_installed(
     instance_installed_static_version: Instance,
 ) -> None:
@@ -63,3 +112,81 @@ def test_instance_update_raises_exception(
     assert e.value.stdout is not None
     assert e.value.stderr is not None
     assert e.value.streams is not None
+
+
+def test_instance_get_system_config_not_set(
+    instance_installed_static_version: Instance,
+) -> None:
+    with pytest.raises(CommandFailedError):
+        instance_installed_static_version.get_system_config("doesntexist")
+
+
+def test_instance_refresh_system_config_unset(
+    instance_installed_static_version: Instance,
+) -> None:
+    assert "system_config" not in instance_installed_static_version.__dict__
+
+    instance_installed_static_version.refresh_system_config()
+
+
+@pytest.mark.parametrize(
+    "array,index,value,expected",
+    [
+        (["a"], 0, "b", ["b"]),
+        (["a"], 1, "b", ["a", "b"]),
+        (["a"], 2, "b", {"0": "a", "2": "b"}),
+        ({"0": "a", "2": "b"}, 1, "c", ["a", "c", "b"]),
+        ({"key": "a"}, 0, "b", {"key": "a", "0": "b"}),
+        ("a", 0, "b", ["b"]),
+    ],
+)
+def test_set_array_item(array, index: int, value: str, expected) -> None:
+    assert _set_array_item(array, index, value) == expected
+
+
+def test_parse_user_list_output_empty() -> None:
+    assert _parse_user_list_output("[]") == {}
+
+
+def test_parse_user_report_output() -> None:
+    OUTPUT = """+------------------+---+
+| Account Report   |   |
++------------------+---+
+| Database         | 3 |
+|                  |   |
+| total users      | 3 |
+|                  |   |
+| user directories | 2 |
++------------------+---+
+"""
+
+    assert _parse_user_report_output(OUTPUT) == 3
+
+
+def test_get_user_report_command() -> None:
+    assert _get_user_report_command("27.1.11.3") is None
+    assert _get_user_report_command("28.0.0.11") == [
+        "user:report",
+        "--disable-dir-scan",
+    ]
+
+
+def test_parse_user_report_output_no_total() -> None:
+    with pytest.raises(ValueError):
+        _parse_user_report_output("")
+
+
+def test_parse_mail_account_export_output() -> None:
+    OUTPUT = """Account 1:
+- Name: Example
+- E-Mail: Example@example.com
+- IMAP user: example@example.com
+Account 2:
+- Name: Other
+- E-Mail: other@example.com
+"""
+
+    assert _parse_mail_account_export_output(OUTPUT) == {
+        "example@example.com",
+        "other@example.com",
+    }
@@ -0,0 +1,73 @@
+from typing import List
+
+import pytest
+
+from cyberfusion.NextCloudSupport import metrics
+from cyberfusion.NextCloudSupport.metrics import (
+    HISTOGRAM_BUCKETS,
+    CommandMetrics,
+    MetricsAggregator,
+)
+
+
+def _get_metrics(subcommand: str, wall_time: float, return_code: int = 0):
+    return CommandMetrics(
+        path="/tmp",
+        command=["php", "occ", subcommand],
+        subcommand=subcommand,
+        wall_time=wall_time,
+        cpu_time=wall_time / 2,
+        max_rss=1024,
+        return_code=return_code,
+        output_size=10,
+    )
+
+
+def test_add_hook() -> None:
+    result: List[CommandMetrics] = []
+
+    metrics.add_hook(result.append)
+
+    try:
+        metrics.emit(_get_metrics("app:list", 1))
+    finally:
+        metrics.remove_hook(result.append)
+
+    metrics.emit(_get_metrics("app:list", 1))
+
+    assert len(result) == 1
+
+
+def test_emit_hook_raises(caplog: pytest.LogCaptureFixture) -> None:
+    result: List[CommandMetrics] = []
+
+    def _hook(metrics: CommandMetrics) -> None:
+        raise RuntimeError
+
+    metrics.emit(_get_metrics("app:list", 1), [_hook, result.append])
+
+    assert len(result) == 1
+    assert "Metrics hook" in caplog.text
+
+
+def test_metrics_aggregator() -> None:
+    aggregator = MetricsAggregator()
+
+    aggregator(_get_metrics("app:list", 0.05))
+    aggregator(_get_metrics("app:list", 1000, return_code=1))
+    aggregator(_get_metrics("user:list", 2000))
+
+    stats = aggregator.stats
+
+    assert list(stats) == ["user:list", "app:list"]
+
+    assert stats["app:list"].count == 2
+    assert stats["app:list"].failures == 1
+    assert stats["app:list"].mean_wall_time == 500.025
+    assert stats["app:list"].histogram[0] == 1
+    assert stats["app:list"].histogram[len(HISTOGRAM_BUCKETS)] == 1
+    assert sum(stats["app:list"].histogram) == 2
+
+    aggregator.reset()
+
+    assert aggregator.stats == {}
@@ -1,9 +1,27 @@
+import asyncio
 import os
+import threading
+import time
+from typing import List
 
 import pytest
 
-from cyberfusion.NextCloudSupport._occ import run_command
-from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
+from cyberfusion.NextCloudSupport import _occ
+from cyberfusion.NextCloudSupport._occ import (
+    execute,
+    execute_async,
+    get_command,
+    get_fast_cli_php_ini_settings,
+    get_php_bin,
+    get_php_ini_arguments,
+    run_command,
+)
+from cyberfusion.NextCloudSupport.exceptions import (
+    CommandCancelledError,
+    CommandFailedError,
+    CommandTimeoutError,
+)
+from cyberfusion.NextCloudSupport.metrics import CommandMetrics
 
 
 def test_run_command_raises_exception() -> None:
@@ -15,3 +33,170 @@ def test_run_command_raises_exception() -> None:
     assert e.value.stdout is not None
     assert e.value.stderr is not None
     assert e.value.streams is not None
+
+
+def test_run_command_metrics_hooks() -> None:
+    metrics: List[CommandMetrics] = []
+
+    with pytest.raises(CommandFailedError):
+        run_command(["doesntexist"], os.getcwd(), metrics_hooks=[metrics.append])
+
+    assert len(metrics) == 1
+    assert metrics[0].subcommand == "doesntexist"
+    assert metrics[0].path == os.getcwd()
+    assert metrics[0].return_code != 0
+    assert metrics[0].cpu_time is not None
+    assert metrics[0].max_rss
+
+
+def test_execute_metrics_hook_raises() -> None:
+    def _hook(metrics: CommandMetrics) -> None:
+        raise RuntimeError
+
+    with pytest.raises(CommandFailedError):
+        execute(["false"], os.getcwd(), subcommand="false", metrics_hooks=[_hook])
+
+    assert (
+        execute(["echo", "a"], os.getcwd(), subcommand="echo", metrics_hooks=[_hook])
+        == "a"
+    )
+
+
+def test_get_command_php_bin() -> None:
+    assert get_command(["status"], "/usr/bin/php8.3")[0] == "/usr/bin/php8.3"
+    assert get_command(["status"])[0] == get_php_bin()
+
+
+def test_get_command_php_ini_settings() -> None:
+    command = get_command(["status"], "php", {"memory_limit": "2G", "a": "b"})
+
+    assert command == [
+        "php",
+        "-d",
+        "memory_limit=2G",
+        "-d",
+        "a=b",
+        "occ",
+        "--no-interaction",
+        "status",
+    ]
+    assert "memory_limit=512M" in get_command(["status"], "php")
+
+
+def test_get_fast_cli_php_ini_settings(tmp_path) -> None:
+    settings = get_fast_cli_php_ini_settings("/var/www/a", str(tmp_path))
+
+    assert settings["opcache.enable_cli"] == "1"
+    assert os.path.dirname(settings["opcache.file_cache"]) == str(tmp_path)
+
+    # Directory is created when a command is run
+
+    assert not os.path.exists(settings["opcache.file_cache"])
+
+    get_php_ini_arguments(settings)
+
+    assert os.stat(settings["opcache.file_cache"]).st_mode & 0o777 == 0o700
+
+    # Directory per instance
+
+    assert (
+        get_fast_cli_php_ini_settings("/var/www/b", str(tmp_path))["opcache.file_cache"]
+        != settings["opcache.file_cache"]
+    )
+
+
+def test_php_bin_compatibility() -> None:
+    assert _occ.PHP_BIN == get_php_bin()
+
+
+def test_execute_timeout() -> None:
+    started_at = time.monotonic()
+
+    with pytest.raises(CommandTimeoutError) as e:
+        execute(
+            ["sh", "-c", "echo partial; sleep 10"],
+            os.getcwd(),
+            subcommand="sh",
+            timeout=0.5,
+        )
+
+    assert time.monotonic() - started_at < 5
+    assert e.value.timeout == 0.5
+    assert e.value.stdout == "partial\n"
+
+
+def test_execute_timeout_kills_children(tmp_path) -> None:
+    pid_path = os.path.join(tmp_path, "pid")
+
+    with pytest.raises(CommandTimeoutError):
+        execute(
+            ["sh", "-c", f"sleep 10 & echo $! > {pid_path}; wait"],
+            os.getcwd(),
+            subcommand="sh",
+            timeout=0.5,
+        )
+
+    with open(pid_path, "r") as f:
+        pid = int(f.read())
+
+    # The child was reaped by init, or is a zombie until then
+
+    time.sleep(0.1)
+
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            assert f.read().split(") ")[1][0] == "Z"
+    except FileNotFoundError:
+        pass
+
+
+def test_execute_cancel_event() -> None:
+    cancel_event = threading.Event()
+
+    timer = threading.Timer(0.2, cancel_event.set)
+    timer.start()
+
+    started_at = time.monotonic()
+
+    try:
+        with pytest.raises(CommandCancelledError):
+            execute(
+                ["sleep", "10"],
+                os.getcwd(),
+                subcommand="sleep",
+                cancel_event=cancel_event,
+            )
+    finally:
+        timer.cancel()
+
+    assert time.monotonic() - started_at < 5
+
+
+def test_execute_timeout_metrics_hooks() -> None:
+    metrics: List[CommandMetrics] = []
+
+    with pytest.raises(CommandTimeoutError):
+        execute(
+            ["sleep", "10"],
+            os.getcwd(),
+            subcommand="sleep",
+            metrics_hooks=[metrics.append],
+            timeout=0.2,
+        )
+
+    assert len(metrics) == 1
+    assert metrics[0].return_code != 0
+
+
+def test_execute_async_timeout() -> None:
+    with pytest.raises(CommandTimeoutError) as e:
+        asyncio.run(
+            execute_async(
+                ["sh", "-c", "echo partial; sleep 10"],
+                os.getcwd(),
+                subcommand="sh",
+                timeout=0.5,
+            )
+        )
+
+    assert e.value.stdout == "partial\n"
@@ -0,0 +1,196 @@
+import json
+from typing import Dict, List
+
+import pytest
+
+from cyberfusion.NextCloudSupport.app import AppRecord
+from cyberfusion.NextCloudSupport.exceptions import AppVersionUnavailableError
+from cyberfusion.NextCloudSupport.reconcile import (
+    DesiredApp,
+    DesiredState,
+    Plan,
+    apply_plan,
+    get_plan,
+)
+
+
+class StubApp:
+    def __init__(self, is_enabled: bool) -> None:
+        self.is_enabled = is_enabled
+
+
+class StubInstance:
+    """Instance with state of `config:list`, app index and app updates."""
+
+    def __init__(self) -> None:
+        self.commands: List[List[str]] = []
+        self.config = {
+            "system": {"loglevel": 2, "trusted_domains": ["localhost"]},
+            "apps": {
+                "files": {"enabled": "yes", "installed_version": "2.0.0"},
+                "mail": {"enabled": "no", "installed_version": "3.0.0"},
+                "polls": {"enabled": "yes", "installed_version": "7.0.0"},
+            },
+        }
+        self.app_index = {
+            "files": AppRecord(name="files", version="2.0.0", is_enabled=True),
+            "shipped": AppRecord(name="shipped", version="1.0.0", is_enabled=False),
+        }
+        self.available_app_updates: Dict[str, str] = {"polls": "7.1.0"}
+
+    def run_command(self, command: List[str]) -> str:
+        self.commands.append(command)
+
+        return json.dumps(self.config)
+
+    def get_app(self, name: str) -> StubApp:
+        return StubApp(self.app_index[name].is_enabled)
+
+    def refresh_raw_app_list(self) -> None:
+        pass
+
+
+class StubAppStoreInstance(StubInstance):
+    """Instance on which the app store installs apps at version."""
+
+    def __init__(self, version: str) -> None:
+        super().__init__()
+
+        self.version = version
+
+    def run_command(self, command: List[str]) -> str:
+        self.commands.append(command)
+
+        if command[0] == "app:install":
+            self.app_index[command[-1]] = AppRecord(
+                name=command[-1], version=self.version, is_enabled=False
+            )
+        elif command[0] == "app:remove":
+            del self.app_index[command[-1]]
+
+        return ""
+
+    def enable_apps(self, names: List[str]) -> None:
+        self.commands.append(["app:enable"] + names)
+
+    def disable_apps(self, names: List[str]) -> None:
+        pass
+
+
+def test_get_plan_empty() -> None:
+    instance = StubInstance()
+
+    plan = get_plan(
+        instance,
+        DesiredState(
+            apps=[
+                DesiredApp(name="files", version="2.0.0"),
+                DesiredApp(name="mail", enabled=False),
+                DesiredApp(name="shipped", enabled=False),
+            ],
+            system_config={"loglevel": 2, ("trusted_domains", 0): "localhost"},
+        ),
+    )
+
+    assert plan.is_empty
+    assert len(instance.commands) == 1
+
+
+def test_get_plan_changes() -> None:
+    plan = get_plan(
+        StubInstance(),
+        DesiredState(
+            apps=[
+                DesiredApp(name="files", enabled=False),
+                DesiredApp(name="mail"),
+                DesiredApp(name="polls", version="7.1.0"),
+                DesiredApp(name="shipped"),
+                DesiredApp(name="bookmarks"),
+                DesiredApp(name="cospend", url="https://example.com/cospend.tar.gz"),
+            ],
+            system_config={"loglevel": 1, ("trusted_domains", 1): "example.com"},
+        ),
+    )
+
+    assert [app.name for app in plan.install_apps] == ["bookmarks", "cospend"]
+    assert plan.update_apps == ["polls"]
+    assert plan.enable_apps == ["mail", "shipped", "bookmarks", "cospend"]
+    assert plan.disable_apps == ["files"]
+    assert plan.system_config == {
+        "loglevel": 1,
+        "trusted_domains": ["localhost", "example.com"],
+    }
+
+
+def test_get_plan_replace_from_url() -> None:
+    plan = get_plan(
+        StubInstance(),
+        DesiredState(
+            apps=[
+                DesiredApp(
+                    name="polls",
+                    version="6.0.0",
+                    url="https://example.com/polls.tar.gz",
+                )
+            ]
+        ),
+    )
+
+    assert [app.name for app in plan.install_apps] == ["polls"]
+    assert plan.update_apps == []
+    assert plan.enable_apps == ["polls"]
+
+
+def test_get_plan_version_unavailable() -> None:
+    with pytest.raises(AppVersionUnavailableError) as e:
+        get_plan(
+            StubInstance(),
+            DesiredState(apps=[DesiredApp(name="polls", version="8.0.0")]),
+        )
+
+    assert e.value.available_version == "7.1.0"
+
+    with pytest.raises(AppVersionUnavailableError) as e:
+        get_plan(
+            StubInstance(),
+            DesiredState(apps=[DesiredApp(name="files", version="3.0.0")]),
+        )
+
+    assert e.value.available_version is None
+
+
+def test_apply_plan_install_version() -> None:
+    instance = StubAppStoreInstance("1.0.0")
+
+    apply_plan(
+        instance,
+        Plan(
+            install_apps=[DesiredApp(name="bookmarks", version="1.0.0")],
+            enable_apps=["bookmarks"],
+        ),
+    )
+
+    assert instance.commands == [
+        ["app:install", "--keep-disabled", "bookmarks"],
+        ["app:enable", "bookmarks"],
+    ]
+
+
+def test_apply_plan_install_version_unavailable() -> None:
+    instance = StubAppStoreInstance("2.0.0")
+
+    with pytest.raises(AppVersionUnavailableError) as e:
+        apply_plan(
+            instance,
+            Plan(
+                install_apps=[DesiredApp(name="bookmarks", version="1.0.0")],
+                enable_apps=["bookmarks"],
+            ),
+        )
+
+    assert e.value.available_version == "2.0.0"
+    assert instance.commands == [
+        ["app:install", "--keep-disabled", "bookmarks"],
+        ["app:remove", "bookmarks"],
+    ]
+    assert "bookmarks" not in instance.app_index
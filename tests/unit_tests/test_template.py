@@ -0,0 +1,111 @@
+import os
+from typing import Dict
+
+import pytest
+
+from cyberfusion.NextCloudSupport._tree import copy
+from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
+from cyberfusion.NextCloudSupport.instance import SystemConfigValue
+from cyberfusion.NextCloudSupport.template import Template, _replace_path
+
+
+def test_replace_path() -> None:
+    assert _replace_path(
+        {
+            "apps_paths": [{"path": "/template/apps", "writable": False}],
+            "datadirectory": "/template",
+            "other": "/template2",
+        },
+        "/template",
+        "/clone",
+    ) == {
+        "apps_paths": [{"path": "/clone/apps", "writable": False}],
+        "datadirectory": "/clone",
+        "other": "/template2",
+    }
+
+
+def test_copy(workspace_directory: str) -> None:
+    source = os.path.join(workspace_directory, "source")
+
+    os.makedirs(os.path.join(source, "directory"))
+
+    with open(os.path.join(source, "directory", "file"), "w") as f:
+        f.write("a")
+
+    for hardlink in [False, True]:
+        destination = os.path.join(workspace_directory, str(hardlink))
+
+        os.mkdir(destination)
+
+        copy([os.path.join(source, "directory")], destination, hardlink=hardlink)
+
+        assert (
+            os.stat(os.path.join(destination, "directory", "file")).st_ino
+            == os.stat(os.path.join(source, "directory", "file")).st_ino
+        ) == hardlink
+
+
+def test_clone_failed_removes_files(workspace_directory: str) -> None:
+    template_path = os.path.join(workspace_directory, "template")
+    clone_path = os.path.join(workspace_directory, "clone")
+    clone_data_directory = os.path.join(workspace_directory, "clone-data")
+
+    os.makedirs(os.path.join(template_path, "config"))
+    os.makedirs(os.path.join(template_path, "data", "appdata_ocabc"))
+    os.mkdir(clone_path)
+
+    for name in [
+        "index.php",
+        os.path.join("config", "config.php"),
+        os.path.join("data", "owncloud.db"),
+    ]:
+        open(os.path.join(template_path, name), "w").close()
+
+    class StubTemplate(Template):
+        @property
+        def config(self) -> Dict[str, SystemConfigValue]:
+            return {
+                "dbtype": "sqlite3",
+                "datadirectory": os.path.join(template_path, "data"),
+                "instanceid": "ocabc",
+            }
+
+    # PHP fails, so writing the config fails
+
+    with pytest.raises(CommandFailedError):
+        StubTemplate(template_path, php_bin="false").clone(
+            clone_path,
+            admin_user="admin",
+            admin_password="password",
+            data_directory=clone_data_directory,
+        )
+
+    assert not os.listdir(clone_path)
+    assert not os.path.exists(clone_data_directory)
+
+
+def test_load_dump_on_stdin(workspace_directory: str, monkeypatch) -> None:
+    bin_path = os.path.join(workspace_directory, "bin")
+    dump_path = os.path.join(workspace_directory, "dump 'a'.sql")
+    output_path = os.path.join(workspace_directory, "output")
+
+    os.mkdir(bin_path)
+
+    with open(os.path.join(bin_path, "mysql"), "w") as f:
+        f.write(f"#!/bin/sh\ncat > {output_path}\n")
+
+    os.chmod(os.path.join(bin_path, "mysql"), 0o755)
+
+    with open(dump_path, "w") as f:
+        f.write("SELECT 1;\n")
+
+    monkeypatch.setenv("PATH", bin_path + os.pathsep + os.environ["PATH"])
+
+    Template(workspace_directory, dump_path=dump_path)._load(
+        {"dbtype": "mysql", "dbname": "a", "dbuser": "u", "dbpassword": "p"},
+        workspace_directory,
+    )
+
+    with open(output_path) as f:
+        assert f.read() == "SELECT 1;\n"
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from cyberfusion.NextCloudSupport._worker import Worker
+from cyberfusion.NextCloudSupport.exceptions import CommandFailedError
+from cyberfusion.NextCloudSupport.instance import Instance
+
+
+def test_worker_run_command_raises_exception(
+    instance_installed_static_version: Instance,
+) -> None:
+    worker = Worker(instance_installed_static_version.path)
+
+    with pytest.raises(CommandFailedError) as e:
+        worker.run_command(["doesntexist"])
+
+    assert e.value.command is not None
+    assert e.value.return_code is not None
+    assert e.value.stdout is not None
+    assert e.value.stderr is not None
+    assert e.value.streams is not None
+
+    assert worker.is_running  # Failing command does not stop worker
+
+    worker.stop()
+
+
+def test_worker_stop_not_started() -> None:
+    Worker("/tmp").stop()
+
+
+def test_worker_run_command_unexpected_output(tmp_path) -> None:
+    php_bin = os.path.join(tmp_path, "php")
+
+    with open(php_bin, "w") as f:
+        f.write("#!/bin/sh\nread line\necho 'PHP Notice: Undefined index'\nsleep 60\n")
+
+    os.chmod(php_bin, 0o755)
+
+    worker = Worker(str(tmp_path), php_bin=php_bin)
+
+    with pytest.raises(CommandFailedError) as e:
+        worker.run_command(["status"])
+
+    assert e.value.stdout == "PHP Notice: Undefined index\n"
+    assert not worker.is_running